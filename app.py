@@ -1,18 +1,29 @@
 import streamlit as st
-import altair as alt
 import polars as pl
 
 from streamlit import session_state as ss
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
-from aux_functions.db_connect import DBConnect
-from aux_functions.queries import Queries
+from aux_functions import settings
+from aux_functions.analytics import OVERLAYS, Analytics
+from aux_functions.charts import RESOLUTIONS, Charts
 from aux_functions.css import hide_streamlit_style
+from aux_functions.export import CONTENTS, FORMATS, MIME_TYPES, ExportManager
+from aux_functions.filter_state import FilterState
+from aux_functions.metrics import Metrics
+from aux_functions.registry import DatasetRegistry
+from aux_functions.startup import Startup
+from aux_functions.warmup import Warmup
 from aux_functions.filters import apply_filter_style
 
 # Hide streamlit style and apply custom filter styles
 hide_streamlit_style()
 apply_filter_style()
 
+# Collect stage timings of this rerun
+metrics = Metrics.get_instance()
+metrics.begin_run()
+
 # initialize filters
 selected_make = None
 selected_model = None
@@ -21,23 +32,48 @@ selected_transmission = None
 selected_km_range = None
 selected_year = None
 selected_fuel_type = None
+# selected values, in the order of the filter cascade
+selection = []
 
-with st.spinner("Cargando datos..."):
-    # Initialize the bigquery client
+# The client, the warm-up and a fresh make list are loaded in the background
+# (once per process), the make list of the previous start is shown meanwhile
+startup = Startup.get_instance()
+
+def startup_result(get):
     try:
-        db_connect = DBConnect()
-        bigquery_client = db_connect.get_client()
+        return get()
     except Exception as e:
+        # start over on the next rerun
+        Startup.get_instance.clear()
         st.error(f"Error connecting to BigQuery: {e}")
         st.stop()
 
-    # Get makes first (lightweight query)
-    makes_df = Queries.get_all_makes(bigquery_client)
+with st.spinner("Cargando datos..."):
+    makes_df = startup_result(startup.makes)
+
+# A selection shared in the URL is restored once, when the session starts
+if "url_filters" not in ss:
+    url_make, ss.url_filters = FilterState.read(st.query_params)
+    if url_make in makes_df.get_column("make").to_list():
+        ss.make_selected = url_make
+    else:
+        ss.url_filters = []
+
+# Make datasets are shared by all sessions, each session only keeps its filters
+registry = DatasetRegistry.get_instance()
+session_id = get_script_run_ctx().session_id
 
 def on_makes_change():
-    # delete all filter session states except make_selected
-    for key in list(ss.keys()):
-        if key not in ['make_selected', 'make_id']:
+    # delete the filters of the previous make, keep make and display settings
+    for key in [
+        'model_selected',
+        'hp_range_selected',
+        'transmission_selected',
+        'km_range_selected',
+        'year_selected',
+        'fuel_type_selected'
+    ]:
+        if key in ss:
             del ss[key]
 
 def clear_filters():
@@ -58,6 +94,37 @@ def clear_filters():
     
     st.rerun()
 
+def export_panel(dataset, selection, content, file_format, file_name, polling):
+    """Prepare an export of the selection in the background, then download it"""
+    exports = ExportManager.get_instance()
+    key = ExportManager.key(dataset.make_id, dataset.fingerprint, selection, content, file_format)
+    job = exports.job(key)
+    if job is None or (job.done() and job.exception() is not None):
+        if job is not None:
+            st.error(f"Error al generar el archivo: {job.exception()}")
+        if st.button("Preparar descarga", key="export_button"):
+            exports.submit(dataset, selection, content, file_format)
+            # rerun the whole script so the panel polls until the file is written
+            st.rerun()
+    elif not job.done():
+        st.info("Generando el archivo...")
+    elif polling:
+        st.rerun()
+    elif ss.get("export_serving") != key:
+        # the file is only read into memory when the user asks for it
+        st.button("Descargar", key="export_fetch", on_click=lambda: ss.update(export_serving=key))
+    else:
+        with open(job.result(), "rb") as f:
+            data = f.read()
+        # clicking reruns the panel without the button, which releases the file
+        st.download_button(
+            label="Guardar archivo",
+            data=data,
+            file_name=f"{file_name}.{file_format}",
+            mime=MIME_TYPES[file_format],
+            on_click=lambda: ss.pop("export_serving", None),
+        )
+
 with st.container():
     st.markdown('<div class="filter-title">Selección de Vehículo</div>', unsafe_allow_html=True)
     # Make filter
@@ -71,21 +138,55 @@ with st.container():
     # Store the make_id when a make is selected
     if selected_make:
         selected_make_id = makes_df.filter(pl.col("make") == selected_make).select("make_id").item()
+        with st.spinner("Cargando datos..."):
+            bigquery_client = startup_result(startup.client)
+        if ss.get("make_id") != selected_make_id:
+            Warmup.start(bigquery_client).record_access(selected_make_id)
         ss.make_id = selected_make_id
         
         # Load the dataset filtered by make_id (much smaller dataset)
         with st.spinner("Cargando datos de la marca seleccionada..."):
-            df = Queries.get_dataset_by_make(bigquery_client, selected_make_id)
-            df_filtered = df
+            with metrics.stage("load_make_dataset"):
+                try:
+                    dataset = registry.acquire(session_id, bigquery_client, selected_make_id)
+                except Exception as e:
+                    # only makes with no cached copy at all get here
+                    st.error(f"No se pudieron cargar los datos de la marca, inténtalo de nuevo más tarde: {e}")
+                    st.stop()
+            facets = dataset.facets
+
+            # Filters of the URL, the whole selection is resolved in one pass
+            if ss.url_filters:
+                with metrics.stage("restore_filters"):
+                    for key, value in FilterState.restore(facets, ss.url_filters).items():
+                        ss[key] = value
+                ss.url_filters = []
+
+            # Resolve the option lists and the daily series of the current
+            # selection in one optimized pass, the widgets below hit the cache
+            pending = []
+            for key in [
+                'model_selected',
+                'km_range_selected',
+                'year_selected',
+                'hp_range_selected',
+                'transmission_selected',
+                'fuel_type_selected'
+            ]:
+                if not ss.get(key):
+                    break
+                pending.append(ss[key])
+            with metrics.stage("facets"):
+                facets.prefetch(pending)
             
         # Model filter
         selected_model = st.selectbox(
             label="Modelo:",
-            options=[""] + df.select("model").unique().sort("model").to_series().to_list(),
+            options=[""] + facets.options(selection),
             key="model_selected",
         )
         if selected_model:
-            df_filtered = df_filtered.filter(pl.col("model") == selected_model)
+            selection.append(selected_model)
 
             # rest of the filters
             col1, col2, col3 = st.columns(3)
@@ -96,18 +197,18 @@ with st.container():
 
                 selected_km_range = st.selectbox(
                     label="Kilometraje:",
-                    options=[""] + df_filtered.select(["km_range", "km_class_id"]).unique().sort("km_class_id").select("km_range").to_series().to_list(),
+                    options=[""] + facets.options(selection),
                     key="km_range_selected"
                 )
                 if selected_km_range:
-                    df_filtered = df_filtered.filter(pl.col("km_range") == selected_km_range)
+                    selection.append(selected_km_range)
                     selected_year = st.selectbox(
                         label="Año",
-                        options=[""] + df_filtered.select("year").unique().sort("year", descending=True).to_series().to_list(),
+                        options=[""] + facets.options(selection),
                         key="year_selected"
                     )
                     if selected_year:
-                        df_filtered = df_filtered.filter(pl.col("year") == selected_year)
+                        selection.append(selected_year)
 
                 st.markdown('</div>', unsafe_allow_html=True)
 
@@ -118,19 +219,19 @@ with st.container():
                     st.markdown('<div class="filter-title">Características Técnicas</div>', unsafe_allow_html=True)
                     selected_hp_range = st.selectbox(
                         label="Potencia (CV):",
-                        options=[""] + df_filtered.select(["hp_range", "hp_class_id"]).unique().sort("hp_class_id").select("hp_range").to_series().to_list(),
+                        options=[""] + facets.options(selection),
                         key="hp_range_selected",
                     )
                     if selected_hp_range:
-                        df_filtered = df_filtered.filter(pl.col("hp_range") == selected_hp_range)
+                        selection.append(selected_hp_range)
 
                         selected_transmission = st.selectbox(
                             label="Transmisión:",
-                            options=[""] + df_filtered.select("transmission_type").unique().select("transmission_type").to_series().to_list(),
+                            options=[""] + facets.options(selection),
                             key="transmission_selected"
                         )
                         if selected_transmission:
-                            df_filtered = df_filtered.filter(pl.col("transmission_type") == selected_transmission)
+                            selection.append(selected_transmission)
 
                 st.markdown('</div>', unsafe_allow_html=True)
             
@@ -141,11 +242,11 @@ with st.container():
                     st.markdown('<div class="filter-title">Características Adicionales</div>', unsafe_allow_html=True)
                     selected_fuel_type = st.selectbox(
                         label="Combustible:",
-                        options=[""] + df_filtered.select("fuel_type").unique().select("fuel_type").to_series().to_list(),
+                        options=[""] + facets.options(selection),
                         key="fuel_type_selected"
                     )
                     if selected_fuel_type:
-                        df_filtered = df_filtered.filter(pl.col("fuel_type") == selected_fuel_type)
+                        selection.append(selected_fuel_type)
 
                 st.markdown('</div>', unsafe_allow_html=True)
 
@@ -158,43 +259,101 @@ with st.container():
             clear_filters()
 
         if selected_model:
-            # Group by day and calculate average price
-            df_avg = (df_filtered
-                      .group_by("day")
-                      .agg(pl.col("price").mean().alias("price"))
-                      .with_columns(pl.col("price").cast(pl.Int32))
-                      .sort("day"))
-            
-            # Convert to pandas for Altair (since Altair works better with pandas)
-            df_avg_pandas = df_avg.to_pandas()
+            # Average price per day, served from the facet index
+            with metrics.stage("daily_series"):
+                df_avg = facets.daily_average(selection)
             
-            min_price = df_avg.select(pl.col("price").min()).item()
-            max_price = df_avg.select(pl.col("price").max()).item()
-            price_range = max_price - min_price
-            margin = price_range * 0.5
-            chart = alt.Chart(df_avg_pandas).mark_line(interpolate='basis').encode(
-                x=alt.X(
-                    'day:T', 
-                    axis=alt.Axis(
-                        title=None,
-                        format='%b %d'
-                    )
-                ),
-                y=alt.Y('price:Q', scale=alt.Scale(domain=[min_price - margin, max_price + margin]), axis=alt.Axis(title='€'))
-            ).properties(
-                width=700,
-                height=400,
-                title={
-                    "text": f"Precio promedio",
-                    "anchor": "middle",
-                    "align": "center"
-                }
+            # Chart resolution, daily points are rolled up to weeks or months
+            resolution = st.radio(
+                label="Resolución:",
+                options=list(RESOLUTIONS),
+                horizontal=True,
+                key="resolution_selected",
+            )
+
+            # Rolling statistics drawn over the price line
+            overlays = st.multiselect(
+                label="Indicadores:",
+                options=list(OVERLAYS),
+                key="overlays_selected",
             )
 
+            with metrics.stage("analytics"):
+                df_stats = Analytics.price_stats(selected_make_id, dataset.fingerprint, tuple(selection), df_avg)
+                summary = Analytics.summary(df_stats)
+
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Mediana (28 días)", f"{summary['median']:,.0f} €" if summary["median"] is not None else "-")
+            col2.metric("Volatilidad diaria", f"{summary['volatility']:.1f} %" if summary["volatility"] is not None else "-")
+            col3.metric("Tendencia (90 días)", f"{summary['trend']:+.1f} % / mes" if summary["trend"] is not None else "-")
+
+            with metrics.stage("chart_spec"):
+                spec = Charts.price_chart_spec(
+                    selected_make_id, dataset.fingerprint, tuple(selection), resolution, df_avg,
+                    tuple(OVERLAYS[overlay] for overlay in overlays), df_stats,
+                )
+
             # Display chart in a container for better styling
-            with st.container():
+            with st.container(), metrics.stage("chart_render"):
                 st.markdown('<div class="filter-container">', unsafe_allow_html=True)
-                st.altair_chart(chart, use_container_width=True)
+                st.vega_lite_chart(spec, use_container_width=True)
                 st.markdown('</div>', unsafe_allow_html=True)
+
+            # Price of the selection by year and by mileage over the last days
+            with st.expander("Depreciación"):
+                with metrics.stage("depreciation"):
+                    df_year, df_km = Analytics.depreciation(
+                        selected_make_id, dataset.fingerprint, tuple(selection), dataset.lf
+                    )
+                col1, col2 = st.columns(2)
+                with col1:
+                    st.vega_lite_chart(
+                        Charts.depreciation_chart_spec(selected_make_id, dataset.fingerprint, tuple(selection), "year", df_year),
+                        use_container_width=True,
+                    )
+                with col2:
+                    st.vega_lite_chart(
+                        Charts.depreciation_chart_spec(selected_make_id, dataset.fingerprint, tuple(selection), "km_range", df_km),
+                        use_container_width=True,
+                    )
+
+            # Rows or daily series of the selection as a file, written off the rerun thread
+            with st.expander("Exportar datos"):
+                col1, col2 = st.columns(2)
+                with col1:
+                    export_content = st.radio(
+                        label="Contenido:",
+                        options=list(CONTENTS),
+                        horizontal=True,
+                        key="export_content",
+                    )
+                with col2:
+                    export_format = st.radio(
+                        label="Formato:",
+                        options=list(FORMATS),
+                        horizontal=True,
+                        key="export_format",
+                    )
+                export_args = (dataset, tuple(selection), CONTENTS[export_content], FORMATS[export_format])
+                export_job = ExportManager.get_instance().job(ExportManager.key(
+                    selected_make_id, dataset.fingerprint, *export_args[1:]
+                ))
+                # only poll while the file is being written
+                polling = export_job is not None and not export_job.done()
+                file_name = "_".join(str(v) for v in [selected_make, *selection, CONTENTS[export_content]])
+                st.fragment(export_panel, run_every=1 if polling else None)(
+                    *export_args, file_name.replace(" ", "_").lower(), polling
+                )
     else:
+        registry.release(session_id)
         st.info("Por favor, selecciona una marca para continuar.")
+
+# Keep the URL in sync with the selection so it can be reloaded or shared
+FilterState.write(st.query_params, selected_make, selection)
+
+# Stage breakdown of this rerun, only with ?debug=<AUTOTIMING_DEBUG_TOKEN>
+stages = metrics.end_run()
+if settings.DEBUG_TOKEN and st.query_params.get("debug") == settings.DEBUG_TOKEN:
+    with st.expander("Tiempos de ejecución", expanded=True):
+        st.dataframe(stages, use_container_width=True)
+        st.code(metrics.render_prometheus(), language="text")
@@ -0,0 +1,137 @@
+import polars as pl
+import streamlit as st
+
+from aux_functions.facets import LEVELS
+
+# Trailing window of the rolling median, percentiles and volatility
+ROLLING_WINDOW = "28d"
+
+# Trailing window compared against ROLLING_WINDOW to detect trend changes
+SHORT_WINDOW = "7d"
+
+# Rolling standard deviations the short mean has to move away from the long
+# mean for a day to be flagged as an upward or downward trend
+TREND_THRESHOLD = 1.5
+
+# Days of the trend slope shown in the summary
+TREND_DAYS = 90
+
+# Days of recent data the depreciation curves are computed from
+DEPRECIATION_DAYS = 30
+
+# Overlays of the price chart: label shown in the app -> overlay id
+OVERLAYS = {
+    "Mediana móvil": "median",
+    "Banda P10-P90": "band",
+    "Cambios de tendencia": "changes",
+}
+
+
+class Analytics:
+    """
+    Price analytics of a filter combination. Every statistic is a Polars
+    expression evaluated over the whole series or frame at once (rolling
+    windows by day, group_by for the depreciation curves), and results are
+    cached per make dataset version and selection.
+    """
+
+    @staticmethod
+    @st.cache_data(ttl=3600, max_entries=1000, show_spinner=False)
+    def price_stats(make_id: int, fingerprint: tuple, selection: tuple, _df_avg: pl.DataFrame) -> pl.DataFrame:
+        """
+        Get the rolling statistics and trend flags of a daily series
+        Args:
+            make_id: int
+            fingerprint: tuple, version of the make dataset
+            selection: tuple, selected filter values
+            _df_avg: pl.DataFrame daily series of the selection
+        Returns:
+            df: pl.DataFrame with columns day, price, median, p10, p90,
+                volatility, trend ("up", "down" or null) and change (first day
+                of a new trend)
+        """
+        price = pl.col("price").cast(pl.Float64)
+        short_mean = price.rolling_mean_by("day", SHORT_WINDOW)
+        long_mean = price.rolling_mean_by("day", ROLLING_WINDOW)
+        long_std = price.rolling_std_by("day", ROLLING_WINDOW)
+        return (_df_avg
+                .lazy()
+                .select(
+                    "day",
+                    "price",
+                    price.rolling_median_by("day", ROLLING_WINDOW).alias("median"),
+                    price.rolling_quantile_by("day", ROLLING_WINDOW, quantile=0.1).alias("p10"),
+                    price.rolling_quantile_by("day", ROLLING_WINDOW, quantile=0.9).alias("p90"),
+                    # standard deviation of the daily relative change
+                    price.pct_change().fill_null(0.0).rolling_std_by("day", ROLLING_WINDOW).alias("volatility"),
+                    pl.when(short_mean - long_mean > TREND_THRESHOLD * long_std).then(pl.lit("up"))
+                    .when(long_mean - short_mean > TREND_THRESHOLD * long_std).then(pl.lit("down"))
+                    .alias("trend"),
+                )
+                .with_columns(
+                    (pl.col("trend").is_not_null() & pl.col("trend").ne_missing(pl.col("trend").shift(1))).alias("change")
+                )
+                .collect())
+
+    @staticmethod
+    def summary(df_stats: pl.DataFrame) -> dict:
+        """
+        Summarize the last values of the rolling statistics
+        Args:
+            df_stats: pl.DataFrame returned by price_stats
+        Returns:
+            dict with the rolling median, the volatility (%) and the trend of
+            the last TREND_DAYS days (% per 30 days, least squares slope)
+        """
+        days = (pl.col("day") - pl.col("day").min()).dt.total_days().cast(pl.Float64)
+        price = pl.col("price").cast(pl.Float64)
+        recent = df_stats.filter(pl.col("day") > pl.col("day").max() - pl.duration(days=TREND_DAYS))
+        slope, mean = recent.select(
+            (pl.cov(days, price) / days.var()).alias("slope"),
+            price.mean().alias("mean"),
+        ).row(0)
+        last = df_stats.row(-1, named=True)
+        return {
+            "median": last["median"],
+            "volatility": last["volatility"] * 100 if last["volatility"] is not None else None,
+            "trend": slope * 30 / mean * 100 if slope is not None and mean else None,
+        }
+
+    @staticmethod
+    def _depreciation_plan(lf: pl.LazyFrame, selection: tuple, level: tuple) -> pl.LazyFrame:
+        label, order, descending = level
+        # the level the curve is built over is left unfiltered, its first
+        # option in the cascade order is the reference of the curve
+        predicates = [pl.col(l) == value for (l, _, _), value in zip(LEVELS, selection) if l != label]
+        columns = [label] if label == order else [label, order]
+        return (lf
+                .filter(*predicates)
+                .filter(pl.col("day") > pl.col("day").max() - pl.duration(days=DEPRECIATION_DAYS))
+                .group_by(columns)
+                .agg(pl.col("price_sum").sum(), pl.col("ad_count").cast(pl.Int64).sum())
+                .sort(order, descending=descending)
+                .with_columns((pl.col("price_sum") / pl.col("ad_count")).alias("price"))
+                .with_columns((pl.col("price") / pl.col("price").first() * 100).round(1).alias("relative"))
+                .select(label, pl.col("price").cast(pl.Int32), "ad_count", "relative"))
+
+    @staticmethod
+    @st.cache_data(ttl=3600, max_entries=1000, show_spinner=False)
+    def depreciation(make_id: int, fingerprint: tuple, selection: tuple, _lf: pl.LazyFrame) -> tuple:
+        """
+        Get the ad-weighted price of the last DEPRECIATION_DAYS days by year
+        and by km class for a selection, relative to the newest year and the
+        lowest km class, both resolved in one pass over the make dataset
+        Args:
+            make_id: int
+            fingerprint: tuple, version of the make dataset
+            selection: tuple, selected filter values
+            _lf: pl.LazyFrame make dataset
+        Returns:
+            (df_year, df_km): pl.DataFrame with columns year / km_range, price,
+                ad_count, relative
+        """
+        levels = {level[0]: level for level in LEVELS}
+        return tuple(pl.collect_all([
+            Analytics._depreciation_plan(_lf, selection, levels["year"]),
+            Analytics._depreciation_plan(_lf, selection, levels["km_range"]),
+        ]))
@@ -0,0 +1,25 @@
+import logging
+
+# Prefix of every worker thread started by the app. Those threads run outside
+# any Streamlit session, so cached functions called from them have no
+# ScriptRunContext by design.
+THREAD_PREFIX = "autotiming"
+
+
+class _MissingContextFilter(logging.Filter):
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return not (
+            record.threadName.startswith(THREAD_PREFIX)
+            and "missing ScriptRunContext" in record.getMessage()
+        )
+
+
+def quiet_background_threads() -> None:
+    """
+    Drop Streamlit's "missing ScriptRunContext" warning for the app's own
+    worker threads, it is logged on every cached function call they make
+    """
+    logger = logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context")
+    if not any(isinstance(f, _MissingContextFilter) for f in logger.filters):
+        logger.addFilter(_MissingContextFilter())
@@ -0,0 +1,212 @@
+import polars as pl
+import streamlit as st
+
+from aux_functions import settings
+from aux_functions.lazy import LazyModule
+
+alt = LazyModule("altair")
+np = LazyModule("numpy")
+
+# Label shown in the app -> polars truncation interval
+RESOLUTIONS = {
+    "Diaria": None,
+    "Semanal": "1w",
+    "Mensual": "1mo",
+}
+
+
+class Charts:
+
+    @staticmethod
+    def resample(df_avg: pl.DataFrame, resolution: str) -> pl.DataFrame:
+        """
+        Roll a daily series up to weekly or monthly ad-weighted averages
+        Args:
+            df_avg: pl.DataFrame with columns day, price, price_sum, ad_count
+            resolution: str, key of RESOLUTIONS
+        Returns:
+            df: pl.DataFrame
+        """
+        every = RESOLUTIONS[resolution]
+        if every is None:
+            return df_avg
+        return (df_avg
+                .group_by(pl.col("day").dt.truncate(every))
+                .agg(pl.col("price_sum").sum(), pl.col("ad_count").sum())
+                .with_columns((pl.col("price_sum") / pl.col("ad_count")).cast(pl.Int32).alias("price"))
+                .sort("day"))
+
+    @staticmethod
+    def lttb(df: pl.DataFrame, x: str, y: str, n_out: int) -> pl.DataFrame:
+        """
+        Downsample a line to n_out points with Largest-Triangle-Three-Buckets,
+        which keeps the visual shape (peaks and drops) of the series
+        Args:
+            df: pl.DataFrame sorted by x
+            x: str, date or numeric column
+            y: str, numeric column
+            n_out: int
+        Returns:
+            df: pl.DataFrame
+        """
+        n = df.height
+        if n_out >= n or n_out < 3:
+            return df
+        xs = df.get_column(x).to_physical().to_numpy().astype(np.float64)
+        ys = df.get_column(y).to_numpy().astype(np.float64)
+
+        # first and last points are kept, the rest is split in n_out - 2 buckets
+        edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+        selected = np.empty(n_out, dtype=np.int64)
+        selected[0], selected[-1] = 0, n - 1
+        a = 0
+        for i in range(n_out - 2):
+            start, end = edges[i], edges[i + 1]
+            next_end = edges[i + 2] if i + 2 < len(edges) else n
+            avg_x = xs[end:next_end].mean()
+            avg_y = ys[end:next_end].mean()
+            area = np.abs((xs[a] - avg_x) * (ys[start:end] - ys[a]) - (xs[a] - xs[start:end]) * (avg_y - ys[a]))
+            a = start + int(np.argmax(area))
+            selected[i + 1] = a
+        return df[selected]
+
+    @staticmethod
+    @st.cache_data(ttl=3600, max_entries=1000, show_spinner=False)
+    def price_chart_spec(
+        make_id: int,
+        fingerprint: tuple,
+        selection: tuple,
+        resolution: str,
+        _df_avg: pl.DataFrame,
+        overlays: tuple = (),
+        _df_stats: pl.DataFrame = None,
+    ) -> dict:
+        """
+        Build the Vega-Lite spec of the average price chart, downsampled to
+        CHART_MAX_POINTS. Cached per filter combination so unchanged charts are
+        not rebuilt and re-validated on every rerun.
+        Args:
+            make_id: int
+            fingerprint: tuple, version of the make dataset
+            selection: tuple, selected filter values
+            resolution: str, key of RESOLUTIONS
+            _df_avg: pl.DataFrame daily series of the selection
+            overlays: tuple, ids of analytics.OVERLAYS layered over the line
+            _df_stats: pl.DataFrame returned by Analytics.price_stats, needed
+                when overlays are given
+        Returns:
+            spec: dict
+        """
+        df = Charts.lttb(Charts.resample(_df_avg, resolution), "day", "price", settings.CHART_MAX_POINTS)
+        if overlays:
+            # rolling statistics as of each plotted point
+            df = df.join_asof(_df_stats.select("day", "median", "p10", "p90"), on="day")
+
+        low, high = ("p10", "p90") if "band" in overlays else ("price", "price")
+        min_price = df.select(pl.min_horizontal(pl.col("price").min(), pl.col(low).min())).item()
+        max_price = df.select(pl.max_horizontal(pl.col("price").max(), pl.col(high).max())).item()
+        price_range = max_price - min_price
+        margin = price_range * 0.5
+        x = alt.X(
+            'day:T',
+            axis=alt.Axis(
+                title=None,
+                format='%b %Y' if resolution == "Mensual" else '%b %d'
+            )
+        )
+        y_scale = alt.Scale(domain=[min_price - margin, max_price + margin])
+        base = alt.Chart(df.drop("price_sum", "ad_count", strict=False).to_pandas())
+
+        layers = []
+        if "band" in overlays:
+            layers.append(base.mark_area(opacity=0.2, interpolate='basis').encode(
+                x=x, y=alt.Y('p10:Q', scale=y_scale, title='€'), y2='p90:Q'
+            ))
+        layers.append(base.mark_line(interpolate='basis').encode(
+            x=x, y=alt.Y('price:Q', scale=y_scale, axis=alt.Axis(title='€'))
+        ))
+        if "median" in overlays:
+            layers.append(base.mark_line(strokeDash=[4, 4], color='gray').encode(
+                x=x, y=alt.Y('median:Q', scale=y_scale)
+            ))
+        if "changes" in overlays:
+            changes = _df_stats.filter(pl.col("change")).select("day", "price", "trend")
+            layers.append(alt.Chart(changes.to_pandas()).mark_point(filled=True, size=60).encode(
+                x=x,
+                y=alt.Y('price:Q', scale=y_scale),
+                color=alt.Color('trend:N', scale=alt.Scale(domain=["up", "down"], range=["#2ca02c", "#d62728"]), legend=None),
+            ))
+
+        chart = alt.layer(*layers).properties(
+            width=700,
+            height=400,
+            title={
+                "text": f"Precio promedio",
+                "anchor": "middle",
+                "align": "center"
+            }
+        )
+        return chart.to_dict()
+
+    @staticmethod
+    @st.cache_data(ttl=3600, max_entries=1000, show_spinner=False)
+    def depreciation_chart_spec(make_id: int, fingerprint: tuple, selection: tuple, by: str, _df: pl.DataFrame) -> dict:
+        """
+        Build the Vega-Lite spec of a depreciation curve
+        Args:
+            make_id: int
+            fingerprint: tuple, version of the make dataset
+            selection: tuple, selected filter values
+            by: str, "year" or "km_range"
+            _df: pl.DataFrame returned by Analytics.depreciation
+        Returns:
+            spec: dict
+        """
+        chart = alt.Chart(_df.to_pandas()).mark_bar().encode(
+            x=alt.X(f'{by}:O', sort=None, axis=alt.Axis(title=None)),
+            y=alt.Y('relative:Q', axis=alt.Axis(title='%')),
+            tooltip=[alt.Tooltip(f'{by}:O'), alt.Tooltip('price:Q', title='€'), alt.Tooltip('ad_count:Q', title='Anuncios')],
+        ).properties(
+            height=250,
+            title={
+                "text": "Por año" if by == "year" else "Por kilometraje",
+                "anchor": "middle",
+                "align": "center"
+            }
+        )
+        return chart.to_dict()
+
+    @staticmethod
+    @st.cache_data(ttl=3600, max_entries=1000, show_spinner=False)
+    def comparison_chart_spec(series: tuple, labels: tuple, _df_series: pl.DataFrame) -> dict:
+        """
+        Build the Vega-Lite spec of the comparison chart, one line per series,
+        each downsampled to CHART_MAX_POINTS
+        Args:
+            series: tuple of (make_id, model_id, selection), cache key
+            labels: tuple of the legend label of every series
+            _df_series: pl.DataFrame returned by Comparison.daily_series
+        Returns:
+            spec: dict
+        """
+        df = pl.concat([
+            Charts.lttb(part, "day", "price", settings.CHART_MAX_POINTS)
+            for part in _df_series.partition_by("series_id", maintain_order=True)
+        ]).with_columns(
+            pl.col("series_id").replace_strict(list(range(len(labels))), list(labels), return_dtype=pl.String).alias("series")
+        )
+
+        chart = alt.Chart(df.select("day", "price", "series").to_pandas()).mark_line(interpolate='basis').encode(
+            x=alt.X('day:T', axis=alt.Axis(title=None, format='%b %d')),
+            y=alt.Y('price:Q', scale=alt.Scale(zero=False), axis=alt.Axis(title='€')),
+            color=alt.Color('series:N', sort=list(labels), title=None, legend=alt.Legend(orient='bottom', columns=1)),
+        ).properties(
+            width=700,
+            height=400,
+            title={
+                "text": f"Comparación de precios",
+                "anchor": "middle",
+                "align": "center"
+            }
+        )
+        return chart.to_dict()
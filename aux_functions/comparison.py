@@ -0,0 +1,70 @@
+import polars as pl
+import streamlit as st
+
+from aux_functions import settings
+from aux_functions.facets import LEVELS
+
+# Filter columns a series can set besides its model, with the type of the value
+FILTER_COLUMNS = {
+    "km_range": pl.String,
+    "year": pl.Int16,
+    "hp_range": pl.String,
+    "transmission_type": pl.String,
+    "fuel_type": pl.String,
+}
+
+
+class Comparison:
+    """
+    Daily series of several (make, model, filters) combinations computed from
+    one batched models dataset (Queries.get_models_dataset). The series are
+    joined to the rows on (make_id, model_id), rows not matching the filters of
+    a series are dropped, and a single group_by on (series_id, day) builds every
+    series at once.
+    """
+
+    @staticmethod
+    def series_frame(series: tuple) -> pl.DataFrame:
+        """
+        Build the table of series definitions, one row per series
+        Args:
+            series: tuple of (make_id, model_id, selection), selection being the
+                selected values in LEVELS order (model first)
+        Returns:
+            df: pl.DataFrame with columns series_id, make_id, model_id and one
+                series_<column> per FILTER_COLUMNS entry, null when not filtered
+        """
+        labels = [label for label, _, _ in LEVELS[1:]]
+        rows = []
+        for series_id, (make_id, model_id, selection) in enumerate(series):
+            values = dict(zip(labels, selection[1:]))
+            rows.append([series_id, make_id, model_id] + [values.get(column) for column in FILTER_COLUMNS])
+        schema = {"series_id": pl.Int32, "make_id": pl.Int32, "model_id": pl.Int32}
+        schema.update({f"series_{column}": dtype for column, dtype in FILTER_COLUMNS.items()})
+        return pl.DataFrame(rows, schema=schema, orient="row")
+
+    @staticmethod
+    @st.cache_data(ttl=settings.DATASET_TTL, max_entries=1000, show_spinner=False)
+    def daily_series(models: tuple, series: tuple, _df: pl.DataFrame) -> pl.DataFrame:
+        """
+        Get the ad-weighted average price per day of every series
+        Args:
+            models: tuple of the (make_id, model_id) pairs of _df, cache key
+            series: tuple of (make_id, model_id, selection)
+            _df: pl.DataFrame returned by Queries.get_models_dataset
+        Returns:
+            df: pl.DataFrame with columns series_id, day, price, price_sum, ad_count
+        """
+        matches = [
+            pl.col(f"series_{column}").is_null() | (pl.col(column).cast(dtype) == pl.col(f"series_{column}"))
+            for column, dtype in FILTER_COLUMNS.items()
+        ]
+        return (_df.lazy()
+                .join(Comparison.series_frame(series).lazy(), on=["make_id", "model_id"])
+                .filter(*matches)
+                .group_by("series_id", "day")
+                .agg(pl.col("price_sum").sum(), pl.col("ad_count").cast(pl.Int64).sum())
+                .with_columns((pl.col("price_sum") / pl.col("ad_count")).cast(pl.Int32).alias("price"))
+                .select("series_id", "day", "price", "price_sum", "ad_count")
+                .sort("series_id", "day")
+                .collect())
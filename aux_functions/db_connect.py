@@ -1,14 +1,36 @@
+from __future__ import annotations
+
 import streamlit as st
-from google.cloud import bigquery
-from google.oauth2 import service_account
+
+from aux_functions import settings
+from aux_functions.lazy import LazyModule
+from aux_functions.local_backend import DuckDBClient
+
+bigquery = LazyModule("google.cloud.bigquery")
+service_account = LazyModule("google.oauth2.service_account")
 
 class DBConnect:
 
-    @staticmethod    
+    @staticmethod
     @st.cache_resource
     def get_client() -> bigquery.Client:
         """
-        Get the bigquery client
+        Get the client of the configured data backend (BACKEND): BigQuery, or
+        DuckDB over the Parquet tables of LOCAL_DATA_DIR, which runs the same
+        queries without credentials or network access
+        Returns:
+            bigquery.Client or DuckDBClient
+        """
+        if settings.BACKEND == "duckdb":
+            return DuckDBClient.from_parquet(settings.LOCAL_DATA_DIR, settings.LOCAL_DATABASE)
+        if settings.BACKEND != "bigquery":
+            raise ValueError(f"Unknown data backend {settings.BACKEND!r}, expected 'bigquery' or 'duckdb'")
+        return DBConnect.get_bigquery_client()
+
+    @staticmethod
+    def get_bigquery_client() -> bigquery.Client:
+        """
+        Get a bigquery client, whatever the configured backend
         Returns:
             bigquery.Client
         """
@@ -17,3 +39,25 @@ class DBConnect:
         )
         client = bigquery.Client(credentials=credentials)
         return client
+
+    @staticmethod
+    @st.cache_resource
+    def get_storage_client():
+        """
+        Get the BigQuery Storage Read API client, used to stream query results
+        as Arrow. Returns None when google-cloud-bigquery-storage is not installed
+        or the backend is not BigQuery, in which case results are fetched through
+        paged REST (or directly from DuckDB).
+        Returns:
+            bigquery_storage.BigQueryReadClient or None
+        """
+        if settings.BACKEND != "bigquery":
+            return None
+        try:
+            from google.cloud import bigquery_storage
+        except ImportError:
+            return None
+        credentials = service_account.Credentials.from_service_account_info(
+            st.secrets["gcp_service_account_prod"]
+        )
+        return bigquery_storage.BigQueryReadClient(credentials=credentials)
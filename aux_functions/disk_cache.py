@@ -0,0 +1,247 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+import uuid
+
+import polars as pl
+import streamlit as st
+
+from aux_functions import settings
+
+# Bump whenever the shape of the cached query output changes so old files are
+# ignored (and eventually evicted) instead of being served.
+DATASET_VERSION = 3
+
+# Rows per Parquet row group. Small enough for row-group statistics to skip
+# most of a make dataset when scanning one selection.
+ROW_GROUP_SIZE = 50_000
+
+
+class DiskCache:
+    """
+    Parquet files in a directory shared by all Streamlit processes on a node.
+    Writes are atomic (temp file + rename), reads are memory-mapped, and the
+    directory is kept under a size budget by evicting the least recently read
+    files. Freshness is tracked with the file mtime, recency with the atime.
+
+    Lazy scans pin an entry: a hard link under pinned/<pid>/ keeps the version
+    being scanned readable even if the entry is refreshed or evicted meanwhile.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.pin_directory = os.path.join(directory, "pinned", str(os.getpid()))
+        os.makedirs(self.pin_directory, exist_ok=True)
+        self._remove_dead_pins()
+
+    @staticmethod
+    @st.cache_resource
+    def get_instance() -> "DiskCache":
+        """
+        Get the process-wide disk cache configured from settings
+        Returns:
+            DiskCache
+        """
+        return DiskCache(settings.CACHE_DIR, settings.CACHE_MAX_BYTES)
+
+    @staticmethod
+    def dataset_key(make_id: int) -> str:
+        """
+        Get the cache key of a make dataset
+        Args:
+            make_id: int
+        Returns:
+            key: str
+        """
+        return f"make_{make_id}_v{DATASET_VERSION}"
+
+    @staticmethod
+    def series_key(make_id: int, fingerprint: tuple, selection: tuple) -> str:
+        """
+        Get the cache key of the daily series of a selection, a canonical hash
+        of the filter values that changes with the dataset version
+        Args:
+            make_id: int
+            fingerprint: tuple, version of the make dataset
+            selection: tuple of the selected values, in LEVELS order
+        Returns:
+            key: str
+        """
+        identity = repr((fingerprint, tuple(str(value) for value in selection))).encode()
+        return f"series_{make_id}_{hashlib.sha1(identity).hexdigest()[:20]}_v{DATASET_VERSION}"
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.parquet")
+
+    def age(self, key: str) -> float:
+        """
+        Get the seconds since the entry was last written, None if missing
+        Args:
+            key: str
+        Returns:
+            age: float
+        """
+        try:
+            return time.time() - os.stat(self.path(key)).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def get(self, key: str, max_age: float = None) -> pl.DataFrame:
+        """
+        Read an entry, None if it is missing or older than max_age seconds
+        Args:
+            key: str
+            max_age: float
+        Returns:
+            df: pl.DataFrame
+        """
+        age = self.age(key)
+        if age is None or (max_age is not None and age > max_age):
+            return None
+        path = self.path(key)
+        try:
+            df = pl.read_parquet(path, memory_map=True)
+            self._touch(path)
+        except FileNotFoundError:
+            return None
+        return df
+
+    def scan(self, key: str) -> pl.LazyFrame:
+        """
+        Lazily scan an entry regardless of its age, None if missing
+        Args:
+            key: str
+        Returns:
+            lf: pl.LazyFrame
+        """
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+        self._touch(path)
+        return pl.scan_parquet(path)
+
+    def pin(self, key: str, max_age: float = None) -> str:
+        """
+        Pin the current version of an entry for lazy scanning, None if it is
+        missing or older than max_age seconds. Release it with unpin.
+        Args:
+            key: str
+            max_age: float
+        Returns:
+            path: str
+        """
+        age = self.age(key)
+        if age is None or (max_age is not None and age > max_age):
+            return None
+        pinned = os.path.join(self.pin_directory, f"{key}.{uuid.uuid4().hex}.parquet")
+        try:
+            os.link(self.path(key), pinned)
+        except FileNotFoundError:
+            return None
+        except OSError:
+            shutil.copyfile(self.path(key), pinned)
+        self._touch(self.path(key))
+        return pinned
+
+    @staticmethod
+    def unpin(path: str) -> None:
+        """
+        Release a pinned entry
+        Args:
+            path: str
+        """
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def put(self, key: str, df: pl.DataFrame) -> None:
+        """
+        Atomically write an entry and evict old files beyond the size budget
+        Args:
+            key: str
+            df: pl.DataFrame
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=f".{key}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                df.write_parquet(f, statistics=True, row_group_size=ROW_GROUP_SIZE)
+            os.replace(tmp_path, self.path(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.evict(keep=key)
+
+    def evict(self, keep: str = None) -> None:
+        """
+        Remove least recently read entries until the directory fits max_bytes.
+        Pins count toward the budget: the pins of processes that are gone are
+        removed, and a live pin keeps its bytes in use after its entry is
+        evicted, so pinned entries are never chosen since removing them frees
+        nothing. The directory may stay over budget while pins are held.
+        Args:
+            keep: str, key of an entry never to evict, such as the one just written
+        """
+        self._remove_dead_pins()
+        pinned = {}
+        root = os.path.dirname(self.pin_directory)
+        for directory in os.scandir(root):
+            try:
+                files = list(os.scandir(directory.path))
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            for entry in files:
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                # hard links of the same version share their bytes
+                pinned[stat.st_ino] = stat.st_size
+
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".parquet"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_atime, stat.st_size, stat.st_ino, entry.path))
+
+        cached = {ino for _, _, ino, _ in entries}
+        total = sum(size for _, size, _, _ in entries)
+        total += sum(size for ino, size in pinned.items() if ino not in cached)
+        kept = self.path(keep) if keep is not None else None
+        for _, size, ino, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if ino in pinned or path == kept:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            total -= size
+
+    def _remove_dead_pins(self) -> None:
+        # pins of processes that are gone are never unpinned
+        root = os.path.dirname(self.pin_directory)
+        for entry in os.scandir(root):
+            try:
+                os.kill(int(entry.name), 0)
+            except ProcessLookupError:
+                shutil.rmtree(entry.path, ignore_errors=True)
+            except (ValueError, PermissionError):
+                pass
+
+    @staticmethod
+    def _touch(path: str) -> None:
+        # only bump the access time, the mtime keeps recording freshness
+        try:
+            os.utime(path, (time.time(), os.stat(path).st_mtime))
+        except FileNotFoundError:
+            pass
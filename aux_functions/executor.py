@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import json
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import polars as pl
+import streamlit as st
+
+from aux_functions import settings
+from aux_functions.background import THREAD_PREFIX, quiet_background_threads
+from aux_functions.fetch import Fetch
+from aux_functions.lazy import LazyModule
+from aux_functions.resilience import Resilience
+
+bigquery = LazyModule("google.cloud.bigquery")
+
+
+class QueryExecutor:
+    """
+    Process-wide executor for BigQuery queries.
+
+    Jobs run on a shared thread pool whose size bounds the number of concurrent
+    jobs per process, so a load spike queues instead of piling up slow jobs.
+    Identical requests (same query text and parameters) made while one is in
+    flight share its future instead of sending a duplicate job.
+    """
+
+    def __init__(self, max_concurrent_jobs: int):
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_concurrent_jobs, thread_name_prefix=f"{THREAD_PREFIX}-query"
+        )
+        self._lock = threading.Lock()
+        self._in_flight = {}
+
+    @staticmethod
+    @st.cache_resource
+    def get_instance() -> "QueryExecutor":
+        """
+        Get the process-wide query executor
+        Returns:
+            QueryExecutor
+        """
+        quiet_background_threads()
+        return QueryExecutor(settings.MAX_CONCURRENT_QUERIES)
+
+    @staticmethod
+    def request_key(query: str, job_config: bigquery.QueryJobConfig = None) -> tuple:
+        """
+        Get the identity of a request, its query text, parameters, deadline
+        and cost cap, so requests under different limits are not coalesced
+        Args:
+            query: str
+            job_config: bigquery.QueryJobConfig, with the limits applied
+        Returns:
+            key: tuple
+        """
+        parameters = getattr(job_config, "query_parameters", None) or []
+        return (
+            query,
+            tuple(json.dumps(p.to_api_repr(), sort_keys=True, default=str) for p in parameters),
+            getattr(job_config, "job_timeout_ms", None),
+            getattr(job_config, "maximum_bytes_billed", None),
+        )
+
+    def submit(
+        self,
+        client: bigquery.Client,
+        query: str,
+        job_config: bigquery.QueryJobConfig = None,
+        bqstorage_client=None,
+        timeout: float = None,
+        max_bytes_billed: int = None,
+    ) -> Future:
+        """
+        Submit a query, joining the in-flight job of an identical request if any
+        Args:
+            client: bigquery.Client
+            query: str
+            job_config: bigquery.QueryJobConfig
+            bqstorage_client: bigquery_storage.BigQueryReadClient
+            timeout: float, deadline of the job, see Fetch.query_to_polars
+            max_bytes_billed: int, cost cap of the job, see Fetch.query_to_polars
+        Returns:
+            future: Future resolving to a pl.DataFrame
+        """
+        job_config = Resilience.job_config(job_config, timeout, max_bytes_billed)
+        key = QueryExecutor.request_key(query, job_config)
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is None:
+                future = self._pool.submit(
+                    Fetch.query_to_polars, client, query, job_config, bqstorage_client, timeout, max_bytes_billed
+                )
+                self._in_flight[key] = future
+                future.add_done_callback(lambda f: self._forget(key, f))
+        return future
+
+    def run(
+        self,
+        client: bigquery.Client,
+        query: str,
+        job_config: bigquery.QueryJobConfig = None,
+        bqstorage_client=None,
+        timeout: float = None,
+        max_bytes_billed: int = None,
+    ) -> pl.DataFrame:
+        """
+        Run a query through the executor and wait for its result
+        Args:
+            client: bigquery.Client
+            query: str
+            job_config: bigquery.QueryJobConfig
+            bqstorage_client: bigquery_storage.BigQueryReadClient
+            timeout: float, deadline of the job, see Fetch.query_to_polars
+            max_bytes_billed: int, cost cap of the job, see Fetch.query_to_polars
+        Returns:
+            df: pl.DataFrame
+        """
+        return self.submit(client, query, job_config, bqstorage_client, timeout, max_bytes_billed).result()
+
+    def _forget(self, key: tuple, future: Future) -> None:
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
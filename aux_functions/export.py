@@ -0,0 +1,169 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import streamlit as st
+
+from aux_functions import settings
+from aux_functions.background import THREAD_PREFIX, quiet_background_threads
+from aux_functions.disk_cache import ROW_GROUP_SIZE
+from aux_functions.metrics import Metrics
+from aux_functions.queries import Queries
+
+# Export contents and formats as labelled in the UI
+CONTENTS = {
+    "Filas": "rows",
+    "Serie diaria": "daily",
+}
+FORMATS = {
+    "CSV": "csv",
+    "Parquet": "parquet",
+}
+MIME_TYPES = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+class ExportManager:
+    """
+    Process-wide writer of the downloads of a filter selection.
+
+    An export is the rows of the make dataset matching the selection, or its
+    daily series, written to a CSV or Parquet file under EXPORT_DIR. The file
+    is streamed chunk by chunk from the cached make dataset by a Polars sink on
+    a background pool, so neither the whole file nor the whole make is held in
+    memory and the rerun thread only polls for the result. Exports are keyed by
+    dataset version, selection, content and format: sessions asking for the
+    same export share the file, and files older than EXPORT_MAX_AGE are deleted
+    along with their jobs.
+    """
+
+    def __init__(self, directory: str, max_concurrent: int, max_age: float):
+        self.directory = directory
+        self.max_age = max_age
+        os.makedirs(directory, exist_ok=True)
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix=f"{THREAD_PREFIX}-export")
+        self._lock = threading.Lock()
+        # key -> (future, submission time)
+        self._jobs = {}
+
+    @staticmethod
+    @st.cache_resource
+    def get_instance() -> "ExportManager":
+        """
+        Get the process-wide export manager configured from settings
+        Returns:
+            ExportManager
+        """
+        quiet_background_threads()
+        return ExportManager(settings.EXPORT_DIR, settings.EXPORT_CONCURRENCY, settings.EXPORT_MAX_AGE)
+
+    @staticmethod
+    def key(make_id: int, fingerprint: tuple, selection: tuple, content: str, file_format: str) -> str:
+        """
+        Get the identity of an export
+        Args:
+            make_id: int
+            fingerprint: tuple, version of the make dataset
+            selection: tuple of the selected values, in LEVELS order
+            content: str, "rows" or "daily"
+            file_format: str, "csv" or "parquet"
+        Returns:
+            key: str
+        """
+        identity = repr((make_id, fingerprint, selection, content, file_format)).encode()
+        return hashlib.sha1(identity).hexdigest()[:20]
+
+    def path(self, key: str, file_format: str) -> str:
+        return os.path.join(self.directory, f"{key}.{file_format}")
+
+    def job(self, key: str) -> Future:
+        """
+        Get the export job of a key, None if it was never submitted or its
+        file was deleted
+        Args:
+            key: str
+        Returns:
+            future: Future resolving to the path of the file
+        """
+        with self._lock:
+            future, _ = self._jobs.get(key, (None, None))
+            if future is not None and future.done() and future.exception() is None \
+                    and not os.path.exists(future.result()):
+                del self._jobs[key]
+                future = None
+        return future
+
+    def submit(self, dataset, selection: tuple, content: str, file_format: str) -> Future:
+        """
+        Start writing an export, joining the job of an identical one if any
+        Args:
+            dataset: DatasetEntry of the selected make
+            selection: tuple of the selected values, in LEVELS order
+            content: str, "rows" or "daily"
+            file_format: str, "csv" or "parquet"
+        Returns:
+            future: Future resolving to the path of the file
+        """
+        key = ExportManager.key(dataset.make_id, dataset.fingerprint, selection, content, file_format)
+        future = self.job(key)
+        if future is not None and (not future.done() or future.exception() is None):
+            return future
+        self._prune()
+        with self._lock:
+            future = self._pool.submit(self._write, dataset, selection, content, file_format, self.path(key, file_format))
+            self._jobs[key] = (future, time.time())
+        return future
+
+    @staticmethod
+    def _write(dataset, selection: tuple, content: str, file_format: str, path: str) -> str:
+        if content == "daily":
+            lf = dataset.facets.series_plan(selection)
+        else:
+            # the make dataset keeps only the sums, the mean price of a row is derived
+            lf = dataset.facets.rows_plan(selection).with_columns(Queries.weighted_price())
+
+        start = time.perf_counter()
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".export-", suffix=".tmp")
+        os.close(fd)
+        try:
+            if file_format == "parquet":
+                lf.sink_parquet(tmp_path, row_group_size=ROW_GROUP_SIZE, engine="streaming")
+            else:
+                lf.sink_csv(tmp_path, engine="streaming")
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        metrics = Metrics.get_instance()
+        metrics.observe("autotiming_export_seconds", time.perf_counter() - start, content=content, format=file_format)
+        metrics.count("autotiming_export_bytes_total", os.path.getsize(path), content=content, format=file_format)
+        return path
+
+    def _prune(self) -> None:
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            try:
+                expired = now - entry.stat().st_mtime > self.max_age
+            except FileNotFoundError:
+                continue
+            # unfinished temporary files of a crashed process expire as well
+            if expired:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+        # finished jobs are forgotten with their file, failed ones after max_age
+        with self._lock:
+            for key, (future, submitted) in list(self._jobs.items()):
+                if not future.done():
+                    continue
+                if now - submitted > self.max_age or \
+                        (future.exception() is None and not os.path.exists(future.result())):
+                    del self._jobs[key]
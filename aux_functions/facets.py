@@ -0,0 +1,181 @@
+import os
+import threading
+
+import polars as pl
+
+from aux_functions import settings
+from aux_functions.disk_cache import DiskCache
+from aux_functions.metrics import Metrics
+
+# Filter cascade in the order the app asks for it:
+# (label column, column defining the option order, descending)
+LEVELS = [
+    ("model", "model", False),
+    ("km_range", "km_class_id", False),
+    ("year", "year", True),
+    ("hp_range", "hp_class_id", False),
+    ("transmission_type", "transmission_type", False),
+    ("fuel_type", "fuel_type", False),
+]
+
+# Row order of the Parquet make datasets: rows of a selection prefix are
+# contiguous, so row-group statistics let the scan skip everything else
+SORT_COLUMNS = [order for _, order, _ in LEVELS] + ["day"]
+
+
+class FacetIndex:
+    """
+    Option lists and daily series of the filter cascade over a lazily scanned
+    make dataset.
+
+    For a selection, the option list of every level and the daily series are
+    built as lazy plans over the same source and collected together with
+    pl.collect_all. The shared scan is then optimized once, the equality
+    filters are pushed down to the Parquet row-group statistics, and only the
+    needed columns are read. Results are cached per selection prefix and the
+    index is shared by all sessions through the DatasetRegistry.
+
+    With a store, daily series are also written to the on-disk cache under a
+    canonical hash of the make, dataset version and selection, so other
+    processes of the node and later versions of the index with the same data
+    read them instead of scanning the dataset.
+    """
+
+    def __init__(self, source: pl.LazyFrame, store: DiskCache = None, make_id: int = None, fingerprint: tuple = None):
+        self.source = source
+        self.store = store
+        self.make_id = make_id
+        self.fingerprint = fingerprint
+        self._lock = threading.Lock()
+        self._options = {}
+        self._series = {}
+
+    @staticmethod
+    def fingerprint(source: pl.LazyFrame, path: str = None) -> tuple:
+        """
+        Identity of a dataset version. For a pinned Parquet file it is the
+        identity of the file written by the on-disk cache (every write is a new
+        file), shared by all processes pinning it. For an in-memory frame it is
+        a content hash of its rows, so a refresh changing only price_sum or
+        ad_count still changes it.
+        Args:
+            source: pl.LazyFrame
+            path: str, pinned file the source scans
+        Returns:
+            tuple
+        """
+        if path is not None:
+            stat = os.stat(path)
+            return "file", stat.st_ino, stat.st_mtime_ns, stat.st_size
+        rows = pl.struct(pl.all().exclude(pl.Categorical), pl.col(pl.Categorical).cast(pl.String))
+        return ("rows",) + source.select(pl.len(), rows.hash(seed=0).sum()).collect().row(0)
+
+    def estimated_size(self) -> int:
+        """
+        Get the bytes held by the cached daily series
+        Returns:
+            size: int
+        """
+        return sum(df.estimated_size() for df in list(self._series.values()))
+
+    def rows_plan(self, selection: tuple) -> pl.LazyFrame:
+        """
+        Get the lazy rows of the dataset matching a selection prefix
+        Args:
+            selection: tuple of the selected values, in LEVELS order
+        Returns:
+            lf: pl.LazyFrame
+        """
+        predicates = [pl.col(label) == value for (label, _, _), value in zip(LEVELS, selection)]
+        return self.source.filter(*predicates) if predicates else self.source
+
+    def _options_plan(self, selection: tuple) -> pl.LazyFrame:
+        label, order, descending = LEVELS[len(selection)]
+        columns = [label] if label == order else [label, order]
+        return (self.rows_plan(selection)
+                .select(columns)
+                .unique()
+                .sort(order, descending=descending)
+                .select(label))
+
+    def series_plan(self, selection: tuple) -> pl.LazyFrame:
+        """
+        Get the lazy daily series of the rows matching a selection prefix
+        Args:
+            selection: tuple of the selected values, in LEVELS order
+        Returns:
+            lf: pl.LazyFrame with columns day, price, price_sum, ad_count
+        """
+        return (self.rows_plan(selection)
+                .group_by("day")
+                .agg(pl.col("price_sum").sum(), pl.col("ad_count").cast(pl.Int64).sum())
+                .with_columns((pl.col("price_sum") / pl.col("ad_count")).cast(pl.Int32).alias("price"))
+                .select("day", "price", "price_sum", "ad_count")
+                .sort("day"))
+
+    def prefetch(self, selection: list, series: bool = True) -> None:
+        """
+        Resolve in one optimized pass every option list along a selection and
+        its daily series, skipping what is already cached
+        Args:
+            selection: list of the selected values, in LEVELS order
+            series: bool, also resolve the daily series of the selection
+        """
+        selection = tuple(selection)
+        plans = {}
+        for i in range(min(len(selection) + 1, len(LEVELS))):
+            if selection[:i] not in self._options:
+                plans[("options", selection[:i])] = self._options_plan(selection[:i])
+        if series and selection and selection not in self._series:
+            df = self._stored_series(selection)
+            if df is None:
+                plans[("series", selection)] = self.series_plan(selection)
+            else:
+                with self._lock:
+                    self._series[selection] = df
+        if not plans:
+            return
+
+        results = pl.collect_all(list(plans.values()))
+        with self._lock:
+            for (kind, prefix), df in zip(plans, results):
+                if kind == "options":
+                    self._options[prefix] = df.to_series().to_list()
+                else:
+                    self._series[prefix] = df
+        if ("series", selection) in plans and self.store is not None:
+            self.store.put(DiskCache.series_key(self.make_id, self.fingerprint, selection), self._series[selection])
+
+    def _stored_series(self, selection: tuple) -> pl.DataFrame:
+        if self.store is None:
+            return None
+        df = self.store.get(DiskCache.series_key(self.make_id, self.fingerprint, selection), max_age=settings.DATASET_TTL)
+        Metrics.get_instance().count("autotiming_series_cache_total", result="hit" if df is not None else "miss")
+        return df
+
+    def options(self, selection: list) -> list:
+        """
+        Get the ordered options of the next filter level given a selection prefix
+        Args:
+            selection: list of the selected values, in LEVELS order
+        Returns:
+            options: list
+        """
+        selection = tuple(selection)
+        if selection not in self._options:
+            self.prefetch(selection, series=False)
+        return self._options[selection]
+
+    def daily_average(self, selection: list) -> pl.DataFrame:
+        """
+        Get the ad-weighted average price per day of the rows matching a
+        selection prefix
+        Args:
+            selection: list of the selected values, in LEVELS order
+        Returns:
+            df: pl.DataFrame with columns day, price, price_sum, ad_count
+        """
+        selection = tuple(selection)
+        if selection not in self._series:
+            self.prefetch(selection)
+        return self._series[selection]
@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+import concurrent.futures
+
+import polars as pl
+
+from aux_functions.lazy import LazyModule
+from aux_functions.metrics import Metrics
+from aux_functions.resilience import Resilience
+
+bigquery = LazyModule("google.cloud.bigquery")
+pa = LazyModule("pyarrow")
+
+# Low-cardinality label columns, stored as categoricals so every make frame
+# keeps one dictionary per column instead of one string per row.
+CATEGORICAL_COLUMNS = [
+    "make",
+    "model",
+    "km_range",
+    "hp_range",
+    "transmission_type",
+    "fuel_type",
+]
+
+# Id and measure columns that fit comfortably in narrower integer types.
+INTEGER_COLUMNS = {
+    "make_id": pl.Int32,
+    "model_id": pl.Int32,
+    "year": pl.Int16,
+    "km_class_id": pl.Int16,
+    "hp_class_id": pl.Int16,
+    "price_sum": pl.Int64,
+    "ad_count": pl.Int32,
+}
+
+PAGE_SIZE = 100_000
+
+
+class Fetch:
+
+    @staticmethod
+    def query_to_polars(
+        client: bigquery.Client,
+        query: str,
+        job_config: bigquery.QueryJobConfig = None,
+        bqstorage_client=None,
+        timeout: float = None,
+        max_bytes_billed: int = None,
+    ) -> pl.DataFrame:
+        """
+        Run a query and stream its result as Arrow record batches into Polars.
+        The Storage Read API is used when a bqstorage client is given, paged
+        REST otherwise. The job runs under the deadline and cost cap of
+        Resilience, transient failures are retried.
+        Args:
+            client: bigquery.Client
+            query: str
+            job_config: bigquery.QueryJobConfig
+            bqstorage_client: bigquery_storage.BigQueryReadClient
+            timeout: float, deadline in seconds, QUERY_TIMEOUT when None, none when 0
+            max_bytes_billed: int, cost cap, MAX_BYTES_BILLED when None, none when 0
+        Returns:
+            df: pl.DataFrame
+        """
+        job_config = Resilience.job_config(job_config, timeout, max_bytes_billed)
+        return Resilience.call(Fetch._run_query, client, query, job_config, bqstorage_client, timeout=timeout)
+
+    @staticmethod
+    def _run_query(
+        client: bigquery.Client,
+        query: str,
+        job_config: bigquery.QueryJobConfig,
+        bqstorage_client,
+        timeout: float = None,
+    ) -> pl.DataFrame:
+        metrics = Metrics.get_instance()
+        query_job = client.query(query, job_config=job_config)
+        with metrics.timer("autotiming_bigquery_job_seconds"):
+            try:
+                rows = query_job.result(page_size=PAGE_SIZE, timeout=timeout)
+            except concurrent.futures.TimeoutError:
+                # do not leave the abandoned job running (and billing)
+                query_job.cancel()
+                raise
+        metrics.count("autotiming_bigquery_bytes_processed_total", query_job.total_bytes_processed or 0)
+
+        with metrics.timer("autotiming_arrow_fetch_seconds"):
+            batches = list(rows.to_arrow_iterable(bqstorage_client=bqstorage_client))
+            if batches:
+                table = pa.Table.from_batches(batches)
+            else:
+                # the iterator is consumed, the empty result is built from its schema
+                table = Fetch.empty_table(rows.schema)
+            return Fetch.compact(pl.from_arrow(table, rechunk=False))
+
+    @staticmethod
+    def empty_table(schema) -> pa.Table:
+        """
+        Get an empty Arrow table with the columns of a query result
+        Args:
+            schema: list of bigquery.SchemaField, or pa.Schema for the local
+                backends, which hold their results as Arrow; None when the
+                result has no schema
+        Returns:
+            table: pa.Table, without columns when there is no schema
+        """
+        if schema is None:
+            return pa.table({})
+        if not isinstance(schema, pa.Schema):
+            schema = pa.schema([pa.field(field.name, Fetch.arrow_type(field)) for field in schema])
+        return schema.empty_table()
+
+    @staticmethod
+    def arrow_type(field: bigquery.SchemaField) -> pa.DataType:
+        """
+        Get the Arrow type BigQuery returns a column as
+        Args:
+            field: bigquery.SchemaField
+        Returns:
+            type: pa.DataType, null for types without an Arrow equivalent
+        """
+        field_type = field.field_type.upper()
+        if field_type in ("RECORD", "STRUCT"):
+            arrow_type = pa.struct([pa.field(f.name, Fetch.arrow_type(f)) for f in field.fields])
+        else:
+            arrow_type = {
+                "STRING": pa.string(),
+                "BYTES": pa.binary(),
+                "INTEGER": pa.int64(),
+                "INT64": pa.int64(),
+                "FLOAT": pa.float64(),
+                "FLOAT64": pa.float64(),
+                "NUMERIC": pa.decimal128(38, 9),
+                "BIGNUMERIC": pa.decimal256(76, 38),
+                "BOOLEAN": pa.bool_(),
+                "BOOL": pa.bool_(),
+                "DATE": pa.date32(),
+                "DATETIME": pa.timestamp("us"),
+                "TIMESTAMP": pa.timestamp("us", tz="UTC"),
+                "TIME": pa.time64("us"),
+                "JSON": pa.string(),
+                "GEOGRAPHY": pa.string(),
+            }.get(field_type, pa.null())
+        return pa.list_(arrow_type) if field.mode == "REPEATED" else arrow_type
+
+    @staticmethod
+    def compact(df: pl.DataFrame) -> pl.DataFrame:
+        """
+        Cast label columns to categoricals and id/measure columns to small ints
+        Args:
+            df: pl.DataFrame
+        Returns:
+            df: pl.DataFrame
+        """
+        casts = [
+            pl.col(column).cast(pl.Categorical(ordering="lexical"))
+            for column in CATEGORICAL_COLUMNS
+            if column in df.columns
+        ]
+        casts += [
+            pl.col(column).cast(dtype)
+            for column, dtype in INTEGER_COLUMNS.items()
+            if column in df.columns
+        ]
+        return df.with_columns(casts) if casts else df
@@ -0,0 +1,94 @@
+import polars as pl
+
+from aux_functions.facets import LEVELS, FacetIndex
+
+# Query parameter holding the make, and the query parameter and widget key of
+# every filter, in LEVELS order
+MAKE_PARAM = "marca"
+FILTER_PARAMS = [
+    ("modelo", "model_selected"),
+    ("km", "km_range_selected"),
+    ("anio", "year_selected"),
+    ("cv", "hp_range_selected"),
+    ("cambio", "transmission_selected"),
+    ("combustible", "fuel_type_selected"),
+]
+
+
+class FilterState:
+    """
+    Selection of the filter cascade encoded in the URL query parameters
+    (?marca=...&modelo=...&km=...), so a reload or a shared link opens the
+    same chart. The whole selection is validated and restored in the rerun
+    that reads it, instead of one rerun per selectbox.
+    """
+
+    @staticmethod
+    def read(query_params) -> tuple:
+        """
+        Get the make and the filter values of a URL
+        Args:
+            query_params: st.query_params
+        Returns:
+            make: str, None if missing
+            values: list of str, the filter values up to the first missing one
+        """
+        values = []
+        for param, _ in FILTER_PARAMS:
+            value = query_params.get(param)
+            if not value:
+                break
+            values.append(value)
+        return query_params.get(MAKE_PARAM) or None, values
+
+    @staticmethod
+    def restore(facets: FacetIndex, values: list) -> dict:
+        """
+        Resolve the filter values of a URL against a make dataset: the option
+        lists along the selection are collected in one pass, the values are
+        kept up to the first one that is not an option of its level, and only
+        then is the daily series of the valid prefix resolved, so a crafted or
+        stale link never writes series to the shared disk cache
+        Args:
+            facets: FacetIndex of the make
+            values: list of str, in LEVELS order
+        Returns:
+            widget values: dict of widget key -> option
+        """
+        schema = facets.source.collect_schema()
+        selection = []
+        for (label, _, _), value in zip(LEVELS, values):
+            try:
+                selection.append(pl.Series([value]).cast(schema[label]).item())
+            except pl.exceptions.InvalidOperationError:
+                break
+        facets.prefetch(selection, series=False)
+
+        restored = {}
+        for i, ((_, key), value) in enumerate(zip(FILTER_PARAMS, selection)):
+            if value not in facets.options(selection[:i]):
+                break
+            restored[key] = value
+        facets.prefetch(selection[:len(restored)])
+        return restored
+
+    @staticmethod
+    def write(query_params, make: str, selection: list) -> None:
+        """
+        Encode the current selection in the URL, leaving other query
+        parameters untouched
+        Args:
+            query_params: st.query_params
+            make: str, None if no make is selected
+            selection: list of the selected values, in LEVELS order
+        """
+        wanted = {MAKE_PARAM: make} if make else {}
+        for (param, _), value in zip(FILTER_PARAMS, selection):
+            wanted[param] = str(value)
+        for param in [MAKE_PARAM] + [param for param, _ in FILTER_PARAMS]:
+            if param not in wanted and param in query_params:
+                del query_params[param]
+        # only send the parameters that changed to the browser
+        changed = {param: value for param, value in wanted.items() if query_params.get(param) != value}
+        if changed:
+            query_params.update(changed)
@@ -1,5 +1,10 @@
+from __future__ import annotations
+
 import streamlit as st
-import pandas as pd
+
+from aux_functions.lazy import LazyModule
+
+pd = LazyModule("pandas")
 
 def apply_filter_style():
     """Apply custom styling to filters"""
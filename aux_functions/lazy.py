@@ -0,0 +1,20 @@
+import importlib
+
+
+class LazyModule:
+    """
+    Stand-in for a module that is only imported on first attribute access.
+    Keeps heavy dependencies (the BigQuery client stack, altair) off the import
+    path of the first render; modules using it for type hints also need
+    `from __future__ import annotations`.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+
+    def __getattr__(self, attr: str):
+        # import_module is a dict lookup once the module is loaded
+        return getattr(importlib.import_module(self._name), attr)
+
+    def __repr__(self) -> str:
+        return f"<lazy module {self._name!r}>"
@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import datetime
+import os
+import re
+import threading
+import time
+import types
+
+from aux_functions.lazy import LazyModule
+
+duckdb = LazyModule("duckdb")
+exceptions = LazyModule("google.api_core.exceptions")
+pa = LazyModule("pyarrow")
+
+WRITE_STATEMENT = re.compile(r"^\s*(?:CREATE(?:\s+OR\s+REPLACE)?\s+TABLE|INSERT\s+INTO|DELETE\s+FROM|UPDATE)\s+\"?(\w+)", re.I)
+
+
+def translate(sql: str) -> str:
+    """
+    Translate the BigQuery SQL used by the app to DuckDB:
+
+    - `project.dataset.table` names map to local tables named after their last part
+    - @param placeholders become $param
+    - `x, UNNEST(array) AS alias` becomes a lateral CROSS JOIN UNNEST
+    - `IN UNNEST(@array)` becomes `IN (SELECT UNNEST($array))`
+    - `CLUSTER BY cols AS query` sorts the created table by cols, so DuckDB's
+      min/max zone maps skip blocks of other keys the way BigQuery's
+      clustering prunes them
+    Args:
+        sql: str
+    Returns:
+        sql: str
+    """
+    sql = re.sub(r"`[\w-]+\.[\w-]+\.(\w+)`", r'"\1"', sql)
+    sql = re.sub(r"@(\w+)", r"$\1", sql)
+    sql = re.sub(r",\s*UNNEST\(([\w.]+)\)\s+AS\s+(\w+)", r" CROSS JOIN UNNEST(\1) AS _unnest(\2)", sql, flags=re.I)
+    sql = re.sub(r"IN\s+UNNEST\((\$\w+)\)", r"IN (SELECT UNNEST(\1))", sql, flags=re.I)
+    sql = re.sub(r"\s+CLUSTER\s+BY\s+([\w, ]+?)\s+AS\s+(.*)$", r" AS SELECT * FROM (\2) ORDER BY \1", sql,
+                 flags=re.I | re.S)
+    return sql
+
+
+class DuckDBRowIterator:
+
+    def __init__(self, table: pa.Table, page_size: int = None):
+        self._table = table
+        self._page_size = page_size
+        self.total_rows = table.num_rows
+        self.schema = table.schema
+
+    def __iter__(self):
+        columns = [column.to_pylist() for column in self._table.columns]
+        return iter(zip(*columns))
+
+    def to_arrow_iterable(self, bqstorage_client=None, max_queue_size=None, max_stream_count=None):
+        yield from self._table.to_batches(max_chunksize=self._page_size)
+
+    def to_arrow(self, create_bqstorage_client=True, **kwargs) -> pa.Table:
+        return self._table
+
+    def to_dataframe(self, create_bqstorage_client=True, **kwargs):
+        return self._table.to_pandas()
+
+
+class DuckDBQueryJob:
+
+    def __init__(self, table: pa.Table, rows_scanned: int, rows_processed: int, latency: float):
+        self._table = table
+        self._latency = latency
+        self.rows_scanned = rows_scanned
+        self.rows_processed = rows_processed
+        self.total_bytes_processed = None
+
+    def result(self, page_size: int = None, timeout: float = None) -> DuckDBRowIterator:
+        time.sleep(self._latency)
+        return DuckDBRowIterator(self._table, page_size)
+
+    def to_arrow(self, **kwargs) -> pa.Table:
+        return self.result().to_arrow()
+
+    def cancel(self) -> bool:
+        # the query already ran when the job was created
+        return False
+
+
+class DuckDBClient:
+    """
+    Local data backend running the app's queries on an in-process DuckDB
+    database, with the part of the bigquery.Client interface the app uses:
+    query(sql, job_config) returning a job whose result() streams Arrow
+    batches, and get_table(name).modified.
+
+    The BigQuery SQL is translated (see translate), the job_config query
+    parameters are bound to the $params each statement uses, and scripts run
+    statement by statement on one connection. Tables come from Arrow tables
+    loaded into the database, or from views over a directory of Parquet files
+    (<table>.parquet or <table>/*.parquet) that are re-read on every query, so
+    replacing a file publishes it. Each job records the rows DuckDB scanned
+    (job.rows_scanned) and the rows all operators produced, unnested arrays
+    and joins included (job.rows_processed). `latency` is added to every job
+    to simulate a remote round-trip in benchmarks.
+    """
+
+    def __init__(self, tables: dict = None, latency: float = 0.0, database: str = ":memory:"):
+        self.connection = duckdb.connect(database)
+        self.latency = latency
+        self.queries = []
+        self.modified = {}
+        self.files = {}
+        self.lock = threading.Lock()
+        for name, table in (tables or {}).items():
+            self.connection.register("_source", table)
+            self.connection.execute(f'CREATE OR REPLACE TABLE "{name}" AS SELECT * FROM _source')
+            self.connection.unregister("_source")
+            self.modified[name] = datetime.datetime.now(datetime.timezone.utc)
+
+    @staticmethod
+    def from_parquet(directory: str, database: str = ":memory:", latency: float = 0.0) -> "DuckDBClient":
+        """
+        Get a client serving the Parquet tables of a directory
+        Args:
+            directory: str, holding <table>.parquet files or <table>/ directories of Parquet files
+            database: str, DuckDB database file for the tables the app writes, in memory by default
+            latency: float
+        Returns:
+            DuckDBClient
+        """
+        client = DuckDBClient(latency=latency, database=database)
+        for entry in sorted(os.scandir(directory), key=lambda e: e.name):
+            if entry.name.startswith("."):
+                continue
+            if entry.is_file() and entry.name.endswith(".parquet"):
+                name, pattern = entry.name[:-len(".parquet")], entry.path
+            elif entry.is_dir():
+                name, pattern = entry.name, os.path.join(entry.path, "*.parquet")
+            else:
+                continue
+            client.connection.execute(
+                f"CREATE OR REPLACE VIEW \"{name}\" AS SELECT * FROM read_parquet('{pattern}')"
+            )
+            client.files[name] = entry.path
+        return client
+
+    def query(self, query: str, job_config=None, **kwargs) -> DuckDBQueryJob:
+        params = {
+            p.name: getattr(p, "value", getattr(p, "values", None))
+            for p in getattr(job_config, "query_parameters", None) or []
+        }
+        with self.lock:
+            self.queries.append((query, params))
+
+        cursor = self.connection.cursor()
+        cursor.execute("PRAGMA enable_profiling='no_output'")
+        cursor.execute("""SET custom_profiling_settings='{"CUMULATIVE_ROWS_SCANNED": "true", "CUMULATIVE_CARDINALITY": "true"}'""")
+        table, rows_scanned, rows_processed = pa.table({}), 0, 0
+        try:
+            for statement in filter(str.strip, translate(query).split(";")):
+                used = {name: value for name, value in params.items() if f"${name}" in statement}
+                result = cursor.execute(statement, used)
+                if result.description is not None:
+                    table = result.to_arrow_table()
+                profile = cursor.get_profiling_information(format="json")
+                # DuckDB does not profile every statement type
+                scanned = re.search(r'"cumulative_rows_scanned":\s*(\d+)', profile)
+                processed = re.search(r'"cumulative_cardinality":\s*(\d+)', profile)
+                rows_scanned += int(scanned.group(1)) if scanned else 0
+                rows_processed += int(processed.group(1)) if processed else 0
+                written = WRITE_STATEMENT.match(statement)
+                if written:
+                    self.modified[written.group(1)] = datetime.datetime.now(datetime.timezone.utc)
+        finally:
+            cursor.close()
+        return DuckDBQueryJob(table, rows_scanned, rows_processed, self.latency)
+
+    def get_table(self, table: str):
+        name = table.split(".")[-1]
+        if name in self.modified:
+            modified = self.modified[name]
+        elif name in self.files:
+            # views are as fresh as the files they read
+            modified = datetime.datetime.fromtimestamp(os.stat(self.files[name]).st_mtime, datetime.timezone.utc)
+        else:
+            raise exceptions.NotFound(f"Table {table} not found")
+        return types.SimpleNamespace(table_id=name, modified=modified)
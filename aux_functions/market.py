@@ -0,0 +1,110 @@
+import datetime
+
+import polars as pl
+import streamlit as st
+
+from aux_functions.snapshot import Snapshot
+
+# Segments the market index can be split by: label shown in the app -> column
+SEGMENTS = {
+    "Marca": None,
+    "Combustible": "fuel_type",
+    "Transmisión": "transmission_type",
+    "Potencia (CV)": "hp_range",
+    "Kilometraje": "km_range",
+}
+
+# Days at each end of the window averaged to compare prices, smooths out the
+# day to day noise of models with few ads
+BASE_DAYS = 7
+
+# Ads a model needs at each end of the window to be ranked as a mover
+MIN_ADS = 20
+
+
+class Market:
+    """
+    Market-wide analyses over the current snapshot. The plans are collected
+    with the streaming engine so the whole market never has to be held in
+    memory, and the results are cached per snapshot id.
+    """
+
+    @staticmethod
+    def _window(lf: pl.LazyFrame, days: int) -> tuple:
+        # the window ends at the last day of the snapshot, not today
+        end = lf.select(pl.col("day").max()).collect().item()
+        return end - datetime.timedelta(days=days - 1), end
+
+    @staticmethod
+    def _weighted(lf: pl.LazyFrame, groups: list) -> pl.LazyFrame:
+        return (lf
+                .group_by(groups)
+                .agg(pl.col("price_sum").sum(), pl.col("ad_count").cast(pl.Int64).sum())
+                .with_columns((pl.col("price_sum") / pl.col("ad_count")).alias("price")))
+
+    @staticmethod
+    @st.cache_data(ttl=3600, show_spinner=False)
+    def price_index(snapshot_id: str, days: int, segment: str = None) -> pl.DataFrame:
+        """
+        Get the ad-weighted price index per make (and segment) over the last
+        days of the snapshot, 100 being the average of the first BASE_DAYS days
+        Args:
+            snapshot_id: str
+            days: int
+            segment: str, column of SEGMENTS or None for makes only
+        Returns:
+            df: pl.DataFrame with columns make, [segment], day, price, ad_count, index
+        """
+        lf = Snapshot.get_instance().scan(snapshot_id)
+        groups = ["make"] + ([segment] if segment else [])
+        start, _ = Market._window(lf, days)
+
+        window = lf.filter(pl.col("day") >= start).select(groups + ["day", "price_sum", "ad_count"])
+        daily = Market._weighted(window, groups + ["day"])
+        base = (Market._weighted(window.filter(pl.col("day") < start + datetime.timedelta(days=BASE_DAYS)), groups)
+                .select(groups + [pl.col("price").alias("base_price")]))
+        return (daily
+                .join(base, on=groups)
+                .with_columns((pl.col("price") / pl.col("base_price") * 100).round(1).alias("index"))
+                .select(groups + ["day", pl.col("price").cast(pl.Int32), "ad_count", "index"])
+                .sort(groups + ["day"])
+                .collect(engine="streaming"))
+
+    @staticmethod
+    @st.cache_data(ttl=3600, show_spinner=False)
+    def top_movers(snapshot_id: str, days: int, n: int = 10) -> pl.DataFrame:
+        """
+        Get the models whose ad-weighted price moved the most between the first
+        and the last BASE_DAYS days of the window
+        Args:
+            snapshot_id: str
+            days: int
+            n: int, models returned on each side (rises and drops)
+        Returns:
+            df: pl.DataFrame with columns make, model, price_start, price_end, change
+        """
+        lf = Snapshot.get_instance().scan(snapshot_id)
+        groups = ["make", "model"]
+        start, end = Market._window(lf, days)
+
+        window = lf.select(groups + ["day", "price_sum", "ad_count"])
+        first = Market._weighted(
+            window.filter(pl.col("day").is_between(start, start + datetime.timedelta(days=BASE_DAYS - 1))), groups
+        )
+        last = Market._weighted(
+            window.filter(pl.col("day") > end - datetime.timedelta(days=BASE_DAYS)), groups
+        )
+        changes = (first
+                   .join(last, on=groups, suffix="_end")
+                   .filter((pl.col("ad_count") >= MIN_ADS) & (pl.col("ad_count_end") >= MIN_ADS))
+                   .select(
+                       *groups,
+                       pl.col("price").cast(pl.Int32).alias("price_start"),
+                       pl.col("price_end").cast(pl.Int32),
+                       ((pl.col("price_end") / pl.col("price") - 1) * 100).round(1).alias("change"),
+                   )
+                   .collect(engine="streaming"))
+        return pl.concat([
+            changes.top_k(n, by="change"),
+            changes.bottom_k(n, by="change"),
+        ]).unique().sort("change", descending=True)
@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+import datetime
+import logging
+
+import streamlit as st
+
+from aux_functions import settings
+from aux_functions.lazy import LazyModule
+from aux_functions.metrics import Metrics
+from aux_functions.resilience import Resilience
+
+bigquery = LazyModule("google.cloud.bigquery")
+exceptions = LazyModule("google.api_core.exceptions")
+
+logger = logging.getLogger(__name__)
+
+# Raw table the materialized table aggregates
+RAW_TABLE = "autotiming-prod.metrics.ad_tracker_history"
+
+# Pre-joined daily aggregate of every make, the same rows query_dataset_by_make
+# computes from the raw tables. @since limits it to the newest days.
+AGGREGATE_QUERY = """
+        SELECT
+            ad.make_id,
+            ma.name AS make,
+            ad.model_id,
+            mo.name AS model,
+            ph.d AS day,
+            year_manufactured AS year,
+            km.km_class_id AS km_class_id,
+            km.name AS km_range,
+            hp.hp_class_id AS hp_class_id,
+            hp.name AS hp_range,
+            tt.name AS transmission_type,
+            ft.name AS fuel_type,
+            SUM(ph.p) AS price_sum,
+            COUNT(*) AS ad_count
+        FROM `autotiming-prod.metrics.ad_tracker_history` ad,
+        UNNEST(price_history) AS ph
+        INNER JOIN `autotiming-prod.metrics.make` ma
+            ON ma.make_id = ad.make_id
+        INNER JOIN `autotiming-prod.metrics.model` mo
+            ON mo.model_id = ad.model_id
+        INNER JOIN `autotiming-prod.metrics.km_class` km
+            ON km.km_class_id = ad.km_class_id
+        INNER JOIN `autotiming-prod.metrics.hp_class` hp
+            ON hp.hp_class_id = ad.hp_class_id
+        INNER JOIN `autotiming-prod.metrics.transmission_type` tt
+            ON tt.transmission_type_id = ad.transmission_type_id
+        INNER JOIN `autotiming-prod.metrics.fuel_type` ft
+            ON ft.fuel_type_id = ad.fuel_type_id
+        WHERE (@since IS NULL OR ph.d >= @since)
+        GROUP BY ALL
+"""
+
+# Columns of the materialized table, in the order of AGGREGATE_QUERY
+COLUMNS = """
+            make_id,
+            make,
+            model_id,
+            model,
+            day,
+            year,
+            km_class_id,
+            km_range,
+            hp_class_id,
+            hp_range,
+            transmission_type,
+            fuel_type,
+            price_sum,
+            ad_count
+"""
+
+
+class Materialized:
+    """
+    Materialized per-make daily aggregate table (MATERIALIZED_TABLE).
+
+    The table holds the output of the UNNEST + six joins of the raw query for
+    every make, clustered by make_id and model_id, so reading one make only
+    scans that make's blocks of a pre-aggregated table. It is rebuilt or
+    incrementally refreshed by jobs/refresh_materialized.py; Queries reads
+    from it while its last modification is younger than MATERIALIZED_MAX_AGE
+    and falls back to the raw tables otherwise.
+    """
+
+    @staticmethod
+    def table() -> str:
+        return settings.MATERIALIZED_TABLE
+
+    @staticmethod
+    def refresh(client: bigquery.Client, incremental: bool = True) -> datetime.date:
+        """
+        Refresh the materialized table. An incremental refresh replaces the
+        days from REFRESH_OVERLAP_DAYS before the newest day on, in one
+        transaction; the table is rebuilt when missing or not incremental.
+        The script runs under the batch deadline and cost cap.
+        Args:
+            client: bigquery.Client
+            incremental: bool
+        Returns:
+            since: datetime.date, first day replaced, None on a rebuild
+        """
+        since = None
+        if incremental and Materialized.last_refresh(client) is not None:
+            rows = client.query(f"SELECT MAX(day) AS max_day FROM `{Materialized.table()}`").result()
+            max_day = next(iter(rows))[0]
+            if max_day is not None:
+                since = max_day - datetime.timedelta(days=settings.REFRESH_OVERLAP_DAYS)
+
+        if since is None:
+            script = f"""
+            CREATE OR REPLACE TABLE `{Materialized.table()}`
+            CLUSTER BY make_id, model_id
+            AS {AGGREGATE_QUERY}
+            """
+        else:
+            script = f"""
+            BEGIN TRANSACTION;
+            DELETE FROM `{Materialized.table()}` WHERE day >= @since;
+            INSERT INTO `{Materialized.table()}` ({COLUMNS}) {AGGREGATE_QUERY};
+            COMMIT TRANSACTION;
+            """
+        job_config = Resilience.job_config(
+            bigquery.QueryJobConfig(query_parameters=[bigquery.ScalarQueryParameter("since", "DATE", since)]),
+            settings.BATCH_QUERY_TIMEOUT,
+            settings.BATCH_MAX_BYTES_BILLED,
+        )
+        job = client.query(script, job_config=job_config)
+        job.result(timeout=settings.BATCH_QUERY_TIMEOUT or None)
+        Metrics.get_instance().count("autotiming_bigquery_bytes_processed_total", job.total_bytes_processed or 0)
+        Materialized.is_fresh.clear()
+        return since
+
+    @staticmethod
+    def last_refresh(client: bigquery.Client) -> datetime.datetime:
+        """
+        Get the last modification time of the materialized table, None if it
+        does not exist or routing is disabled
+        Args:
+            client: bigquery.Client
+        Returns:
+            datetime.datetime
+        """
+        if not Materialized.table():
+            return None
+        try:
+            return client.get_table(Materialized.table()).modified
+        except exceptions.NotFound:
+            return None
+
+    @staticmethod
+    @st.cache_data(ttl=60, show_spinner=False)
+    def is_fresh(_client: bigquery.Client) -> bool:
+        """
+        Whether reads can be served from the materialized table, checked at
+        most once a minute (table metadata, no bytes billed). Any failure to
+        read the metadata (permissions, transport, timeout) routes reads to
+        the raw tables until the next check. A table older than
+        MATERIALIZED_MAX_AGE is still read when the backend has no raw table
+        to fall back to, like a local copy synced without it.
+        Args:
+            client: bigquery.Client
+        Returns:
+            bool
+        """
+        try:
+            modified = Materialized.last_refresh(_client)
+        except Exception:
+            logger.warning("Metadata of %s unavailable, reading the raw tables", Materialized.table(), exc_info=True)
+            Metrics.get_instance().count("autotiming_materialized_check_failures_total")
+            return False
+        if modified is None:
+            return False
+        age = datetime.datetime.now(datetime.timezone.utc) - modified
+        if age.total_seconds() <= settings.MATERIALIZED_MAX_AGE:
+            return True
+        try:
+            _client.get_table(RAW_TABLE)
+        except exceptions.NotFound:
+            logger.warning("%s is stale but %s is missing, reading it anyway", Materialized.table(), RAW_TABLE)
+            return True
+        except Exception:
+            logger.warning("Metadata of %s unavailable", RAW_TABLE, exc_info=True)
+        return False
+
+    @staticmethod
+    def route(client: bigquery.Client, method: str) -> bool:
+        """
+        Decide whether a read is served from the materialized table or from
+        the raw tables, and count the decision. Reads fall back to the raw
+        tables whenever the table cannot be checked.
+        Args:
+            client: bigquery.Client
+            method: str, name of the Queries method reading
+        Returns:
+            bool, True to read the materialized table
+        """
+        materialized = Materialized.is_fresh(client)
+        Metrics.get_instance().count(
+            "autotiming_query_route_total", method=method, route="materialized" if materialized else "raw"
+        )
+        return materialized
@@ -0,0 +1,230 @@
+import collections
+import contextlib
+import functools
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import streamlit as st
+
+from aux_functions import settings
+
+logger = logging.getLogger("autotiming.metrics")
+
+
+class Metrics:
+    """
+    Process-wide timing and counter registry.
+
+    Every observation is logged as one JSON line on the autotiming.metrics
+    logger and aggregated into counters and summaries that are exported in the
+    Prometheus text format for the node exporter textfile collector. Each
+    process writes its own file next to METRICS_FILE (<name>_<pid>.prom) with
+    a pid label, so the counters of every process stay monotonic; files of
+    processes that are gone are removed. Stages timed from a script thread
+    are also kept per rerun for the debug panel.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = collections.defaultdict(float)
+        self.summaries = collections.defaultdict(lambda: [0.0, 0])
+        self._local = threading.local()
+        self._last_export = 0.0
+
+    @staticmethod
+    @st.cache_resource
+    def get_instance() -> "Metrics":
+        """
+        Get the process-wide metrics registry
+        Returns:
+            Metrics
+        """
+        return Metrics()
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple:
+        return (name, tuple(sorted(labels.items())))
+
+    def count(self, name: str, value: float = 1, **labels) -> None:
+        """
+        Increase a counter
+        Args:
+            name: str
+            value: float
+            labels: label values of the series
+        """
+        with self._lock:
+            self.counters[Metrics._key(name, labels)] += value
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({"metric": name, "value": value, **labels}, default=str))
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        """
+        Record a duration
+        Args:
+            name: str
+            seconds: float
+            labels: label values of the series
+        """
+        with self._lock:
+            summary = self.summaries[Metrics._key(name, labels)]
+            summary[0] += seconds
+            summary[1] += 1
+        stages = getattr(self._local, "stages", None)
+        if stages is not None:
+            stages.append({"metric": name, **labels, "ms": round(seconds * 1000, 2)})
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({"metric": name, "seconds": round(seconds, 6), **labels}, default=str))
+
+    @contextlib.contextmanager
+    def timer(self, name: str, **labels):
+        """
+        Time the body of a with block
+        Args:
+            name: str
+            labels: label values of the series
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def stage(self, stage: str):
+        """
+        Time a rendering stage of the app
+        Args:
+            stage: str
+        """
+        return self.timer("autotiming_stage_seconds", stage=stage)
+
+    def begin_run(self) -> None:
+        """
+        Start collecting the stages of the current rerun
+        """
+        self._local.stages = []
+
+    def end_run(self) -> list:
+        """
+        Stop collecting the stages of the current rerun and export the registry
+        Returns:
+            stages: list of dict
+        """
+        stages = getattr(self._local, "stages", None) or []
+        self._local.stages = None
+        self.export()
+        return stages
+
+    @staticmethod
+    def instrument(method: str):
+        """
+        Decorator timing a Queries method and counting its calls. Combined with
+        Metrics.cache_miss under the st.cache_data decorator, the difference
+        between calls and misses gives the cache hit rate.
+        Args:
+            method: str
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                metrics = Metrics.get_instance()
+                metrics.count("autotiming_query_calls_total", method=method)
+                with metrics.timer("autotiming_query_seconds", method=method):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @staticmethod
+    def cache_miss(func):
+        """
+        Decorator counting the executions of a cached function body, i.e. misses
+        """
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            Metrics.get_instance().count("autotiming_query_cache_misses_total", method=func.__name__)
+            return func(*args, **kwargs)
+        return wrapper
+
+    def render_prometheus(self, **labels) -> str:
+        """
+        Render the registry in the Prometheus text exposition format
+        Args:
+            labels: label values added to every series
+        Returns:
+            text: str
+        """
+        extra = tuple((k, str(v)) for k, v in labels.items())
+
+        def series(name, labels, suffix=""):
+            labels = extra + labels
+            if not labels:
+                return f"{name}{suffix}"
+            label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+            return f"{name}{suffix}{{{label_text}}}"
+
+        with self._lock:
+            counters = sorted(self.counters.items())
+            summaries = sorted(self.summaries.items())
+
+        lines = []
+        for name in sorted({name for (name, _), _ in counters}):
+            lines.append(f"# TYPE {name} counter")
+            lines += [f"{series(name, labels)} {value:g}" for (n, labels), value in counters if n == name]
+        for name in sorted({name for (name, _), _ in summaries}):
+            lines.append(f"# TYPE {name} summary")
+            for (n, labels), (total, count) in summaries:
+                if n == name:
+                    lines.append(f"{series(name, labels, '_sum')} {total:g}")
+                    lines.append(f"{series(name, labels, '_count')} {count}")
+        return "\n".join(lines) + "\n"
+
+    def export(self) -> None:
+        """
+        Write the Prometheus text of this process to its file next to
+        METRICS_FILE, at most every METRICS_EXPORT_INTERVAL seconds
+        """
+        if not settings.METRICS_FILE or time.monotonic() - self._last_export < settings.METRICS_EXPORT_INTERVAL:
+            return
+        self._last_export = time.monotonic()
+        directory = os.path.dirname(os.path.abspath(settings.METRICS_FILE))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".metrics.")
+        with os.fdopen(fd, "w") as f:
+            f.write(self.render_prometheus(pid=os.getpid()))
+        os.replace(tmp_path, Metrics.process_file(os.getpid()))
+        Metrics._remove_dead_files()
+
+    @staticmethod
+    def process_file(pid: int) -> str:
+        """
+        Get the metrics file of a process, METRICS_FILE with the pid appended
+        to its name (autotiming.prom -> autotiming_<pid>.prom)
+        Args:
+            pid: int
+        Returns:
+            path: str
+        """
+        root, ext = os.path.splitext(os.path.abspath(settings.METRICS_FILE))
+        return f"{root}_{pid}{ext or '.prom'}"
+
+    @staticmethod
+    def _remove_dead_files() -> None:
+        # the series of a process that is gone would otherwise be exported forever
+        root, ext = os.path.splitext(os.path.abspath(settings.METRICS_FILE))
+        prefix, suffix = f"{os.path.basename(root)}_", ext or ".prom"
+        for entry in os.scandir(os.path.dirname(root)):
+            if not (entry.name.startswith(prefix) and entry.name.endswith(suffix)):
+                continue
+            try:
+                os.kill(int(entry.name[len(prefix):-len(suffix)]), 0)
+            except ProcessLookupError:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+            except (ValueError, PermissionError):
+                pass
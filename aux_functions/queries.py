@@ -1,11 +1,28 @@
+from __future__ import annotations
+
+import datetime
+
 import streamlit as st
 import polars as pl
-from google.cloud import bigquery
+
+from aux_functions import settings
+from aux_functions.db_connect import DBConnect
+from aux_functions.disk_cache import DiskCache
+from aux_functions.executor import QueryExecutor
+from aux_functions.facets import SORT_COLUMNS
+from aux_functions.fetch import CATEGORICAL_COLUMNS, Fetch
+from aux_functions.lazy import LazyModule
+from aux_functions.materialized import COLUMNS, Materialized
+from aux_functions.metrics import Metrics
+
+bigquery = LazyModule("google.cloud.bigquery")
 
 class Queries:
 
     @staticmethod
+    @Metrics.instrument("get_all_makes")
     @st.cache_data(ttl=3600, show_spinner=False)
+    @Metrics.cache_miss
     def get_all_makes(_client: bigquery.Client) -> pl.DataFrame:
         """
         Get all makes
@@ -21,11 +38,12 @@ class Queries:
         FROM `autotiming-prod.metrics.make`
         ORDER BY make
         """
-        pandas_df = _client.query(query).to_dataframe()
-        return pl.from_pandas(pandas_df)
+        return QueryExecutor.get_instance().run(_client, query, bqstorage_client=DBConnect.get_storage_client())
 
     @staticmethod
+    @Metrics.instrument("get_models_for_make")
     @st.cache_data(ttl=3600, show_spinner=False)
+    @Metrics.cache_miss
     def get_models_for_make(_client: bigquery.Client, selected_make_id: int) -> pl.DataFrame:
         """
         Get all models for a make
@@ -48,110 +66,224 @@ class Queries:
                 bigquery.ScalarQueryParameter("selected_make_id", "INT64", selected_make_id),
             ]
         )
-        pandas_df = _client.query(query, job_config=job_config).to_dataframe()
-        return pl.from_pandas(pandas_df)
+        return QueryExecutor.get_instance().run(_client, query, job_config, DBConnect.get_storage_client())
 
     @staticmethod
-    @st.cache_data(ttl=3600, show_spinner=False)
-    def get_price_per_day(_client: bigquery.Client, selected_make_id: int, selected_model_id: int) -> pl.DataFrame:
+    @Metrics.instrument("load_dataset_by_make")
+    def load_dataset_by_make(_client: bigquery.Client, selected_make_id: int, max_age: float = None) -> pl.DataFrame:
         """
-        Get the price per day grouped by attributes given a make and model
+        Load a make dataset through the on-disk cache shared by all processes,
+        the loader of the dataset registry and of the background warm-up.
+        Entries older than max_age seconds (DATASET_TTL by default) are
+        refreshed incrementally.
         Args:
             client: bigquery.Client
             selected_make_id: int
-            selected_model_id: int
+            max_age: float
         Returns:
             df: pl.DataFrame
         """
-        query = """
-        SELECT
-            ph.d AS day,
-            year_manufactured AS year,
-            km.km_class_id AS km_class_id,
-            km.name AS km_range,
-            hp.hp_class_id AS hp_class_id,
-            hp.name AS hp_range,
-            tt.name AS transmission_type,
-            ft.name AS fuel_type,
-            CAST(AVG(ph.p) as INT) AS price
-        FROM `autotiming-prod.metrics.ad_tracker_history` ad,
-        UNNEST(price_history) AS ph
-        INNER JOIN `autotiming-prod.metrics.km_class` km 
-            ON km.km_class_id = ad.km_class_id
-        INNER JOIN `autotiming-prod.metrics.hp_class` hp
-            ON hp.hp_class_id = ad.hp_class_id
-        INNER JOIN `autotiming-prod.metrics.transmission_type` tt
-            ON tt.transmission_type_id = ad.transmission_type_id
-        INNER JOIN `autotiming-prod.metrics.fuel_type` ft
-            ON ft.fuel_type_id = ad.fuel_type_id
-        WHERE ad.make_id = @selected_make_id
-        AND ad.model_id = @selected_model_id
-        GROUP BY ALL
-        ORDER BY day
+        max_age = settings.DATASET_TTL if max_age is None else max_age
+        disk_cache = DiskCache.get_instance()
+        key = DiskCache.dataset_key(selected_make_id)
+        age = disk_cache.age(key)
+        cached = disk_cache.get(key) if age is not None else None
+        metrics = Metrics.get_instance()
+        if cached is not None and age <= max_age:
+            metrics.count("autotiming_disk_cache_total", result="hit")
+            return cached
+
+        if cached is not None and not cached.is_empty():
+            metrics.count("autotiming_disk_cache_total", result="refresh")
+            df = Queries.refresh_dataset_by_make(_client, selected_make_id, cached)
+        else:
+            metrics.count("autotiming_disk_cache_total", result="miss")
+            df = Queries.query_dataset_by_make(_client, selected_make_id)
+        # sorted so lazy scans of one selection skip most row groups
+        df = df.sort(SORT_COLUMNS)
+        disk_cache.put(key, df)
+        return df
+
+    @staticmethod
+    @Metrics.instrument("refresh_dataset_by_make")
+    def refresh_dataset_by_make(_client: bigquery.Client, selected_make_id: int, cached: pl.DataFrame) -> pl.DataFrame:
+        """
+        Incrementally refresh a cached make dataset: only the days from the
+        newest cached day minus REFRESH_OVERLAP_DAYS (late corrections) onwards
+        are queried, and they replace the same days in the cached frame. This
+        cuts the rows transferred and merged, not the bytes BigQuery scans:
+        the day filter applies to the unnested price history, and the raw
+        table is not partitioned or clustered by day.
+        Args:
+            client: bigquery.Client
+            selected_make_id: int
+            cached: pl.DataFrame
+        Returns:
+            df: pl.DataFrame
+        """
+        since = cached.select(pl.col("day").max()).item() - datetime.timedelta(days=settings.REFRESH_OVERLAP_DAYS)
+        fresh = Queries.query_dataset_by_make(_client, selected_make_id, since=since)
+        df = pl.concat(
+            [
+                cached.filter(pl.col("day") < since).cast({c: pl.String for c in CATEGORICAL_COLUMNS}),
+                fresh.cast({c: pl.String for c in CATEGORICAL_COLUMNS}),
+            ],
+            how="vertical_relaxed",
+        )
+        return Fetch.compact(df)
+
+    @staticmethod
+    @Metrics.instrument("query_dataset_by_make")
+    def query_dataset_by_make(_client: bigquery.Client, selected_make_id: int, since: datetime.date = None) -> pl.DataFrame:
+        """
+        Query the price per day grouped by all attributes filtered by make_id,
+        bypassing every cache. When since is given only days >= since are
+        returned, from a scan of the whole make.
+        Args:
+            client: bigquery.Client
+            selected_make_id: int
+            since: datetime.date
+        Returns:
+            df: pl.DataFrame
         """
+        if Materialized.route(_client, "query_dataset_by_make"):
+            query = f"""
+            SELECT {COLUMNS}
+            FROM `{Materialized.table()}`
+            WHERE make_id = @selected_make_id
+            AND (@since IS NULL OR day >= @since)
+            """
+        else:
+            query = """
+            SELECT
+                ad.make_id,
+                ma.name AS make,
+                ad.model_id,
+                mo.name AS model,
+                ph.d AS day,
+                year_manufactured AS year,
+                km.km_class_id AS km_class_id,
+                km.name AS km_range,
+                hp.hp_class_id AS hp_class_id,
+                hp.name AS hp_range,
+                tt.name AS transmission_type,
+                ft.name AS fuel_type,
+                SUM(ph.p) AS price_sum,
+                COUNT(*) AS ad_count
+            FROM `autotiming-prod.metrics.ad_tracker_history` ad,
+            UNNEST(price_history) AS ph
+            INNER JOIN `autotiming-prod.metrics.make` ma
+                ON ma.make_id = ad.make_id
+            INNER JOIN `autotiming-prod.metrics.model` mo
+                ON mo.model_id = ad.model_id
+            INNER JOIN `autotiming-prod.metrics.km_class` km 
+                ON km.km_class_id = ad.km_class_id
+            INNER JOIN `autotiming-prod.metrics.hp_class` hp
+                ON hp.hp_class_id = ad.hp_class_id
+            INNER JOIN `autotiming-prod.metrics.transmission_type` tt
+                ON tt.transmission_type_id = ad.transmission_type_id
+            INNER JOIN `autotiming-prod.metrics.fuel_type` ft
+                ON ft.fuel_type_id = ad.fuel_type_id
+            WHERE ad.make_id = @selected_make_id
+            AND (@since IS NULL OR ph.d >= @since)
+            GROUP BY ALL
+            """
         job_config = bigquery.QueryJobConfig(
             query_parameters=[
                 bigquery.ScalarQueryParameter("selected_make_id", "INT64", selected_make_id),
-                bigquery.ScalarQueryParameter("selected_model_id", "INT64", selected_model_id),
+                bigquery.ScalarQueryParameter("since", "DATE", since),
             ]
         )
-        query_job = _client.query(query, job_config=job_config)
-        pandas_df = query_job.to_dataframe()
-        return pl.from_pandas(pandas_df)
+        return QueryExecutor.get_instance().run(_client, query, job_config, DBConnect.get_storage_client())
 
     @staticmethod
-    @st.cache_data(ttl=3600, show_spinner=False)
-    def get_dataset_by_make(_client: bigquery.Client, selected_make_id: int) -> pl.DataFrame:
+    @Metrics.instrument("get_models_dataset")
+    @st.cache_data(ttl=settings.DATASET_TTL, max_entries=200, show_spinner=False)
+    @Metrics.cache_miss
+    def get_models_dataset(_client: bigquery.Client, models: tuple) -> pl.DataFrame:
         """
-        Get the price per day grouped by all attributes filtered by make_id
+        Get the price per day grouped by all attributes of several models in a
+        single query, the models are passed as array parameters
         Args:
             client: bigquery.Client
-            selected_make_id: int
+            models: tuple of (make_id, model_id) pairs, sorted so the same set
+                of models always hits the same cache entry
         Returns:
             df: pl.DataFrame
         """
-        query = """
-        SELECT
-            ad.make_id,
-            ma.name AS make,
-            ad.model_id,
-            mo.name AS model,
-            ph.d AS day,
-            year_manufactured AS year,
-            km.km_class_id AS km_class_id,
-            km.name AS km_range,
-            hp.hp_class_id AS hp_class_id,
-            hp.name AS hp_range,
-            tt.name AS transmission_type,
-            ft.name AS fuel_type,
-            CAST(AVG(ph.p) as INT) AS price
-        FROM `autotiming-prod.metrics.ad_tracker_history` ad,
-        UNNEST(price_history) AS ph
-        INNER JOIN `autotiming-prod.metrics.make` ma
-            ON ma.make_id = ad.make_id
-        INNER JOIN `autotiming-prod.metrics.model` mo
-            ON mo.model_id = ad.model_id
-        INNER JOIN `autotiming-prod.metrics.km_class` km 
-            ON km.km_class_id = ad.km_class_id
-        INNER JOIN `autotiming-prod.metrics.hp_class` hp
-            ON hp.hp_class_id = ad.hp_class_id
-        INNER JOIN `autotiming-prod.metrics.transmission_type` tt
-            ON tt.transmission_type_id = ad.transmission_type_id
-        INNER JOIN `autotiming-prod.metrics.fuel_type` ft
-            ON ft.fuel_type_id = ad.fuel_type_id
-        WHERE ad.make_id = @selected_make_id
-        GROUP BY ALL
-        """
+        if Materialized.route(_client, "get_models_dataset"):
+            query = f"""
+            SELECT
+                make_id,
+                model_id,
+                model,
+                day,
+                year,
+                km_class_id,
+                km_range,
+                hp_class_id,
+                hp_range,
+                transmission_type,
+                fuel_type,
+                price_sum,
+                ad_count
+            FROM `{Materialized.table()}`
+            WHERE make_id IN UNNEST(@make_ids)
+            AND model_id IN UNNEST(@model_ids)
+            """
+        else:
+            query = """
+            SELECT
+                ad.make_id,
+                ad.model_id,
+                mo.name AS model,
+                ph.d AS day,
+                year_manufactured AS year,
+                km.km_class_id AS km_class_id,
+                km.name AS km_range,
+                hp.hp_class_id AS hp_class_id,
+                hp.name AS hp_range,
+                tt.name AS transmission_type,
+                ft.name AS fuel_type,
+                SUM(ph.p) AS price_sum,
+                COUNT(*) AS ad_count
+            FROM `autotiming-prod.metrics.ad_tracker_history` ad,
+            UNNEST(price_history) AS ph
+            INNER JOIN `autotiming-prod.metrics.model` mo
+                ON mo.model_id = ad.model_id
+            INNER JOIN `autotiming-prod.metrics.km_class` km 
+                ON km.km_class_id = ad.km_class_id
+            INNER JOIN `autotiming-prod.metrics.hp_class` hp
+                ON hp.hp_class_id = ad.hp_class_id
+            INNER JOIN `autotiming-prod.metrics.transmission_type` tt
+                ON tt.transmission_type_id = ad.transmission_type_id
+            INNER JOIN `autotiming-prod.metrics.fuel_type` ft
+                ON ft.fuel_type_id = ad.fuel_type_id
+            WHERE ad.make_id IN UNNEST(@make_ids)
+            AND ad.model_id IN UNNEST(@model_ids)
+            GROUP BY ALL
+            """
         job_config = bigquery.QueryJobConfig(
             query_parameters=[
-                bigquery.ScalarQueryParameter("selected_make_id", "INT64", selected_make_id),
+                bigquery.ArrayQueryParameter("make_ids", "INT64", sorted({make_id for make_id, _ in models})),
+                bigquery.ArrayQueryParameter("model_ids", "INT64", sorted({model_id for _, model_id in models})),
             ]
         )
-        pandas_df = _client.query(query, job_config=job_config).to_dataframe()
-        return pl.from_pandas(pandas_df)
+        return QueryExecutor.get_instance().run(_client, query, job_config, DBConnect.get_storage_client())
+
+    @staticmethod
+    def weighted_price() -> pl.Expr:
+        """
+        Ad-weighted mean price of summed price_sum / ad_count columns
+        Returns:
+            pl.Expr
+        """
+        return (pl.col("price_sum") / pl.col("ad_count")).cast(pl.Int32).alias("price")
 
     @staticmethod
+    @Metrics.instrument("get_all_dataset")
     @st.cache_data(ttl=3600, show_spinner=False)
+    @Metrics.cache_miss
     def get_all_dataset(_client: bigquery.Client) -> pl.DataFrame:
         """
         Get the price per day grouped by all attributes
@@ -160,36 +292,59 @@ class Queries:
         Returns:
             df: pl.DataFrame
         """
-        query = """
-        SELECT
-            ad.make_id,
-            ma.name AS make,
-            ad.model_id,
-            mo.name AS model,
-            ph.d AS day,
-            year_manufactured AS year,
-            km.km_class_id AS km_class_id,
-            km.name AS km_range,
-            hp.hp_class_id AS hp_class_id,
-            hp.name AS hp_range,
-            tt.name AS transmission_type,
-            ft.name AS fuel_type,
-            CAST(AVG(ph.p) as INT) AS price
-        FROM `autotiming-prod.metrics.ad_tracker_history` ad,
-        UNNEST(price_history) AS ph
-        INNER JOIN `autotiming-prod.metrics.make` ma
-            ON ma.make_id = ad.make_id
-        INNER JOIN `autotiming-prod.metrics.model` mo
-            ON mo.model_id = ad.model_id
-        INNER JOIN `autotiming-prod.metrics.km_class` km 
-            ON km.km_class_id = ad.km_class_id
-        INNER JOIN `autotiming-prod.metrics.hp_class` hp
-            ON hp.hp_class_id = ad.hp_class_id
-        INNER JOIN `autotiming-prod.metrics.transmission_type` tt
-            ON tt.transmission_type_id = ad.transmission_type_id
-        INNER JOIN `autotiming-prod.metrics.fuel_type` ft
-            ON ft.fuel_type_id = ad.fuel_type_id
-        GROUP BY ALL
-        """
-        pandas_df = _client.query(query).to_dataframe()
-        return pl.from_pandas(pandas_df)
\ No newline at end of file
+        return Queries.query_all_dataset(_client)
+
+    @staticmethod
+    @Metrics.instrument("query_all_dataset")
+    def query_all_dataset(_client: bigquery.Client, batch: bool = False) -> pl.DataFrame:
+        """
+        Query the price per day grouped by all attributes, bypassing every cache.
+        Used by the nightly market snapshot, as a batch job.
+        Args:
+            client: bigquery.Client
+            batch: bool, run under the batch deadline and cost cap
+                (BATCH_QUERY_TIMEOUT, BATCH_MAX_BYTES_BILLED) instead of the
+                interactive ones
+        Returns:
+            df: pl.DataFrame
+        """
+        if Materialized.route(_client, "query_all_dataset"):
+            query = f"""
+            SELECT {COLUMNS}
+            FROM `{Materialized.table()}`
+            """
+        else:
+            query = """
+            SELECT
+                ad.make_id,
+                ma.name AS make,
+                ad.model_id,
+                mo.name AS model,
+                ph.d AS day,
+                year_manufactured AS year,
+                km.km_class_id AS km_class_id,
+                km.name AS km_range,
+                hp.hp_class_id AS hp_class_id,
+                hp.name AS hp_range,
+                tt.name AS transmission_type,
+                ft.name AS fuel_type,
+                SUM(ph.p) AS price_sum,
+                COUNT(*) AS ad_count
+            FROM `autotiming-prod.metrics.ad_tracker_history` ad,
+            UNNEST(price_history) AS ph
+            INNER JOIN `autotiming-prod.metrics.make` ma
+                ON ma.make_id = ad.make_id
+            INNER JOIN `autotiming-prod.metrics.model` mo
+                ON mo.model_id = ad.model_id
+            INNER JOIN `autotiming-prod.metrics.km_class` km 
+                ON km.km_class_id = ad.km_class_id
+            INNER JOIN `autotiming-prod.metrics.hp_class` hp
+                ON hp.hp_class_id = ad.hp_class_id
+            INNER JOIN `autotiming-prod.metrics.transmission_type` tt
+                ON tt.transmission_type_id = ad.transmission_type_id
+            INNER JOIN `autotiming-prod.metrics.fuel_type` ft
+                ON ft.fuel_type_id = ad.fuel_type_id
+            GROUP BY ALL
+            """
+        limits = (settings.BATCH_QUERY_TIMEOUT, settings.BATCH_MAX_BYTES_BILLED) if batch else (None, None)
+        return QueryExecutor.get_instance().run(_client, query, None, DBConnect.get_storage_client(), *limits)
\ No newline at end of file
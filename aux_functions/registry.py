@@ -0,0 +1,225 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import polars as pl
+import streamlit as st
+
+from aux_functions import settings
+from aux_functions.background import THREAD_PREFIX, quiet_background_threads
+from aux_functions.disk_cache import DiskCache
+from aux_functions.facets import FacetIndex
+from aux_functions.lazy import LazyModule
+from aux_functions.metrics import Metrics
+from aux_functions.queries import Queries
+
+bigquery = LazyModule("google.cloud.bigquery")
+
+logger = logging.getLogger(__name__)
+
+
+class DatasetEntry:
+    """
+    One immutable make dataset with its facet index, shared by every session
+    that has the make selected. The dataset is a lazy scan of a pinned Parquet
+    file when the on-disk cache has it, an in-memory frame otherwise. The pin
+    is released once the entry is no longer referenced. `age` is the age of
+    the data when the entry is created, for copies read back from disk.
+    """
+
+    def __init__(self, make_id: int, path: str = None, df: pl.DataFrame = None, age: float = 0.0):
+        self.make_id = make_id
+        self.df = df
+        self.lf = pl.scan_parquet(path) if path is not None else df.lazy()
+        if path is not None:
+            weakref.finalize(self, DiskCache.unpin, path)
+        self.fingerprint = FacetIndex.fingerprint(self.lf, path)
+        self.facets = FacetIndex(self.lf, DiskCache.get_instance(), make_id, self.fingerprint)
+        self.loaded_at = time.monotonic() - age
+        self.last_used = time.monotonic()
+        # session id -> last time the session used the entry
+        self.sessions = {}
+
+    def size(self) -> int:
+        """
+        Get the estimated bytes held in memory by the entry
+        Returns:
+            size: int
+        """
+        frame_size = self.df.estimated_size() if self.df is not None else 0
+        return frame_size + self.facets.estimated_size()
+
+
+class DatasetRegistry:
+    """
+    Process-wide registry holding one dataset per make instead of a copy per
+    session. Sessions acquire the make they have selected (and implicitly
+    release the previous one), so each entry is reference counted. Entries no
+    session holds are evicted least recently used first once the registry
+    exceeds REGISTRY_MAX_BYTES. Sessions that stop rerunning for
+    SESSION_TIMEOUT seconds are considered gone.
+
+    Expired datasets are served stale while revalidated: an entry (or on-disk
+    copy) older than DATASET_TTL but younger than DATASET_TTL + STALE_MAX_AGE
+    is returned at once and a background refresh replaces it when done. Only
+    makes with no usable copy block on BigQuery, and a failed refresh keeps
+    the stale entry in service.
+    """
+
+    def __init__(self, max_bytes: int, session_timeout: float):
+        self.max_bytes = max_bytes
+        self.session_timeout = session_timeout
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._session_makes = {}
+        self._load_locks = {}
+        self._revalidating = set()
+        self._pool = ThreadPoolExecutor(
+            max_workers=settings.WARM_CONCURRENCY, thread_name_prefix=f"{THREAD_PREFIX}-revalidate"
+        )
+
+    @staticmethod
+    @st.cache_resource
+    def get_instance() -> "DatasetRegistry":
+        """
+        Get the process-wide dataset registry
+        Returns:
+            DatasetRegistry
+        """
+        quiet_background_threads()
+        return DatasetRegistry(settings.REGISTRY_MAX_BYTES, settings.SESSION_TIMEOUT)
+
+    def acquire(self, session_id: str, client: bigquery.Client, make_id: int) -> DatasetEntry:
+        """
+        Get the dataset of a make for a session, loading it if needed
+        Args:
+            session_id: str
+            client: bigquery.Client
+            make_id: int
+        Returns:
+            DatasetEntry
+        """
+        with self._lock:
+            entry = self._servable_entry(make_id)
+            load_lock = self._load_locks.setdefault(make_id, threading.Lock())
+
+        if entry is None:
+            # one loader per make, the other sessions wait for its result
+            with load_lock:
+                with self._lock:
+                    entry = self._servable_entry(make_id)
+                if entry is None:
+                    entry = DatasetRegistry._load(client, make_id, settings.DATASET_TTL + settings.STALE_MAX_AGE)
+
+        if time.monotonic() - entry.loaded_at > settings.DATASET_TTL:
+            Metrics.get_instance().count("autotiming_registry_stale_total")
+            self._revalidate(client, make_id)
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._replace(entry)
+            self._release(session_id)
+            entry.sessions[session_id] = now
+            entry.last_used = now
+            self._session_makes[session_id] = make_id
+            self._evict(now)
+        return entry
+
+    def release(self, session_id: str) -> None:
+        """
+        Drop the reference of a session to its make
+        Args:
+            session_id: str
+        """
+        with self._lock:
+            self._release(session_id)
+
+    def size(self) -> int:
+        """
+        Get the estimated bytes held by the registry
+        Returns:
+            size: int
+        """
+        with self._lock:
+            return sum(entry.size() for entry in self._entries.values())
+
+    @staticmethod
+    def _load(client: bigquery.Client, make_id: int, max_age: float) -> DatasetEntry:
+        # the on-disk copy is used up to max_age seconds old, queried otherwise
+        disk_cache = DiskCache.get_instance()
+        key = DiskCache.dataset_key(make_id)
+        age = disk_cache.age(key)
+        path = disk_cache.pin(key, max_age=max_age)
+        if path is None:
+            df = Queries.load_dataset_by_make(client, make_id)
+            path, age = disk_cache.pin(key), 0.0
+            if path is None:
+                return DatasetEntry(make_id, df=df)
+        return DatasetEntry(make_id, path=path, age=age or 0.0)
+
+    def _servable_entry(self, make_id: int) -> DatasetEntry:
+        entry = self._entries.get(make_id)
+        if entry is None or time.monotonic() - entry.loaded_at > settings.DATASET_TTL + settings.STALE_MAX_AGE:
+            return None
+        return entry
+
+    def _replace(self, entry: DatasetEntry) -> DatasetEntry:
+        # keep the newest version of the make, a refresh may have finished meanwhile
+        current = self._entries.get(entry.make_id)
+        if current is not None and current is not entry:
+            if current.loaded_at > entry.loaded_at:
+                return current
+            # sessions holding the replaced version move to the new one
+            entry.sessions.update(current.sessions)
+            entry.last_used = max(entry.last_used, current.last_used)
+        self._entries[entry.make_id] = entry
+        return entry
+
+    def _revalidate(self, client: bigquery.Client, make_id: int) -> None:
+        with self._lock:
+            if make_id in self._revalidating:
+                return
+            self._revalidating.add(make_id)
+        self._pool.submit(self._refresh, client, make_id)
+
+    def _refresh(self, client: bigquery.Client, make_id: int) -> None:
+        try:
+            entry = DatasetRegistry._load(client, make_id, settings.DATASET_TTL)
+        except Exception:
+            # the stale entry stays in service, the next acquire tries again
+            Metrics.get_instance().count("autotiming_revalidations_total", result="error")
+            logger.exception("Refresh of make %s failed", make_id)
+        else:
+            Metrics.get_instance().count("autotiming_revalidations_total", result="ok")
+            with self._lock:
+                self._replace(entry)
+        finally:
+            with self._lock:
+                self._revalidating.discard(make_id)
+
+    def _release(self, session_id: str) -> None:
+        make_id = self._session_makes.pop(session_id, None)
+        entry = self._entries.get(make_id)
+        if entry is not None:
+            entry.sessions.pop(session_id, None)
+
+    def _evict(self, now: float) -> None:
+        for entry in self._entries.values():
+            for session_id, last_seen in list(entry.sessions.items()):
+                if now - last_seen > self.session_timeout:
+                    del entry.sessions[session_id]
+                    self._session_makes.pop(session_id, None)
+
+        sizes = {make_id: entry.size() for make_id, entry in self._entries.items()}
+        total = sum(sizes.values())
+        idle = sorted((entry for entry in self._entries.values() if not entry.sessions), key=lambda e: e.last_used)
+        for entry in idle:
+            if total <= self.max_bytes:
+                break
+            del self._entries[entry.make_id]
+            total -= sizes[entry.make_id]
+            Metrics.get_instance().count("autotiming_registry_evictions_total")
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import logging
+import random
+import time
+
+from aux_functions import settings
+from aux_functions.lazy import LazyModule
+from aux_functions.metrics import Metrics
+
+bigquery = LazyModule("google.cloud.bigquery")
+exceptions = LazyModule("google.api_core.exceptions")
+requests_exceptions = LazyModule("requests.exceptions")
+
+logger = logging.getLogger(__name__)
+
+
+class Resilience:
+    """
+    Failure handling of BigQuery jobs.
+
+    Every call gets a deadline (QUERY_TIMEOUT for the interactive path,
+    BATCH_QUERY_TIMEOUT for the batch jobs, enforced by BigQuery through
+    job_timeout_ms and by the client while waiting) and a cost cap
+    (MAX_BYTES_BILLED / BATCH_MAX_BYTES_BILLED). Transient failures (5xx,
+    rate limits, dropped connections) are retried up to QUERY_RETRIES times
+    with full jitter backoff, so concurrent callers hit by the same hiccup do
+    not retry in lockstep. The deadline bounds the whole call, retries
+    included: a deadline hit is not retried and no retry starts once its
+    backoff would end past the deadline. Other errors, such as a query over
+    the cost cap, are raised at once.
+    """
+
+    @staticmethod
+    def job_config(
+        job_config: bigquery.QueryJobConfig = None,
+        timeout: float = None,
+        max_bytes_billed: int = None,
+    ) -> bigquery.QueryJobConfig:
+        """
+        Apply a deadline and cost cap to a job configuration, unless the
+        caller set its own
+        Args:
+            job_config: bigquery.QueryJobConfig
+            timeout: float, seconds, QUERY_TIMEOUT when None, no deadline when 0
+            max_bytes_billed: int, MAX_BYTES_BILLED when None, no cap when 0
+        Returns:
+            job_config: bigquery.QueryJobConfig
+        """
+        timeout = settings.QUERY_TIMEOUT if timeout is None else timeout
+        max_bytes_billed = settings.MAX_BYTES_BILLED if max_bytes_billed is None else max_bytes_billed
+        job_config = job_config if job_config is not None else bigquery.QueryJobConfig()
+        if timeout and job_config.job_timeout_ms is None:
+            job_config.job_timeout_ms = int(timeout * 1000)
+        if max_bytes_billed and job_config.maximum_bytes_billed is None:
+            job_config.maximum_bytes_billed = max_bytes_billed
+        return job_config
+
+    @staticmethod
+    def retryable(error: Exception) -> bool:
+        """
+        Whether a failed job is worth retrying
+        Args:
+            error: Exception
+        Returns:
+            bool
+        """
+        # the client raises requests' errors, not the builtin ones, on dropped connections
+        transient = (
+            exceptions.ServerError,
+            exceptions.TooManyRequests,
+            ConnectionError,
+            requests_exceptions.ConnectionError,
+            requests_exceptions.ChunkedEncodingError,
+        )
+        return isinstance(error, transient)
+
+    @staticmethod
+    def backoff(attempt: int) -> float:
+        """
+        Get the seconds to wait before a retry, drawn uniformly up to an
+        exponentially growing bound (full jitter)
+        Args:
+            attempt: int, 0 for the first retry
+        Returns:
+            seconds: float
+        """
+        return random.uniform(0, min(settings.RETRY_MAX_DELAY, settings.RETRY_BASE_DELAY * 2 ** attempt))
+
+    @staticmethod
+    def call(func, *args, timeout: float = None):
+        """
+        Call a function running a BigQuery job, retrying transient failures
+        within a deadline. func gets the seconds left before the deadline as
+        its timeout keyword argument (None without deadline).
+        Args:
+            func: callable
+            args: positional arguments of func
+            timeout: float, seconds the call may take, retries included,
+                QUERY_TIMEOUT when None, no deadline when 0
+        Returns:
+            the result of func
+        """
+        timeout = settings.QUERY_TIMEOUT if timeout is None else timeout
+        metrics = Metrics.get_instance()
+        start = time.monotonic()
+        for attempt in range(settings.QUERY_RETRIES + 1):
+            remaining = timeout - (time.monotonic() - start) if timeout else None
+            try:
+                return func(*args, timeout=remaining)
+            except Exception as e:
+                delay = Resilience.backoff(attempt)
+                past_deadline = timeout and time.monotonic() - start + delay >= timeout
+                if attempt == settings.QUERY_RETRIES or past_deadline or not Resilience.retryable(e):
+                    metrics.count("autotiming_query_failures_total", error=type(e).__name__)
+                    raise
+                metrics.count("autotiming_query_retries_total", error=type(e).__name__)
+                logger.warning("BigQuery job failed (%s: %s), retry %d in %.2fs",
+                               type(e).__name__, e, attempt + 1, delay)
+                time.sleep(delay)
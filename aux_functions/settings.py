@@ -0,0 +1,116 @@
+import os
+import tempfile
+
+# Directory shared by every Streamlit process on the node for on-disk caches
+CACHE_DIR = os.environ.get(
+    "AUTOTIMING_CACHE_DIR", os.path.join(tempfile.gettempdir(), "autotiming_cache")
+)
+
+# Upper bound for the on-disk dataset cache, least recently used files go first
+CACHE_MAX_BYTES = int(os.environ.get("AUTOTIMING_CACHE_MAX_MB", "2048")) * 1024 * 1024
+
+# Seconds a cached make dataset is served before it is refreshed from BigQuery
+DATASET_TTL = int(os.environ.get("AUTOTIMING_DATASET_TTL", "3600"))
+
+# Days before the newest cached day re-queried on an incremental refresh, to
+# pick up late price corrections. Only these days are transferred, the query
+# still scans the whole make (the raw table is not partitioned by day).
+REFRESH_OVERLAP_DAYS = int(os.environ.get("AUTOTIMING_REFRESH_OVERLAP_DAYS", "3"))
+
+# Make ids warmed at server start, comma separated. When empty the most
+# selected makes recorded in the access statistics are used instead.
+WARM_MAKES = [int(m) for m in os.environ.get("AUTOTIMING_WARM_MAKES", "").split(",") if m.strip()]
+
+# Number of most selected makes warmed when WARM_MAKES is empty
+WARM_TOP_N = int(os.environ.get("AUTOTIMING_WARM_TOP_N", "10"))
+
+# Concurrent BigQuery fetches of the warm-up pool
+WARM_CONCURRENCY = int(os.environ.get("AUTOTIMING_WARM_CONCURRENCY", "2"))
+
+# Seconds between warm-up passes, each pass re-warms datasets that would expire
+# within the next two intervals
+WARM_INTERVAL = int(os.environ.get("AUTOTIMING_WARM_INTERVAL", "300"))
+
+# BigQuery jobs running at the same time per process, further queries queue
+MAX_CONCURRENT_QUERIES = int(os.environ.get("AUTOTIMING_MAX_CONCURRENT_QUERIES", "4"))
+
+# Prometheus text file the metrics registry is exported to, for the node
+# exporter textfile collector. Each process writes <name>_<pid>.prom next to
+# it, with a pid label. Disabled when empty.
+METRICS_FILE = os.environ.get("AUTOTIMING_METRICS_FILE", "")
+
+# Minimum seconds between two exports of the metrics file
+METRICS_EXPORT_INTERVAL = int(os.environ.get("AUTOTIMING_METRICS_EXPORT_INTERVAL", "15"))
+
+# Token enabling the timing panel with ?debug=<token>. Disabled when empty.
+DEBUG_TOKEN = os.environ.get("AUTOTIMING_DEBUG_TOKEN", "")
+
+# Maximum points of the price chart, longer series are downsampled with LTTB
+CHART_MAX_POINTS = int(os.environ.get("AUTOTIMING_CHART_MAX_POINTS", "400"))
+
+# Memory budget of the in-process dataset registry. Makes no session holds are
+# evicted least recently used first beyond it.
+REGISTRY_MAX_BYTES = int(os.environ.get("AUTOTIMING_REGISTRY_MAX_MB", "1024")) * 1024 * 1024
+
+# Seconds without a rerun after which a session no longer holds its make
+SESSION_TIMEOUT = int(os.environ.get("AUTOTIMING_SESSION_TIMEOUT", "1800"))
+
+# Directory of the nightly market snapshots (partitioned Parquet)
+SNAPSHOT_DIR = os.environ.get("AUTOTIMING_SNAPSHOT_DIR", os.path.join(CACHE_DIR, "snapshots"))
+
+# Number of market snapshots kept, older ones are deleted after a build
+SNAPSHOT_KEEP = int(os.environ.get("AUTOTIMING_SNAPSHOT_KEEP", "3"))
+
+# Maximum number of series of the comparison page
+COMPARE_MAX_SERIES = int(os.environ.get("AUTOTIMING_COMPARE_MAX_SERIES", "5"))
+
+# Materialized per-make daily aggregate table reads are routed to while fresh,
+# e.g. autotiming-prod.metrics.make_daily_prices. Routing is disabled when
+# empty, the default.
+MATERIALIZED_TABLE = os.environ.get("AUTOTIMING_MATERIALIZED_TABLE", "")
+
+# Seconds since its last refresh the materialized table is still read from
+MATERIALIZED_MAX_AGE = int(os.environ.get("AUTOTIMING_MATERIALIZED_MAX_AGE", "7200"))
+
+# Directory of the CSV/Parquet exports of the app
+EXPORT_DIR = os.environ.get("AUTOTIMING_EXPORT_DIR", os.path.join(CACHE_DIR, "exports"))
+
+# Exports written at the same time per process, further exports queue
+EXPORT_CONCURRENCY = int(os.environ.get("AUTOTIMING_EXPORT_CONCURRENCY", "2"))
+
+# Seconds an export file is kept for download before it is deleted
+EXPORT_MAX_AGE = int(os.environ.get("AUTOTIMING_EXPORT_MAX_AGE", "3600"))
+
+# Seconds an interactive BigQuery query may take, retries included, before its
+# job is cancelled. 0 disables.
+QUERY_TIMEOUT = float(os.environ.get("AUTOTIMING_QUERY_TIMEOUT", "60"))
+
+# Bytes a single interactive BigQuery job may bill, jobs above it fail without
+# running. 0 disables.
+MAX_BYTES_BILLED = int(float(os.environ.get("AUTOTIMING_MAX_GB_BILLED", "50")) * 1024 ** 3)
+
+# Deadline and cost cap of the batch jobs (market snapshot, materialized table
+# refresh), which read the whole market. 0 disables, the default.
+BATCH_QUERY_TIMEOUT = float(os.environ.get("AUTOTIMING_BATCH_QUERY_TIMEOUT", "0"))
+BATCH_MAX_BYTES_BILLED = int(float(os.environ.get("AUTOTIMING_BATCH_MAX_GB_BILLED", "0")) * 1024 ** 3)
+
+# Retries of a BigQuery job failing with a transient error (5xx, rate limit, timeout)
+QUERY_RETRIES = int(os.environ.get("AUTOTIMING_QUERY_RETRIES", "3"))
+
+# Bounds in seconds of the jittered exponential backoff between retries
+RETRY_BASE_DELAY = float(os.environ.get("AUTOTIMING_RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.environ.get("AUTOTIMING_RETRY_MAX_DELAY", "8"))
+
+# Seconds past DATASET_TTL an expired make dataset is still served while it is
+# refreshed in the background. Older datasets are reloaded before being shown.
+STALE_MAX_AGE = int(os.environ.get("AUTOTIMING_STALE_MAX_AGE", "86400"))
+
+# Data backend: "bigquery", or "duckdb" to run the same queries locally on the
+# Parquet tables of LOCAL_DATA_DIR (see jobs/sync_local.py)
+BACKEND = os.environ.get("AUTOTIMING_BACKEND", "bigquery")
+
+# Directory of the Parquet tables served by the duckdb backend
+LOCAL_DATA_DIR = os.environ.get("AUTOTIMING_LOCAL_DATA_DIR", os.path.join(CACHE_DIR, "local"))
+
+# DuckDB database file of the duckdb backend, for the tables the app writes
+LOCAL_DATABASE = os.environ.get("AUTOTIMING_LOCAL_DATABASE", ":memory:")
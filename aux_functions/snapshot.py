@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import datetime
+import os
+import shutil
+import tempfile
+
+import polars as pl
+import streamlit as st
+
+from aux_functions import settings
+from aux_functions.lazy import LazyModule
+from aux_functions.queries import Queries
+
+bigquery = LazyModule("google.cloud.bigquery")
+
+CURRENT_FILE = "CURRENT"
+
+# Row order inside each make partition, rows of a model are contiguous so
+# row-group statistics skip the rest of the make when scanning one model
+SORT_COLUMNS = ["make_id", "model_id", "day"]
+
+
+class Snapshot:
+    """
+    Nightly columnar copy of the whole market (get_all_dataset output).
+
+    Each build writes a Parquet dataset partitioned by make_id
+    (<id>/make_id=<n>/0.parquet) into a temporary directory, renames it into
+    place and then switches the CURRENT pointer file, so readers always see a
+    complete snapshot. The last SNAPSHOT_KEEP snapshots are kept, older ones are
+    deleted. Market analyses scan the current snapshot lazily instead of
+    querying BigQuery.
+    """
+
+    def __init__(self, directory: str, keep: int):
+        self.directory = directory
+        self.keep = keep
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    @st.cache_resource
+    def get_instance() -> "Snapshot":
+        """
+        Get the process-wide snapshot store configured from settings
+        Returns:
+            Snapshot
+        """
+        return Snapshot(settings.SNAPSHOT_DIR, settings.SNAPSHOT_KEEP)
+
+    def current(self) -> str:
+        """
+        Get the id of the current snapshot, None if none was built yet
+        Returns:
+            snapshot_id: str
+        """
+        try:
+            with open(os.path.join(self.directory, CURRENT_FILE)) as f:
+                snapshot_id = f.read().strip()
+        except FileNotFoundError:
+            return None
+        return snapshot_id if os.path.isdir(os.path.join(self.directory, snapshot_id)) else None
+
+    def scan(self, snapshot_id: str) -> pl.LazyFrame:
+        """
+        Lazily scan a snapshot, the make_id partitions are pruned by filters
+        Args:
+            snapshot_id: str
+        Returns:
+            lf: pl.LazyFrame
+        """
+        return pl.scan_parquet(
+            os.path.join(self.directory, snapshot_id, "**", "*.parquet"),
+            hive_partitioning=True,
+            hive_schema={"make_id": pl.Int32},
+        )
+
+    def build(self, client: bigquery.Client) -> str:
+        """
+        Query the whole market and publish it as the current snapshot
+        Args:
+            client: bigquery.Client
+        Returns:
+            snapshot_id: str
+        """
+        df = Queries.query_all_dataset(client, batch=True).sort(SORT_COLUMNS)
+        snapshot_id = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%S")
+
+        tmp_dir = tempfile.mkdtemp(dir=self.directory, prefix=".build-")
+        try:
+            df.write_parquet(tmp_dir, partition_by="make_id")
+            os.rename(tmp_dir, os.path.join(self.directory, snapshot_id))
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        fd, tmp_pointer = tempfile.mkstemp(dir=self.directory, prefix=".current-")
+        with os.fdopen(fd, "w") as f:
+            f.write(snapshot_id)
+        os.replace(tmp_pointer, os.path.join(self.directory, CURRENT_FILE))
+
+        self._prune(snapshot_id)
+        return snapshot_id
+
+    def _prune(self, current: str) -> None:
+        snapshots = sorted(
+            name for name in os.listdir(self.directory)
+            if not name.startswith(".") and name != CURRENT_FILE
+            and os.path.isdir(os.path.join(self.directory, name))
+        )
+        # processes may still be scanning the previous snapshots, keep a few
+        for name in snapshots[:-self.keep] if self.keep > 0 else []:
+            if name != current:
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
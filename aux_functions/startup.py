@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+
+import polars as pl
+import streamlit as st
+
+from aux_functions.background import THREAD_PREFIX, quiet_background_threads
+from aux_functions.db_connect import DBConnect
+from aux_functions.disk_cache import DiskCache
+from aux_functions.lazy import LazyModule
+from aux_functions.queries import Queries
+from aux_functions.warmup import Warmup
+
+bigquery = LazyModule("google.cloud.bigquery")
+
+# Disk cache key of the make list of the last start
+MAKES_KEY = "makes"
+
+
+class Startup:
+    """
+    Process start-up work kept off the first render. The BigQuery client is
+    created, the warm-up started and a fresh make list queried on a background
+    thread; meanwhile sessions are served the make list saved on disk by the
+    previous start, so the make selectbox renders without waiting for
+    BigQuery. Only the very first start on a node waits for the query.
+    """
+
+    def __init__(self):
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"{THREAD_PREFIX}-startup")
+        self._client = self._pool.submit(DBConnect.get_client)
+        self._makes = self._pool.submit(self._load_makes)
+
+    @staticmethod
+    @st.cache_resource
+    def get_instance() -> "Startup":
+        """
+        Start the background start-up once per process
+        Returns:
+            Startup
+        """
+        quiet_background_threads()
+        return Startup()
+
+    def _load_makes(self) -> pl.DataFrame:
+        client = self._client.result()
+        Warmup.start(client)
+        makes_df = Queries.get_all_makes(client)
+        DiskCache.get_instance().put(MAKES_KEY, makes_df)
+        return makes_df
+
+    def client(self) -> bigquery.Client:
+        """
+        Get the bigquery client, waiting for it if it is still being created
+        Returns:
+            bigquery.Client
+        """
+        return self._client.result()
+
+    def makes(self) -> pl.DataFrame:
+        """
+        Get the make list, the copy saved on disk until the fresh one is loaded
+        Returns:
+            df: pl.DataFrame
+        """
+        if not self._makes.done():
+            cached = DiskCache.get_instance().get(MAKES_KEY)
+            if cached is not None:
+                return cached
+        # raises the start-up error, if any
+        self._makes.result()
+        return Queries.get_all_makes(self.client())
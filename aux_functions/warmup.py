@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import collections
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+
+from aux_functions import settings
+from aux_functions.background import THREAD_PREFIX, quiet_background_threads
+from aux_functions.lazy import LazyModule
+from aux_functions.queries import Queries
+
+bigquery = LazyModule("google.cloud.bigquery")
+
+logger = logging.getLogger(__name__)
+
+ACCESS_STATS_FILE = "access_stats.json"
+
+
+class Warmup:
+    """
+    Background warm-up of the make dataset cache.
+
+    A daemon thread runs one pass at start and then every WARM_INTERVAL
+    seconds. Each pass loads the configured makes (or the most selected ones
+    from the access statistics shared by all processes) through a bounded
+    thread pool with Queries.load_dataset_by_make, the loader of the dataset
+    registry, refreshing any dataset that would expire before the next pass,
+    so sessions selecting a popular make get it from a fresh on-disk copy.
+    """
+
+    def __init__(self, client: bigquery.Client):
+        self.client = client
+        self.accesses = collections.Counter()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(
+            max_workers=settings.WARM_CONCURRENCY, thread_name_prefix=f"{THREAD_PREFIX}-warmup"
+        )
+        self._thread = threading.Thread(
+            target=self._loop, name=f"{THREAD_PREFIX}-warmup-scheduler", daemon=True
+        )
+
+    @staticmethod
+    @st.cache_resource
+    def start(_client: bigquery.Client) -> "Warmup":
+        """
+        Start the warm-up scheduler once per process
+        Args:
+            client: bigquery.Client
+        Returns:
+            Warmup
+        """
+        quiet_background_threads()
+        warmup = Warmup(_client)
+        warmup._thread.start()
+        return warmup
+
+    def record_access(self, make_id: int) -> None:
+        """
+        Count a make selection, flushed to the shared statistics on each pass
+        Args:
+            make_id: int
+        """
+        with self._lock:
+            self.accesses[make_id] += 1
+
+    def popular_makes(self) -> list:
+        """
+        Get the make ids to warm
+        Returns:
+            make_ids: list
+        """
+        if settings.WARM_MAKES:
+            return settings.WARM_MAKES
+        stats = self._flush_access_stats()
+        return [make_id for make_id, _ in stats.most_common(settings.WARM_TOP_N)]
+
+    def run_once(self) -> None:
+        """
+        Warm every popular make, refreshing those that expire before the next pass
+        """
+        max_age = max(settings.DATASET_TTL - 2 * settings.WARM_INTERVAL, 0)
+        make_ids = self.popular_makes()
+        futures = {
+            make_id: self._pool.submit(Queries.load_dataset_by_make, self.client, make_id, max_age)
+            for make_id in make_ids
+        }
+        for make_id, future in futures.items():
+            try:
+                future.result()
+            except Exception:
+                logger.exception("Warm-up of make %s failed", make_id)
+
+    def _loop(self) -> None:
+        while True:
+            started = time.monotonic()
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("Warm-up pass failed")
+            time.sleep(max(settings.WARM_INTERVAL - (time.monotonic() - started), 0))
+
+    def _flush_access_stats(self) -> collections.Counter:
+        # merge this process' selections into the file shared by all processes
+        path = os.path.join(settings.CACHE_DIR, ACCESS_STATS_FILE)
+        with self._lock:
+            accesses, self.accesses = self.accesses, collections.Counter()
+        if not accesses:
+            return Warmup._read_access_stats(path)
+
+        os.makedirs(settings.CACHE_DIR, exist_ok=True)
+        # the read-modify-write is serialized across processes, or concurrent
+        # flushes would drop each other's counts
+        with open(f"{path}.lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                stats = Warmup._read_access_stats(path)
+                stats.update(accesses)
+                fd, tmp_path = tempfile.mkstemp(dir=settings.CACHE_DIR, prefix=f".{ACCESS_STATS_FILE}.")
+                with os.fdopen(fd, "w") as f:
+                    json.dump({str(k): v for k, v in stats.items()}, f)
+                os.replace(tmp_path, path)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        return stats
+
+    @staticmethod
+    def _read_access_stats(path: str) -> collections.Counter:
+        stats = collections.Counter()
+        try:
+            with open(path) as f:
+                stats.update({int(k): v for k, v in json.load(f).items()})
+        except (FileNotFoundError, ValueError):
+            pass
+        return stats
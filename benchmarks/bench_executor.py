@@ -0,0 +1,59 @@
+"""
+Simulate a spike of sessions selecting uncached makes at once and compare
+calling the client directly against going through QueryExecutor (single-flight
+deduplication plus a bound on concurrent jobs):
+
+    python benchmarks/bench_executor.py --sessions 32 --makes 4 --latency 0.5
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.cloud import bigquery
+
+from benchmarks.fake_bigquery import FakeClient
+from aux_functions.executor import QueryExecutor
+from aux_functions.fetch import Fetch
+
+QUERY = "SELECT * FROM `autotiming-prod.metrics.ad_tracker_history` WHERE make_id = @selected_make_id"
+
+
+def job_config(make_id: int) -> bigquery.QueryJobConfig:
+    return bigquery.QueryJobConfig(
+        query_parameters=[bigquery.ScalarQueryParameter("selected_make_id", "INT64", make_id)]
+    )
+
+
+def spike(fetch, sessions: int, makes: int) -> float:
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as sessions_pool:
+        frames = list(sessions_pool.map(lambda i: fetch(QUERY, job_config(i % makes + 1)), range(sessions)))
+    assert all(df.height for df in frames)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=32)
+    parser.add_argument("--makes", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--max-jobs", type=int, default=4)
+    parser.add_argument("--rows", type=int, default=200_000)
+    args = parser.parse_args()
+
+    client = FakeClient(n_rows=args.rows, latency=args.latency, n_makes=args.makes)
+    seconds = spike(lambda q, c: Fetch.query_to_polars(client, q, c), args.sessions, args.makes)
+    print(f"  direct: {seconds:6.2f}s  jobs {len(client.queries):>3}  peak concurrent jobs {client.max_in_flight:>3}")
+
+    client = FakeClient(n_rows=args.rows, latency=args.latency, n_makes=args.makes)
+    executor = QueryExecutor(args.max_jobs)
+    seconds = spike(lambda q, c: executor.run(client, q, c), args.sessions, args.makes)
+    print(f"executor: {seconds:6.2f}s  jobs {len(client.queries):>3}  peak concurrent jobs {client.max_in_flight:>3}")
+
+
+if __name__ == "__main__":
+    main()
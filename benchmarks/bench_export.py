@@ -0,0 +1,95 @@
+"""
+Compare writing an export of a make by collecting it and writing the frame
+against streaming it with a Polars sink (ExportManager).
+
+A make dataset is written to a Parquet file sorted like the on-disk cache,
+then each (path, format) runs in its own subprocess so peak RSS is measured in
+isolation:
+
+    python benchmarks/bench_export.py --rows 5000000
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def run_path(path: str, file_format: str, source: str) -> dict:
+    import polars as pl
+    from aux_functions.disk_cache import ROW_GROUP_SIZE
+
+    lf = pl.scan_parquet(source)
+    target = os.path.join(os.path.dirname(source), f"export_{path}.{file_format}")
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    if path == "collect":
+        df = lf.collect()
+        if file_format == "parquet":
+            df.write_parquet(target, row_group_size=ROW_GROUP_SIZE)
+        else:
+            df.write_csv(target)
+    elif file_format == "parquet":
+        lf.sink_parquet(target, row_group_size=ROW_GROUP_SIZE, engine="streaming")
+    else:
+        lf.sink_csv(target, engine="streaming")
+    elapsed = time.perf_counter() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "path": path,
+        "format": file_format,
+        "seconds": round(elapsed, 3),
+        "peak_rss_delta_mb": round((peak_rss - baseline_rss) / 1024, 1),
+        "file_mb": round(os.path.getsize(target) / 1024 / 1024, 1),
+    }
+
+
+def build_source(rows: int, source: str) -> None:
+    import polars as pl
+    from benchmarks.fake_bigquery import synthetic_dataset
+    from aux_functions.disk_cache import ROW_GROUP_SIZE
+    from aux_functions.facets import SORT_COLUMNS
+
+    df = pl.from_arrow(synthetic_dataset(rows, n_makes=1)).sort(SORT_COLUMNS)
+    df.write_parquet(source, statistics=True, row_group_size=ROW_GROUP_SIZE)
+    print(f"make dataset: {df.height:,} rows, {df.estimated_size('mb'):.1f} MB in memory")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--path", choices=["build", "collect", "sink"])
+    parser.add_argument("--format", choices=["csv", "parquet"])
+    parser.add_argument("--source")
+    args = parser.parse_args()
+
+    if args.path == "build":
+        return build_source(args.rows, args.source)
+    if args.path:
+        print(json.dumps(run_path(args.path, args.format, args.source)))
+        return
+
+    with tempfile.TemporaryDirectory(prefix="autotiming_export_") as directory:
+        # built in a subprocess too, the peak RSS of a process survives exec
+        source = os.path.join(directory, "make.parquet")
+        subprocess.run([sys.executable, __file__, "--path", "build", "--rows", str(args.rows), "--source", source],
+                       check=True)
+
+        for file_format in ["csv", "parquet"]:
+            for path in ["collect", "sink"]:
+                out = subprocess.run(
+                    [sys.executable, __file__, "--path", path, "--format", file_format, "--source", source],
+                    check=True, capture_output=True, text=True,
+                )
+                result = json.loads(out.stdout.strip().splitlines()[-1])
+                print(f"{result['format']:>8} {result['path']:>8}: {result['seconds']:>7.3f}s  "
+                      f"peak RSS +{result['peak_rss_delta_mb']:>7.1f} MB  file {result['file_mb']:>7.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
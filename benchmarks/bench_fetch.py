@@ -0,0 +1,66 @@
+"""
+Compare the pandas round-trip fetch path against the Arrow-native one.
+
+Each path runs in its own subprocess so peak RSS is measured in isolation:
+
+    python benchmarks/bench_fetch.py --rows 2000000
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+QUERY = "SELECT * FROM `autotiming-prod.metrics.ad_tracker_history`"
+
+
+def run_path(path: str, rows: int) -> dict:
+    import polars as pl
+    from benchmarks.fake_bigquery import FakeClient
+    from aux_functions.fetch import Fetch
+
+    client = FakeClient(n_rows=rows, n_makes=1)
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    if path == "pandas":
+        df = pl.from_pandas(client.query(QUERY).to_dataframe())
+    else:
+        df = Fetch.query_to_polars(client, QUERY)
+    elapsed = time.perf_counter() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "path": path,
+        "rows": df.height,
+        "seconds": round(elapsed, 3),
+        "peak_rss_delta_mb": round((peak_rss - baseline_rss) / 1024, 1),
+        "frame_mb": round(df.estimated_size("mb"), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--path", choices=["pandas", "arrow"])
+    args = parser.parse_args()
+
+    if args.path:
+        print(json.dumps(run_path(args.path, args.rows)))
+        return
+
+    for path in ["pandas", "arrow"]:
+        out = subprocess.run(
+            [sys.executable, __file__, "--path", path, "--rows", str(args.rows)],
+            check=True, capture_output=True, text=True,
+        )
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        print(f"{result['path']:>6}: {result['seconds']:>7.3f}s  "
+              f"peak RSS +{result['peak_rss_delta_mb']:>7.1f} MB  "
+              f"frame {result['frame_mb']:>6.1f} MB  ({result['rows']} rows)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Cost of a make dataset cache miss, read from the raw tables (UNNEST + six
+joins) and from the materialized aggregate table, on the DuckDB stand-in for
+BigQuery (benchmarks/duckdb_bigquery.py):
+
+    python benchmarks/bench_materialized.py --ads 500000 --makes 20
+
+Both routes must return the same rows. Rows scanned (table rows read) and
+rows processed (rows produced by every operator, unnested price points and
+joins included) are DuckDB's counts, the local proxies for the bytes and slot
+time BigQuery bills. A raw ad row carries its whole price_history array, so
+the raw route scans fewer but much wider rows.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import polars as pl
+
+from benchmarks.duckdb_bigquery import DuckDBClient, raw_tables
+from aux_functions import settings
+from aux_functions.db_connect import DBConnect
+from aux_functions.materialized import Materialized
+from aux_functions.queries import Queries
+
+TABLE = "autotiming-prod.metrics.make_daily_prices"
+
+
+def read_makes(client: DuckDBClient, make_ids: list) -> tuple:
+    latencies, scanned, processed, frames = [], [], [], {}
+    for make_id in make_ids:
+        start = time.perf_counter()
+        frames[make_id] = Queries.query_dataset_by_make(client, make_id)
+        latencies.append(time.perf_counter() - start)
+        scanned.append(client.last_job.rows_scanned)
+        processed.append(client.last_job.rows_processed)
+    return latencies, scanned, processed, frames
+
+
+def canonical(df: pl.DataFrame) -> pl.DataFrame:
+    return df.with_columns(pl.col(pl.Categorical).cast(pl.String)).sort(pl.all())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ads", type=int, default=300_000)
+    parser.add_argument("--makes", type=int, default=20)
+    parser.add_argument("--reads", type=int, default=5, help="makes read on each route")
+    args = parser.parse_args()
+
+    client = DuckDBClient(raw_tables(args.ads, n_makes=args.makes))
+    # keep the last job to read its scan statistics
+    query = client.query
+    client.query = lambda *a, **kw: setattr(client, "last_job", query(*a, **kw)) or client.last_job
+    make_ids = list(range(1, min(args.reads, args.makes) + 1))
+
+    with mock.patch.object(DBConnect, "get_storage_client", staticmethod(lambda: None)), \
+            mock.patch.object(settings, "MATERIALIZED_TABLE", TABLE):
+        raw = read_makes(client, make_ids)
+
+        start = time.perf_counter()
+        Materialized.refresh(client, incremental=False)
+        build = time.perf_counter() - start
+        Materialized.is_fresh.clear()
+        materialized = read_makes(client, make_ids)
+
+        start = time.perf_counter()
+        Materialized.refresh(client, incremental=True)
+        incremental = time.perf_counter() - start
+
+    for make_id in make_ids:
+        assert canonical(raw[3][make_id]).equals(canonical(materialized[3][make_id])), make_id
+    print(f"materialized table  build {build:6.2f} s  incremental refresh {incremental:6.2f} s")
+    for name, (latencies, scanned, processed, _) in [("raw", raw), ("materialized", materialized)]:
+        print(f"{name:<13} cache miss  median {statistics.median(latencies) * 1000:8.1f} ms  "
+              f"rows scanned {statistics.median(scanned):12,.0f}  processed {statistics.median(processed):12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Behaviour of the query layer when BigQuery misbehaves, against a
+fault-injecting fake client (benchmarks/fake_bigquery.FlakyClient):
+
+- tail latency and failure rate of make dataset queries when a share of the
+  jobs fail with a 503 or stall, without and with the per-job timeout and
+  jittered retries of Resilience
+- time for a session to get an expired make dataset when the refresh blocks
+  and with stale-while-revalidate
+
+    python benchmarks/bench_resilience.py --requests 200 --error-rate 0.1 --stall-rate 0.05
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("AUTOTIMING_CACHE_DIR", tempfile.mkdtemp(prefix="autotiming_resilience_"))
+
+from benchmarks.fake_bigquery import FakeClient, FlakyClient
+from aux_functions import settings
+from aux_functions.db_connect import DBConnect
+from aux_functions.disk_cache import DiskCache
+from aux_functions.queries import Queries
+from aux_functions.registry import DatasetRegistry
+
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+def query_latencies(args, timeout: float, retries: int) -> dict:
+    client = FlakyClient(n_rows=args.rows, n_makes=args.makes, latency=args.latency,
+                         error_rate=args.error_rate, stall_rate=args.stall_rate, stall=args.stall)
+
+    def request(i: int):
+        start = time.perf_counter()
+        try:
+            Queries.query_dataset_by_make(client, i % args.makes + 1)
+            ok = True
+        except Exception:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    with mock.patch.multiple(settings, QUERY_TIMEOUT=timeout, QUERY_RETRIES=retries, RETRY_BASE_DELAY=args.base_delay):
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            results = list(pool.map(request, range(args.requests)))
+    latencies = [seconds for seconds, _ in results]
+    return {
+        "failed": sum(not ok for _, ok in results),
+        "p50": statistics.median(latencies),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "max": max(latencies),
+        "faults": dict(client.faults),
+        "cancelled": client.cancelled,
+    }
+
+
+def expired_acquire(args, stale_max_age: int) -> tuple:
+    client = FakeClient(n_rows=args.rows, n_makes=args.makes, latency=args.refresh_latency)
+    disk_cache = DiskCache.get_instance()
+    path = disk_cache.path(DiskCache.dataset_key(1))
+    if not os.path.exists(path):
+        Queries.load_dataset_by_make(client, 1)
+    # make the on-disk copy expire
+    expired = time.time() - settings.DATASET_TTL - 60
+    os.utime(path, (time.time(), expired))
+
+    with mock.patch.object(settings, "STALE_MAX_AGE", stale_max_age):
+        registry = DatasetRegistry(settings.REGISTRY_MAX_BYTES, settings.SESSION_TIMEOUT)
+        start = time.perf_counter()
+        registry.acquire("session", client, 1)
+        served = time.perf_counter() - start
+        while registry._revalidating:
+            time.sleep(0.01)
+        refreshed = time.perf_counter() - start
+    return served, refreshed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--makes", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.1, help="latency of a healthy job in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.1)
+    parser.add_argument("--stall-rate", type=float, default=0.05)
+    parser.add_argument("--stall", type=float, default=5.0, help="extra seconds of a stalled job")
+    parser.add_argument("--timeout", type=float, default=1.0, help="per-job timeout of the resilient run")
+    parser.add_argument("--base-delay", type=float, default=0.1, help="base retry backoff of the resilient run")
+    parser.add_argument("--refresh-latency", type=float, default=2.0, help="latency of the refresh query in seconds")
+    args = parser.parse_args()
+
+    with mock.patch.object(DBConnect, "get_storage_client", staticmethod(lambda: None)):
+        for name, timeout, retries in [("no timeout, no retry", 0, 0),
+                                       (f"timeout {args.timeout:g}s, {settings.QUERY_RETRIES} retries",
+                                        args.timeout, settings.QUERY_RETRIES)]:
+            r = query_latencies(args, timeout, retries)
+            print(f"{name:<26} failed {r['failed']:>4}/{args.requests}  p50 {r['p50'] * 1000:7.0f} ms  "
+                  f"p95 {r['p95'] * 1000:7.0f} ms  p99 {r['p99'] * 1000:7.0f} ms  max {r['max'] * 1000:7.0f} ms  "
+                  f"cancelled {r['cancelled']}  faults {r['faults']}")
+
+        for name, stale_max_age in [("blocking refresh", 0), ("stale-while-revalidate", settings.STALE_MAX_AGE)]:
+            served, refreshed = expired_acquire(args, stale_max_age)
+            print(f"expired make, {name:<24} served in {served * 1000:7.0f} ms  fresh after {refreshed * 1000:7.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
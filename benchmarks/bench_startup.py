@@ -0,0 +1,127 @@
+"""
+Cold start benchmark of app.py.
+
+Each measurement runs in a fresh interpreter so module imports are paid again:
+
+- import time of the modules app.py imports, and of the heavy dependencies
+  deferred to first use (BigQuery client stack, altair)
+- time to first render: first AppTest run of app.py against the fake BigQuery
+  backend, with an empty on-disk cache (first start on a node) and with the
+  make list saved by a previous start
+
+    python benchmarks/bench_startup.py --client-latency 1.0 --latency 0.5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+APP_IMPORTS = """
+import streamlit, polars
+from aux_functions import settings
+from aux_functions.analytics import OVERLAYS, Analytics
+from aux_functions.charts import RESOLUTIONS, Charts
+from aux_functions.css import hide_streamlit_style
+from aux_functions.metrics import Metrics
+from aux_functions.registry import DatasetRegistry
+from aux_functions.startup import Startup
+from aux_functions.warmup import Warmup
+from aux_functions.filters import apply_filter_style
+"""
+
+DEFERRED_IMPORTS = """
+from google.cloud import bigquery
+from google.oauth2 import service_account
+import altair
+"""
+
+
+def time_imports(code: str, before: str = "") -> float:
+    script = (
+        f"import sys, time; sys.path.insert(0, {ROOT!r})\n{before}\n"
+        f"start = time.perf_counter()\n{code}\nprint(time.perf_counter() - start)"
+    )
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def first_render(cache_dir: str, args) -> dict:
+    result = subprocess.run(
+        [sys.executable, __file__, "--child", "--client-latency", str(args.client_latency),
+         "--latency", str(args.latency), "--rows", str(args.rows)],
+        capture_output=True, text=True, check=True,
+        env={**os.environ, "AUTOTIMING_CACHE_DIR": cache_dir},
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def child(args):
+    start = time.perf_counter()
+    sys.path.insert(0, ROOT)
+    from unittest import mock
+
+    from streamlit.testing.v1 import AppTest
+
+    from benchmarks.fake_bigquery import FakeClient
+    from aux_functions.db_connect import DBConnect
+
+    client = FakeClient(n_rows=args.rows, latency=args.latency, n_makes=20)
+
+    def get_client():
+        # credentials and client construction
+        time.sleep(args.client_latency)
+        return client
+
+    with mock.patch.object(DBConnect, "get_client", staticmethod(get_client)), \
+            mock.patch.object(DBConnect, "get_storage_client", staticmethod(lambda: None)):
+        at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=120)
+        run_start = time.perf_counter()
+        at.run()
+        rendered = time.perf_counter()
+        if at.exception:
+            raise RuntimeError(at.exception[0].value)
+        # let the background start-up finish so the make list reaches the disk
+        from aux_functions.startup import Startup
+        Startup.get_instance().makes()
+    print(json.dumps({"first_run": rendered - run_start, "process": rendered - start,
+                      "makes": len(at.selectbox(key="make_selected").options) - 1}))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--latency", type=float, default=0.5, help="simulated BigQuery query latency in seconds")
+    parser.add_argument("--client-latency", type=float, default=1.0,
+                        help="simulated BigQuery client creation time in seconds")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args)
+
+    baseline = [time_imports("import streamlit") for _ in range(args.repeat)]
+    app = [time_imports(APP_IMPORTS) for _ in range(args.repeat)]
+    deferred = [time_imports(DEFERRED_IMPORTS, before=APP_IMPORTS) for _ in range(args.repeat)]
+    print(f"import streamlit                  {statistics.median(baseline) * 1000:8.1f} ms")
+    print(f"import app modules (incl. above)  {statistics.median(app) * 1000:8.1f} ms")
+    print(f"deferred to first use             {statistics.median(deferred) * 1000:8.1f} ms  (bigquery, altair)")
+
+    cold, warm = [], []
+    for _ in range(args.repeat):
+        with tempfile.TemporaryDirectory(prefix="autotiming_startup_") as cache_dir:
+            cold.append(first_render(cache_dir, args))
+            warm.append(first_render(cache_dir, args))
+    for name, runs in [("cold (empty disk cache)", cold), ("warm (make list on disk)", warm)]:
+        print(f"first render {name:<25} script {statistics.median(r['first_run'] for r in runs) * 1000:8.1f} ms  "
+              f"process {statistics.median(r['process'] for r in runs) * 1000:8.1f} ms  "
+              f"makes {runs[0]['makes']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Synthetic raw tables shaped like the production dataset (ad_tracker_history
+with a price_history array, plus the make, model, km_class, hp_class,
+transmission_type and fuel_type dimensions), for the local DuckDB backend
+(aux_functions/local_backend.py). Unlike fake_bigquery.FakeClient, which
+slices a pre-aggregated result set, a DuckDBClient over these tables runs the
+app's actual SQL.
+
+Write them as a Parquet directory the app can serve with
+AUTOTIMING_BACKEND=duckdb, with the materialized daily aggregate table built
+from them (set AUTOTIMING_MATERIALIZED_TABLE to the same --table for the app
+to read it):
+
+    python benchmarks/duckdb_bigquery.py --out /tmp/autotiming_local --ads 500000 --makes 20
+"""
+import argparse
+import datetime
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+import pyarrow as pa
+
+from benchmarks.fake_bigquery import FUEL_TYPES, HP_RANGES, KM_RANGES, TRANSMISSIONS
+from aux_functions.local_backend import DuckDBClient
+
+
+def raw_tables(n_ads: int, n_makes: int = 40, models_per_make: int = 25, n_days: int = 730,
+               max_history: int = 60, seed: int = 0) -> dict:
+    """
+    Build synthetic raw tables
+    Args:
+        n_ads: int, rows of ad_tracker_history
+        n_makes: int
+        models_per_make: int
+        n_days: int, days covered by the price histories
+        max_history: int, maximum days tracked per ad
+        seed: int
+    Returns:
+        tables: dict of table name -> pa.Table
+    """
+    rng = np.random.default_rng(seed)
+    today = datetime.date.today()
+    make_id = rng.integers(1, n_makes + 1, n_ads)
+    model_id = make_id * 1000 + rng.integers(1, models_per_make + 1, n_ads)
+    km_class_id = rng.integers(1, len(KM_RANGES) + 1, n_ads)
+    hp_class_id = rng.integers(1, len(HP_RANGES) + 1, n_ads)
+    year = rng.integers(2005, today.year + 1, n_ads)
+    base_price = (30_000 - (today.year - year) * 1_500 - km_class_id * 1_000 + hp_class_id * 2_000
+                  + rng.normal(0, 1_500, n_ads)).clip(1_000)
+
+    # one price point per tracked day, the price drifts down slowly
+    lengths = rng.integers(1, max_history + 1, n_ads)
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    first_day = rng.integers(0, n_days - max_history, n_ads)
+    position = np.arange(offsets[-1]) - np.repeat(offsets[:-1], lengths)
+    days = np.datetime64(today - datetime.timedelta(days=n_days)) + (np.repeat(first_day, lengths) + position).astype("timedelta64[D]")
+    prices = (np.repeat(base_price, lengths) * (1 - 0.001 * position)).astype(np.int64)
+    history = pa.ListArray.from_arrays(
+        pa.array(offsets, pa.int32()),
+        pa.StructArray.from_arrays([pa.array(days, pa.date32()), pa.array(prices)], names=["d", "p"]),
+    )
+
+    makes = np.arange(1, n_makes + 1)
+    models = (makes[:, None] * 1000 + np.arange(1, models_per_make + 1)).ravel()
+    return {
+        "ad_tracker_history": pa.table({
+            "ad_id": np.arange(n_ads),
+            "make_id": make_id,
+            "model_id": model_id,
+            "year_manufactured": year,
+            "km_class_id": km_class_id,
+            "hp_class_id": hp_class_id,
+            "transmission_type_id": rng.integers(1, len(TRANSMISSIONS) + 1, n_ads),
+            "fuel_type_id": rng.integers(1, len(FUEL_TYPES) + 1, n_ads),
+            "price_history": history,
+        }),
+        "make": pa.table({"make_id": makes, "name": [f"Make {i:03d}" for i in makes]}),
+        "model": pa.table({"model_id": models, "make_id": models // 1000, "name": [f"Model {i}" for i in models]}),
+        "km_class": pa.table({"km_class_id": np.arange(1, len(KM_RANGES) + 1), "name": KM_RANGES}),
+        "hp_class": pa.table({"hp_class_id": np.arange(1, len(HP_RANGES) + 1), "name": HP_RANGES}),
+        "transmission_type": pa.table({"transmission_type_id": np.arange(1, len(TRANSMISSIONS) + 1), "name": TRANSMISSIONS}),
+        "fuel_type": pa.table({"fuel_type_id": np.arange(1, len(FUEL_TYPES) + 1), "name": FUEL_TYPES}),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out", required=True, help="directory the Parquet tables are written to")
+    parser.add_argument("--ads", type=int, default=300_000)
+    parser.add_argument("--makes", type=int, default=20)
+    parser.add_argument("--table", default="autotiming-prod.metrics.make_daily_prices", help="materialized table")
+    args = parser.parse_args()
+
+    from aux_functions import settings
+    from aux_functions.materialized import Materialized
+    from jobs.sync_local import MATERIALIZED_ORDER_BY, RAW_ORDER_BY, RAW_TABLE, write_table
+
+    os.makedirs(args.out, exist_ok=True)
+    client = DuckDBClient(raw_tables(args.ads, n_makes=args.makes))
+    settings.MATERIALIZED_TABLE = args.table
+    Materialized.refresh(client, incremental=False)
+    materialized = args.table.split(".")[-1]
+    order_by = {RAW_TABLE: RAW_ORDER_BY, materialized: MATERIALIZED_ORDER_BY}
+    for name in [*client.modified]:
+        write_table(client, name, args.out, order_by.get(name))
+        print(f"{name}: {os.path.getsize(os.path.join(args.out, name + '.parquet')) / 1024 ** 2:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
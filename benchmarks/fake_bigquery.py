@@ -0,0 +1,220 @@
+"""
+Local stand-in for google.cloud.bigquery.Client used by the benchmarks.
+
+Serves a synthetic ad_tracker_history-shaped result set: one row per
+(make, model, day, year, km, hp, transmission, fuel) with the price sum and
+ad count, filtered by the @selected_make_id, @since, @make_ids and @model_ids
+query parameters when present. Model list queries return the models of
+@selected_make_id.
+
+FlakyClient injects backend faults (errors and stalled jobs) on top of it.
+"""
+import collections
+import concurrent.futures
+import datetime
+import random
+import threading
+import time
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from google.api_core.exceptions import NotFound, ServiceUnavailable
+
+KM_RANGES = ["0-10k", "10k-50k", "50k-100k", "100k-150k", "150k-200k", "+200k"]
+HP_RANGES = ["<100", "100-150", "150-200", "200-300", "+300"]
+TRANSMISSIONS = ["Manual", "Automático"]
+FUEL_TYPES = ["Gasolina", "Diésel", "Híbrido", "Eléctrico"]
+
+
+def synthetic_dataset(n_rows: int, n_makes: int = 40, models_per_make: int = 25, n_days: int = 730, seed: int = 0) -> pa.Table:
+    """
+    Build a synthetic make dataset
+    Args:
+        n_rows: int
+        n_makes: int
+        models_per_make: int
+        n_days: int
+        seed: int
+    Returns:
+        table: pa.Table
+    """
+    rng = np.random.default_rng(seed)
+    make_id = rng.integers(1, n_makes + 1, n_rows)
+    model_id = make_id * 1000 + rng.integers(1, models_per_make + 1, n_rows)
+    km_class_id = rng.integers(1, len(KM_RANGES) + 1, n_rows)
+    hp_class_id = rng.integers(1, len(HP_RANGES) + 1, n_rows)
+    transmission = rng.integers(0, len(TRANSMISSIONS), n_rows)
+    fuel = rng.integers(0, len(FUEL_TYPES), n_rows)
+    first_day = datetime.date.today() - datetime.timedelta(days=n_days)
+    day = np.datetime64(first_day) + rng.integers(0, n_days, n_rows).astype("timedelta64[D]")
+    year = rng.integers(2005, datetime.date.today().year + 1, n_rows)
+    price = (30_000 - (datetime.date.today().year - year) * 1_500 - km_class_id * 1_000 + hp_class_id * 2_000
+             + rng.normal(0, 1_500, n_rows)).clip(1_000).astype(np.int64)
+    ad_count = rng.integers(1, 6, n_rows)
+    return pa.table({
+        "make_id": make_id,
+        "make": pa.array([f"Make {i:03d}" for i in make_id]),
+        "model_id": model_id,
+        "model": pa.array([f"Model {i}" for i in model_id]),
+        "day": pa.array(day, type=pa.date32()),
+        "year": year,
+        "km_class_id": km_class_id,
+        "km_range": pa.array(np.array(KM_RANGES, dtype=object)[km_class_id - 1]),
+        "hp_class_id": hp_class_id,
+        "hp_range": pa.array(np.array(HP_RANGES, dtype=object)[hp_class_id - 1]),
+        "transmission_type": pa.array(np.array(TRANSMISSIONS, dtype=object)[transmission]),
+        "fuel_type": pa.array(np.array(FUEL_TYPES, dtype=object)[fuel]),
+        "price_sum": price * ad_count,
+        "ad_count": ad_count,
+    })
+
+
+class FakeRowIterator:
+
+    def __init__(self, table: pa.Table, page_size: int = None):
+        self._table = table
+        self._page_size = page_size
+        self.total_rows = table.num_rows
+        self.schema = table.schema
+
+    def to_arrow_iterable(self, bqstorage_client=None, max_queue_size=None, max_stream_count=None):
+        yield from self._table.to_batches(max_chunksize=self._page_size)
+
+    def to_arrow(self, create_bqstorage_client=True, **kwargs) -> pa.Table:
+        return self._table
+
+    def to_dataframe(self, create_bqstorage_client=True, **kwargs):
+        return self._table.to_pandas()
+
+
+class FakeQueryJob:
+
+    def __init__(self, client: "FakeClient", table: pa.Table):
+        self._client = client
+        self._table = table
+        self.total_bytes_processed = table.nbytes
+
+    def result(self, page_size: int = None, timeout: float = None) -> FakeRowIterator:
+        with self._client.lock:
+            self._client.in_flight += 1
+            self._client.max_in_flight = max(self._client.max_in_flight, self._client.in_flight)
+        try:
+            time.sleep(self._client.latency)
+        finally:
+            with self._client.lock:
+                self._client.in_flight -= 1
+        return FakeRowIterator(self._table, page_size)
+
+    def to_dataframe(self, **kwargs):
+        return self.result().to_dataframe()
+
+    def to_arrow(self, **kwargs) -> pa.Table:
+        return self.result().to_arrow()
+
+    def cancel(self) -> bool:
+        with self._client.lock:
+            self._client.cancelled += 1
+        return True
+
+
+class FlakyQueryJob(FakeQueryJob):
+
+    def __init__(self, client: "FlakyClient", table: pa.Table, fault: str):
+        super().__init__(client, table)
+        self._fault = fault
+
+    def result(self, page_size: int = None, timeout: float = None) -> FakeRowIterator:
+        if self._fault == "error":
+            time.sleep(self._client.latency)
+            raise ServiceUnavailable("injected backend error")
+        if self._fault == "stall":
+            # the real client gives up waiting after timeout seconds
+            if timeout is not None and timeout < self._client.stall:
+                time.sleep(timeout)
+                raise concurrent.futures.TimeoutError()
+            time.sleep(self._client.stall)
+        return super().result(page_size, timeout)
+
+
+class FakeClient:
+    """
+    Minimal bigquery.Client replacement: client.query(sql, job_config) returns
+    a job whose result is sliced from the synthetic dataset after `latency`
+    seconds. Issued queries and the peak number of jobs running at once are
+    recorded.
+    """
+
+    def __init__(self, n_rows: int = 200_000, latency: float = 0.0, n_makes: int = 40, seed: int = 0):
+        self.dataset = synthetic_dataset(n_rows, n_makes=n_makes, seed=seed)
+        self.latency = latency
+        self.queries = []
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.cancelled = 0
+
+    def query(self, query: str, job_config=None, **kwargs) -> FakeQueryJob:
+        params = {
+            p.name: getattr(p, "value", getattr(p, "values", None))
+            for p in getattr(job_config, "query_parameters", None) or []
+        }
+        with self.lock:
+            self.queries.append((query, params))
+        return FakeQueryJob(self, self._answer(query, params))
+
+    def _answer(self, query: str, params: dict) -> pa.Table:
+        table = self.dataset
+        if "ad_tracker_history" not in query and "metrics.model`" in query:
+            table = table.filter(pc.equal(table["make_id"], params["selected_make_id"]))
+            return (table.group_by(["model_id", "model"]).aggregate([])
+                    .sort_by("model"))
+        if "ad_tracker_history" not in query:
+            return (table.group_by(["make_id", "make"]).aggregate([])
+                    .sort_by("make"))
+        if "selected_make_id" in params:
+            table = table.filter(pc.equal(table["make_id"], params["selected_make_id"]))
+        for column, values in [("make_id", params.get("make_ids")), ("model_id", params.get("model_ids"))]:
+            if values is not None:
+                table = table.filter(pc.is_in(table[column], pa.array(values, table[column].type)))
+        if params.get("since") is not None:
+            table = table.filter(pc.greater_equal(table["day"], pa.scalar(params["since"], pa.date32())))
+        return table
+
+    def get_table(self, table: str):
+        # only the raw result set is served, there is no materialized table
+        raise NotFound(f"Table {table} not found")
+
+
+class FlakyClient(FakeClient):
+    """
+    FakeClient with injected faults: each job fails with a 503 after `latency`
+    with probability `error_rate`, or stalls for `stall` extra seconds with
+    probability `stall_rate` (waiting on it honours the result timeout, like
+    the real client). Faults are drawn from their own seeded generator, after
+    the `script` of faults ("error", "stall" or None) given for the first
+    jobs, and counted by kind. The job configurations are recorded.
+    """
+
+    def __init__(self, *args, error_rate: float = 0.1, stall_rate: float = 0.05, stall: float = 10.0,
+                 fault_seed: int = 1, script: list = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.error_rate = error_rate
+        self.stall_rate = stall_rate
+        self.stall = stall
+        self.random = random.Random(fault_seed)
+        self.script = collections.deque(script or [])
+        self.faults = collections.Counter()
+        self.job_configs = []
+
+    def query(self, query: str, job_config=None, **kwargs) -> FakeQueryJob:
+        job = super().query(query, job_config, **kwargs)
+        with self.lock:
+            self.job_configs.append(job_config)
+            if self.script:
+                fault = self.script.popleft()
+            else:
+                draw = self.random.random()
+                fault = "error" if draw < self.error_rate else "stall" if draw < self.error_rate + self.stall_rate else None
+            self.faults[fault] += 1
+        return FlakyQueryJob(self, job._table, fault) if fault else job
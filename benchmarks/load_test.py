@@ -0,0 +1,163 @@
+"""
+Load test of app.py against the fake BigQuery backend.
+
+Drives N simulated sessions through the cascading filter flow (make, model,
+km, year, hp, transmission, fuel) with Streamlit's AppTest, picking makes with
+a skewed popularity like real traffic, and reports rerun latency percentiles,
+memory per session and cache hit rates:
+
+    python benchmarks/load_test.py --sessions 50 --rows 500000 --latency 0.3
+
+With --data-dir the app runs its real queries on the local DuckDB backend over
+a Parquet directory (see benchmarks/duckdb_bigquery.py) instead:
+
+    python benchmarks/load_test.py --sessions 50 --data-dir /tmp/autotiming_local
+
+AppTest is not thread-safe, so the sessions share one process (and its
+caches) and their reruns are interleaved round-robin, like users clicking
+through the cascade at the same time.
+"""
+import argparse
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# isolate the run from any existing on-disk cache, must happen before the
+# settings module is imported
+os.environ.setdefault("AUTOTIMING_CACHE_DIR", tempfile.mkdtemp(prefix="autotiming_load_test_"))
+
+from streamlit.testing.v1 import AppTest
+
+from benchmarks.fake_bigquery import FakeClient
+from aux_functions.db_connect import DBConnect
+from aux_functions.local_backend import DuckDBClient
+from aux_functions.metrics import Metrics
+
+APP = os.path.join(ROOT, "app.py")
+CASCADE = [
+    "model_selected",
+    "km_range_selected",
+    "year_selected",
+    "hp_range_selected",
+    "transmission_selected",
+    "fuel_type_selected",
+]
+
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(int(round(q * (len(values) - 1))), len(values) - 1)]
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def session(seed: int, makes: list, apps: list, latencies: list, timeout: float):
+    """
+    Walk one session through the whole filter cascade, yielding after each rerun
+    """
+    rng = random.Random(seed)
+
+    def timed(step):
+        start = time.perf_counter()
+        step.run(timeout=timeout)
+        latencies.append(time.perf_counter() - start)
+        if at.exception:
+            raise RuntimeError(at.exception[0].value)
+
+    at = AppTest.from_file(APP, default_timeout=timeout)
+    apps.append(at)
+    timed(at)
+    yield
+    # skewed make popularity: a few makes get most of the traffic
+    make = rng.choices(makes, weights=[1 / (i + 1) for i in range(len(makes))])[0]
+    timed(at.selectbox(key="make_selected").select(make))
+    yield
+    for key in CASCADE:
+        options = [o for o in at.selectbox(key=key).options if o]
+        if not options:
+            break
+        timed(at.selectbox(key=key).select(rng.choice(options)))
+        yield
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--rows", type=int, default=300_000)
+    parser.add_argument("--makes", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.2, help="simulated BigQuery latency in seconds")
+    parser.add_argument("--data-dir", help="Parquet directory served by the local DuckDB backend instead of the fake")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--trace-heap", action="store_true",
+                        help="also measure the python heap with tracemalloc (slows reruns down)")
+    args = parser.parse_args()
+
+    if args.data_dir:
+        client = DuckDBClient.from_parquet(args.data_dir)
+        makes = sorted(make for (make,) in client.query("SELECT name FROM `autotiming-prod.metrics.make`").result())
+        client.queries.clear()
+    else:
+        client = FakeClient(n_rows=args.rows, latency=args.latency, n_makes=args.makes)
+        makes = sorted({f"Make {i:03d}" for i in client.dataset["make_id"].to_pylist()})
+
+    with mock.patch.object(DBConnect, "get_client", staticmethod(lambda: client)), \
+            mock.patch.object(DBConnect, "get_storage_client", staticmethod(lambda: None)):
+        if args.trace_heap:
+            tracemalloc.start()
+        rss_before = rss_mb()
+        start = time.perf_counter()
+        apps, latencies = [], []
+        running = [session(i, makes, apps, latencies, args.timeout) for i in range(args.sessions)]
+        while running:
+            for steps in list(running):
+                try:
+                    next(steps)
+                except StopIteration:
+                    running.remove(steps)
+        elapsed = time.perf_counter() - start
+        # sessions are still referenced, so this is what they retain
+        rss_retained = rss_mb() - rss_before
+        heap_retained, heap_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    print(f"sessions {len(apps)}  reruns {len(latencies)}  wall {elapsed:.1f}s")
+    print(f"rerun latency  p50 {percentile(latencies, 0.5) * 1000:8.1f} ms  "
+          f"p95 {percentile(latencies, 0.95) * 1000:8.1f} ms  "
+          f"mean {statistics.mean(latencies) * 1000:8.1f} ms")
+    print(f"memory per session  RSS {rss_retained / args.sessions:6.2f} MB")
+    if args.trace_heap:
+        print(f"memory per session  python heap {heap_retained / args.sessions / 1024 ** 2:6.2f} MB  "
+              f"(peak {heap_peak / 1024 ** 2:.1f} MB)")
+    print(f"BigQuery jobs {len(client.queries)}")
+
+    metrics = Metrics.get_instance()
+    for (name, labels), calls in sorted(metrics.counters.items()):
+        # only the get_* methods sit behind st.cache_data
+        if name != "autotiming_query_calls_total" or not dict(labels)["method"].startswith("get_"):
+            continue
+        misses = metrics.counters.get(("autotiming_query_cache_misses_total", labels), 0)
+        method = dict(labels)["method"]
+        print(f"cache {method:<24} calls {calls:6.0f}  hit rate {1 - misses / calls:6.1%}")
+    disk = {dict(labels)["result"]: value for (name, labels), value in metrics.counters.items()
+            if name == "autotiming_disk_cache_total"}
+    if disk:
+        print("disk cache " + "  ".join(f"{result} {value:.0f}" for result, value in sorted(disk.items())))
+
+
+if __name__ == "__main__":
+    main()
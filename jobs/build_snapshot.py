@@ -0,0 +1,33 @@
+"""
+Nightly build of the market snapshot read by the "mercado" page:
+
+    python jobs/build_snapshot.py
+
+Queries the whole market once (get_all_dataset) and publishes it as a
+Parquet dataset partitioned by make under AUTOTIMING_SNAPSHOT_DIR. Schedule it
+with cron (or any job runner) on every node sharing the snapshot directory,
+using the same Streamlit secrets as the app.
+"""
+import logging
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from aux_functions.db_connect import DBConnect
+from aux_functions.snapshot import Snapshot
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    start = time.perf_counter()
+    client = DBConnect.get_client()
+    snapshot = Snapshot.get_instance()
+    snapshot_id = snapshot.build(client)
+    logging.info("snapshot %s built in %.1fs", snapshot_id, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main()
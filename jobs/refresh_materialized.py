@@ -0,0 +1,39 @@
+"""
+Refresh of the materialized per-make aggregate table (AUTOTIMING_MATERIALIZED_TABLE):
+
+    python jobs/refresh_materialized.py          # replace the newest days
+    python jobs/refresh_materialized.py --full   # rebuild the whole table
+
+Run the incremental refresh more often than AUTOTIMING_MATERIALIZED_MAX_AGE
+(hourly with the defaults), otherwise make datasets are read from the raw
+tables again. A periodic full rebuild also re-clusters the table.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from aux_functions.db_connect import DBConnect
+from aux_functions.materialized import Materialized
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--full", action="store_true", help="rebuild the table instead of replacing the newest days")
+    args = parser.parse_args()
+    if not Materialized.table():
+        parser.error("AUTOTIMING_MATERIALIZED_TABLE is not set")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    start = time.perf_counter()
+    since = Materialized.refresh(DBConnect.get_client(), incremental=not args.full)
+    logging.info("%s %s in %.1fs", Materialized.table(),
+                 f"refreshed from {since}" if since else "rebuilt", time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Copy of the BigQuery tables the app reads into the Parquet directory served
+by the local DuckDB backend (AUTOTIMING_BACKEND=duckdb):
+
+    python jobs/sync_local.py          # dimensions and the materialized table
+    python jobs/sync_local.py --raw    # also ad_tracker_history
+
+Each table is written to <AUTOTIMING_LOCAL_DATA_DIR>/<table>.parquet through
+a temporary file and a rename, so a running app switches to the new copy on
+its next query. The fact tables are read from BigQuery unsorted and sorted
+locally by DuckDB, which spills to disk. Without --raw, make datasets are
+served from the materialized table (AUTOTIMING_MATERIALIZED_TABLE must be
+set) whatever its age. Uses the same Streamlit secrets as the app.
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import duckdb
+import pyarrow.parquet as pq
+
+from aux_functions import settings
+from aux_functions.db_connect import DBConnect
+from aux_functions.disk_cache import ROW_GROUP_SIZE
+from aux_functions.fetch import Fetch
+
+DATASET = "autotiming-prod.metrics"
+TABLES = ["make", "model", "km_class", "hp_class", "transmission_type", "fuel_type"]
+RAW_TABLE = "ad_tracker_history"
+
+# Row order of the local copies of the raw and materialized tables: rows of a
+# make are contiguous so Parquet row-group statistics skip the other makes
+# like BigQuery's clustering
+RAW_ORDER_BY = "make_id, model_id"
+MATERIALIZED_ORDER_BY = "make_id, model_id, day"
+
+
+def write_table(client, table: str, directory: str, order_by: str = None) -> str:
+    """
+    Copy a table to <directory>/<table name>.parquet
+    Args:
+        client: bigquery.Client or DuckDBClient
+        table: str, table name, qualified with DATASET when it has no dataset
+        directory: str
+        order_by: str, ORDER BY clause the local copy is sorted by
+    Returns:
+        path: str
+    """
+    qualified = table if "." in table else f"{DATASET}.{table}"
+    name = qualified.split(".")[-1]
+    # never sorted by BigQuery, an ORDER BY over a whole fact table is one slot
+    rows = client.query(f"SELECT * FROM `{qualified}`").result(page_size=ROW_GROUP_SIZE)
+
+    # written batch by batch as the rows are fetched
+    path = os.path.join(directory, f"{name}.parquet")
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".sync-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            writer = None
+            for batch in rows.to_arrow_iterable(bqstorage_client=DBConnect.get_storage_client()):
+                if writer is None:
+                    writer = pq.ParquetWriter(f, batch.schema)
+                writer.write_batch(batch, row_group_size=ROW_GROUP_SIZE)
+            if writer is None:
+                pq.write_table(Fetch.empty_table(rows.schema), f)
+            else:
+                writer.close()
+        if order_by:
+            sort_parquet(tmp_path, order_by, directory)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+
+def sort_parquet(path: str, order_by: str, directory: str) -> None:
+    """
+    Sort a Parquet file in place with DuckDB, spilling to directory when it
+    does not fit in memory
+    Args:
+        path: str
+        order_by: str, ORDER BY clause
+        directory: str, for the temporary files
+    """
+    fd, sorted_path = tempfile.mkstemp(dir=directory, prefix=".sync-", suffix=".tmp")
+    os.close(fd)
+    try:
+        connection = duckdb.connect()
+        connection.execute(f"SET temp_directory = '{os.path.join(directory, '.sync-spill')}'")
+        connection.execute(f"""
+            COPY (SELECT * FROM read_parquet('{path}') ORDER BY {order_by})
+            TO '{sorted_path}' (FORMAT parquet, ROW_GROUP_SIZE {ROW_GROUP_SIZE})
+        """)
+        connection.close()
+        os.replace(sorted_path, path)
+    except BaseException:
+        if os.path.exists(sorted_path):
+            os.remove(sorted_path)
+        raise
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out", default=settings.LOCAL_DATA_DIR, help="directory the Parquet tables are written to")
+    parser.add_argument("--raw", action="store_true", help=f"also copy {RAW_TABLE}, needed without a fresh materialized table")
+    args = parser.parse_args()
+    if not args.raw and not settings.MATERIALIZED_TABLE:
+        parser.error("without --raw, AUTOTIMING_MATERIALIZED_TABLE must be set to serve make datasets")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    os.makedirs(args.out, exist_ok=True)
+    client = DBConnect.get_bigquery_client()
+    tables = [(table, None) for table in TABLES]
+    if args.raw:
+        tables.append((RAW_TABLE, RAW_ORDER_BY))
+    if settings.MATERIALIZED_TABLE:
+        tables.append((settings.MATERIALIZED_TABLE, MATERIALIZED_ORDER_BY))
+    for table, order_by in tables:
+        start = time.perf_counter()
+        path = write_table(client, table, args.out, order_by)
+        logging.info("%s copied to %s in %.1fs", table, path, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import polars as pl
+import streamlit as st
+
+from streamlit import session_state as ss
+
+from aux_functions import settings
+from aux_functions.queries import Queries
+from aux_functions.charts import Charts
+from aux_functions.comparison import Comparison
+from aux_functions.css import hide_streamlit_style
+from aux_functions.facets import FacetIndex
+from aux_functions.metrics import Metrics
+from aux_functions.startup import Startup
+from aux_functions.filters import apply_filter_style
+
+# Hide streamlit style and apply custom filter styles
+hide_streamlit_style()
+apply_filter_style()
+
+metrics = Metrics.get_instance()
+metrics.begin_run()
+
+# Filters of a series after its model: (label column, widget label)
+SERIES_FILTERS = [
+    ("km_range", "Kilometraje:"),
+    ("year", "Año:"),
+    ("hp_range", "Potencia (CV):"),
+    ("transmission_type", "Transmisión:"),
+    ("fuel_type", "Combustible:"),
+]
+
+startup = Startup.get_instance()
+
+with st.spinner("Cargando datos..."):
+    try:
+        bigquery_client = startup.client()
+        makes_df = startup.makes()
+    except Exception as e:
+        Startup.get_instance.clear()
+        st.error(f"Error connecting to BigQuery: {e}")
+        st.stop()
+
+def on_series_change(i):
+    # delete the filters of the series, its model or make changed
+    for label, _ in SERIES_FILTERS:
+        key = f"compare_{label}_{i}"
+        if key in ss:
+            del ss[key]
+
+st.markdown('<div class="filter-title">Comparar Vehículos</div>', unsafe_allow_html=True)
+n_series = st.number_input(
+    label="Número de series:",
+    min_value=1,
+    max_value=settings.COMPARE_MAX_SERIES,
+    value=min(2, settings.COMPARE_MAX_SERIES),
+    key="compare_n_series",
+)
+
+# (make, model, make_id, model_id) of every series with make and model selected
+picked = []
+for i in range(n_series):
+    col1, col2 = st.columns(2)
+    with col1:
+        make = st.selectbox(
+            label=f"Marca {i + 1}:",
+            options=[""] + makes_df.select("make").to_series().to_list(),
+            key=f"compare_make_{i}",
+            on_change=on_series_change,
+            args=(i,),
+        )
+    if not make:
+        continue
+    make_id = makes_df.filter(pl.col("make") == make).select("make_id").item()
+    models_df = Queries.get_models_for_make(bigquery_client, make_id)
+    with col2:
+        model = st.selectbox(
+            label=f"Modelo {i + 1}:",
+            options=[""] + models_df.select("model").to_series().to_list(),
+            key=f"compare_model_{i}",
+            on_change=on_series_change,
+            args=(i,),
+        )
+    if model:
+        model_id = models_df.filter(pl.col("model") == model).select("model_id").item()
+        picked.append((i, make, model, make_id, model_id))
+
+if not picked:
+    st.info("Por favor, selecciona al menos una marca y un modelo.")
+    metrics.end_run()
+    st.stop()
+
+# All the series are served by one query over their models
+models = tuple(sorted({(make_id, model_id) for _, _, _, make_id, model_id in picked}))
+with st.spinner("Cargando datos de los modelos seleccionados..."):
+    with metrics.stage("load_models_dataset"):
+        df = Queries.get_models_dataset(bigquery_client, models)
+
+series, labels = [], []
+for i, make, model, make_id, model_id in picked:
+    with st.expander(f"Filtros · {make} {model}"):
+        facets = FacetIndex(df.lazy().filter((pl.col("make_id") == make_id) & (pl.col("model_id") == model_id)))
+        # resolve the option lists of the whole cascade in one pass
+        pending = [model]
+        for label, _ in SERIES_FILTERS:
+            if not ss.get(f"compare_{label}_{i}"):
+                break
+            pending.append(ss[f"compare_{label}_{i}"])
+        facets.prefetch(pending, series=False)
+        selection = [model]
+        for label, title in SERIES_FILTERS:
+            value = st.selectbox(
+                label=title,
+                options=[""] + facets.options(selection),
+                key=f"compare_{label}_{i}",
+            )
+            if not value:
+                break
+            selection.append(value)
+    series.append((make_id, model_id, tuple(selection)))
+    labels.append(" · ".join([make] + [str(value) for value in selection]))
+
+with metrics.stage("daily_series"):
+    df_series = Comparison.daily_series(models, tuple(series), df)
+
+if df_series.is_empty():
+    st.warning("No hay datos para las series seleccionadas.")
+else:
+    with metrics.stage("chart_spec"):
+        spec = Charts.comparison_chart_spec(tuple(series), tuple(labels), df_series)
+
+    with st.container(), metrics.stage("chart_render"):
+        st.markdown('<div class="filter-container">', unsafe_allow_html=True)
+        st.vega_lite_chart(spec, use_container_width=True)
+        st.markdown('</div>', unsafe_allow_html=True)
+
+metrics.end_run()
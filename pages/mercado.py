@@ -0,0 +1,98 @@
+import altair as alt
+import polars as pl
+import streamlit as st
+
+from aux_functions.css import hide_streamlit_style
+from aux_functions.filters import apply_filter_style
+from aux_functions.market import SEGMENTS, Market
+from aux_functions.metrics import Metrics
+from aux_functions.snapshot import Snapshot
+
+# Hide streamlit style and apply custom filter styles
+hide_streamlit_style()
+apply_filter_style()
+
+metrics = Metrics.get_instance()
+metrics.begin_run()
+
+# Window lengths offered: label -> days
+WINDOWS = {
+    "30 días": 30,
+    "90 días": 90,
+    "180 días": 180,
+    "1 año": 365,
+}
+
+snapshot_id = Snapshot.get_instance().current()
+if snapshot_id is None:
+    st.info("Todavía no hay datos del mercado, se generan cada noche.")
+    metrics.end_run()
+    st.stop()
+
+with st.container():
+    st.markdown('<div class="filter-title">Resumen del Mercado</div>', unsafe_allow_html=True)
+    col1, col2 = st.columns(2)
+    with col1:
+        window = st.selectbox(label="Periodo:", options=list(WINDOWS), key="market_window")
+    with col2:
+        segment_label = st.selectbox(label="Segmento:", options=list(SEGMENTS), key="market_segment")
+    days = WINDOWS[window]
+    segment = SEGMENTS[segment_label]
+
+with st.spinner("Cargando datos del mercado..."):
+    with metrics.stage("market_index"):
+        df_index = Market.price_index(snapshot_id, days, segment)
+    with metrics.stage("market_movers"):
+        df_movers = Market.top_movers(snapshot_id, days)
+
+# Makes with most ads are shown by default
+ranking = (df_index
+           .group_by("make")
+           .agg(pl.col("ad_count").sum())
+           .sort("ad_count", descending=True)
+           .get_column("make")
+           .cast(pl.String)
+           .to_list())
+selected_makes = st.multiselect(label="Marcas:", options=ranking, default=ranking[:5], key="market_makes")
+
+if selected_makes:
+    df_chart = df_index.filter(pl.col("make").cast(pl.String).is_in(selected_makes))
+    color = "make:N"
+    if segment:
+        df_chart = df_chart.with_columns(
+            pl.concat_str(pl.col("make").cast(pl.String), pl.col(segment).cast(pl.String), separator=" · ").alias("series")
+        )
+        color = "series:N"
+    chart = alt.Chart(df_chart.drop("ad_count").to_pandas()).mark_line(interpolate='basis').encode(
+        x=alt.X('day:T', axis=alt.Axis(title=None, format='%b %d')),
+        y=alt.Y('index:Q', scale=alt.Scale(zero=False), axis=alt.Axis(title='Índice (base 100)')),
+        color=alt.Color(color, title=None),
+    ).properties(
+        width=700,
+        height=400,
+        title={
+            "text": "Índice de precios",
+            "anchor": "middle",
+            "align": "center"
+        }
+    )
+    with st.container():
+        st.markdown('<div class="filter-container">', unsafe_allow_html=True)
+        st.altair_chart(chart, use_container_width=True)
+        st.markdown('</div>', unsafe_allow_html=True)
+
+st.markdown('<div class="filter-title">Mayores variaciones</div>', unsafe_allow_html=True)
+st.dataframe(
+    df_movers.rename({
+        "make": "Marca",
+        "model": "Modelo",
+        "price_start": "Precio inicial (€)",
+        "price_end": "Precio final (€)",
+        "change": "Variación (%)",
+    }),
+    use_container_width=True,
+    hide_index=True,
+)
+st.caption(f"Datos del mercado a {snapshot_id[:8]}")
+
+metrics.end_run()
@@ -0,0 +1,19 @@
+import os
+import sys
+import tempfile
+from unittest import mock
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# read by aux_functions.settings on import, before any test module imports it
+os.environ.setdefault("AUTOTIMING_CACHE_DIR", tempfile.mkdtemp(prefix="autotiming_tests_"))
+
+
+@pytest.fixture(autouse=True)
+def no_storage_client():
+    # results are fetched through the fake client's paged REST stand-in
+    from aux_functions.db_connect import DBConnect
+    with mock.patch.object(DBConnect, "get_storage_client", staticmethod(lambda: None)):
+        yield
@@ -0,0 +1,58 @@
+import os
+import time
+
+import polars as pl
+
+from aux_functions.disk_cache import DiskCache
+
+DF = pl.DataFrame({"x": range(10_000)})
+
+
+def entry_size(tmp_path) -> int:
+    cache = DiskCache(str(tmp_path / "probe"), max_bytes=10 ** 9)
+    cache.put("probe", DF)
+    return os.path.getsize(cache.path("probe"))
+
+
+def test_pin_of_a_refreshed_entry_counts_toward_the_budget(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache"), max_bytes=int(2.5 * entry_size(tmp_path)))
+    cache.put("a", DF)
+    pinned = cache.pin("a")
+    cache.put("a", DF)
+    os.utime(cache.path("a"), (time.time() - 60, time.time()))
+    # a, its pinned previous version and b do not fit
+    cache.put("b", DF)
+    assert os.path.exists(pinned)
+    assert not os.path.exists(cache.path("a"))
+    assert os.path.exists(cache.path("b"))
+
+    cache.unpin(pinned)
+    cache.put("a", DF)
+    assert os.path.exists(cache.path("a")) and os.path.exists(cache.path("b"))
+
+
+def test_pinned_entry_and_new_entry_are_not_evicted(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache"), max_bytes=int(1.5 * entry_size(tmp_path)))
+    cache.put("a", DF)
+    pinned = cache.pin("a")
+    os.utime(cache.path("a"), (time.time() - 60, time.time()))
+    # removing a would free nothing while it is pinned
+    cache.put("b", DF)
+    assert os.path.exists(cache.path("a"))
+    assert os.path.exists(cache.path("b"))
+
+    cache.unpin(pinned)
+    cache.put("b", DF)
+    assert not os.path.exists(cache.path("a"))
+    assert os.path.exists(cache.path("b"))
+
+
+def test_pins_of_dead_processes_are_reclaimed(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache"), max_bytes=int(1.5 * entry_size(tmp_path)))
+    cache.put("a", DF)
+    dead = os.path.join(os.path.dirname(cache.pin_directory), str(2 ** 22 + 1))
+    os.makedirs(dead)
+    os.link(cache.path("a"), os.path.join(dead, "a.parquet"))
+    cache.put("b", DF)
+    assert not os.path.exists(dead)
+    assert os.path.exists(cache.path("b"))
@@ -0,0 +1,96 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import pytest
+from google.api_core.exceptions import ServiceUnavailable
+from google.cloud import bigquery
+
+from aux_functions import settings
+from aux_functions.executor import QueryExecutor
+from benchmarks.fake_bigquery import FakeClient, FlakyClient
+
+QUERY = "SELECT * FROM `autotiming-prod.metrics.ad_tracker_history` ad WHERE ad.make_id = @selected_make_id"
+
+
+def job_config(make_id: int) -> bigquery.QueryJobConfig:
+    return bigquery.QueryJobConfig(
+        query_parameters=[bigquery.ScalarQueryParameter("selected_make_id", "INT64", make_id)]
+    )
+
+
+def run_concurrently(executor: QueryExecutor, client, make_ids: list) -> list:
+    # one thread per session, all asking at once
+    def run(make_id):
+        try:
+            return executor.run(client, QUERY, job_config(make_id))
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=len(make_ids)) as sessions:
+        return list(sessions.map(run, make_ids))
+
+
+@pytest.fixture(autouse=True)
+def no_retries():
+    with mock.patch.object(settings, "QUERY_RETRIES", 0):
+        yield
+
+
+def test_identical_requests_share_one_job():
+    client = FakeClient(n_rows=1_000, n_makes=2, latency=0.3)
+    executor = QueryExecutor(settings.MAX_CONCURRENT_QUERIES)
+
+    results = run_concurrently(executor, client, [1] * 16)
+
+    assert len(client.queries) == 1
+    assert all(df.equals(results[0]) for df in results)
+    assert results[0]["make_id"].unique().to_list() == [1]
+
+
+def test_concurrent_jobs_are_bounded():
+    client = FakeClient(n_rows=1_000, n_makes=12, latency=0.1)
+    executor = QueryExecutor(3)
+
+    results = run_concurrently(executor, client, list(range(1, 13)))
+
+    assert len(client.queries) == 12
+    assert client.max_in_flight == 3
+    assert [df["make_id"].unique().to_list() for df in results] == [[make_id] for make_id in range(1, 13)]
+
+
+def test_failure_reaches_every_waiter():
+    client = FlakyClient(n_rows=1_000, n_makes=2, latency=0.3, error_rate=1.0, stall_rate=0)
+    executor = QueryExecutor(settings.MAX_CONCURRENT_QUERIES)
+
+    results = run_concurrently(executor, client, [1] * 8)
+
+    assert len(client.queries) == 1
+    assert all(isinstance(result, ServiceUnavailable) for result in results)
+
+
+def test_failed_request_is_not_cached():
+    client = FlakyClient(n_rows=1_000, n_makes=2, latency=0.1, error_rate=0, stall_rate=0, script=["error"])
+    executor = QueryExecutor(settings.MAX_CONCURRENT_QUERIES)
+
+    with pytest.raises(ServiceUnavailable):
+        executor.run(client, QUERY, job_config(1))
+    df = executor.run(client, QUERY, job_config(1))
+
+    assert len(client.queries) == 2
+    assert df.height > 0
+    assert not executor._in_flight
+
+
+def test_requests_under_different_limits_are_not_shared():
+    client = FlakyClient(n_rows=1_000, n_makes=2, latency=0.3, error_rate=0, stall_rate=0)
+    executor = QueryExecutor(settings.MAX_CONCURRENT_QUERIES)
+
+    with mock.patch.multiple(settings, QUERY_TIMEOUT=60, MAX_BYTES_BILLED=10 * 1024 ** 3):
+        interactive = executor.submit(client, QUERY, job_config(1))
+        batch = executor.submit(client, QUERY, job_config(1), timeout=3600, max_bytes_billed=1024 ** 4)
+        same = executor.submit(client, QUERY, job_config(1))
+        interactive.result(), batch.result()
+
+    assert same is interactive and batch is not interactive
+    limits = sorted((int(c.job_timeout_ms), c.maximum_bytes_billed) for c in client.job_configs)
+    assert limits == [(60_000, 10 * 1024 ** 3), (3_600_000, 1024 ** 4)]
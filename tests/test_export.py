@@ -0,0 +1,28 @@
+import os
+import time
+import types
+
+import polars as pl
+
+from aux_functions.export import ExportManager
+from aux_functions.facets import FacetIndex
+from tests.test_filter_state import DATASET
+
+
+def dataset_entry() -> types.SimpleNamespace:
+    lf = DATASET.lazy()
+    fingerprint = FacetIndex.fingerprint(lf)
+    return types.SimpleNamespace(make_id=1, fingerprint=fingerprint, facets=FacetIndex(lf))
+
+
+def test_expired_exports_are_forgotten(tmp_path):
+    exports = ExportManager(str(tmp_path), max_concurrent=1, max_age=60)
+    dataset = dataset_entry()
+    old = exports.submit(dataset, ("Ibiza",), "rows", "csv").result()
+    assert pl.read_csv(old).height == 2
+    os.utime(old, (time.time(), time.time() - 120))
+
+    new = exports.submit(dataset, ("Leon",), "daily", "parquet").result()
+
+    assert not os.path.exists(old) and os.path.exists(new)
+    assert len(exports._jobs) == 1
@@ -0,0 +1,55 @@
+from unittest import mock
+
+import polars as pl
+from google.cloud import bigquery
+
+from aux_functions.fetch import Fetch
+from benchmarks.fake_bigquery import FakeClient, FakeRowIterator
+
+QUERY = "SELECT * FROM `autotiming-prod.metrics.ad_tracker_history` ad WHERE ad.make_id = @selected_make_id"
+
+
+def test_empty_result_keeps_its_columns():
+    client = FakeClient(n_rows=1_000, n_makes=2)
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[bigquery.ScalarQueryParameter("selected_make_id", "INT64", 99)]
+    )
+    # like the real RowIterator, a consumed iterator cannot be read again
+    consumed = ValueError("Iterator has already started")
+
+    with mock.patch.object(FakeRowIterator, "to_arrow", side_effect=consumed):
+        df = Fetch.query_to_polars(client, QUERY, job_config)
+
+    assert df.is_empty()
+    assert df.columns == client.dataset.column_names
+    assert df.schema["make"] == pl.Categorical(ordering="lexical")
+
+
+def test_empty_table_from_bigquery_schema():
+    schema = [
+        bigquery.SchemaField("day", "DATE"),
+        bigquery.SchemaField("make", "STRING"),
+        bigquery.SchemaField("price_sum", "INT64"),
+    ]
+
+    table = Fetch.empty_table(schema)
+
+    assert table.num_rows == 0
+    assert table.column_names == ["day", "make", "price_sum"]
+    assert str(table.schema.field("day").type) == "date32[day]"
+
+
+def test_empty_table_of_nested_fields_and_without_schema():
+    schema = [
+        bigquery.SchemaField("price_history", "RECORD", mode="REPEATED", fields=[
+            bigquery.SchemaField("d", "DATE"),
+            bigquery.SchemaField("p", "INTEGER"),
+        ]),
+        bigquery.SchemaField("location", "GEOGRAPHY"),
+    ]
+
+    table = Fetch.empty_table(schema)
+
+    assert str(table.schema.field("price_history").type) == "list<item: struct<d: date32[day], p: int64>>"
+    assert table.schema.field("location").type == "string"
+    assert Fetch.empty_table(None).num_columns == 0
@@ -0,0 +1,46 @@
+import datetime
+import os
+
+import polars as pl
+
+from aux_functions.disk_cache import DiskCache
+from aux_functions.facets import FacetIndex
+from aux_functions.filter_state import FilterState
+
+DATASET = pl.DataFrame({
+    "model": ["Ibiza", "Ibiza", "Leon"],
+    "km_range": ["0-10.000", "0-10.000", "10.000-50.000"],
+    "km_class_id": [1, 1, 2],
+    "year": [2020, 2020, 2018],
+    "hp_range": ["100-150", "100-150", "150-200"],
+    "hp_class_id": [2, 2, 3],
+    "transmission_type": ["Manual", "Manual", "Automático"],
+    "fuel_type": ["Gasolina", "Gasolina", "Diésel"],
+    "day": [datetime.date(2024, 1, 1), datetime.date(2024, 1, 2), datetime.date(2024, 1, 1)],
+    "price_sum": [30_000, 60_000, 25_000],
+    "ad_count": [2, 3, 1],
+})
+
+
+def facet_index(tmp_path) -> FacetIndex:
+    store = DiskCache(str(tmp_path / "cache"), max_bytes=10 ** 9)
+    lf = DATASET.lazy()
+    return FacetIndex(lf, store, 1, FacetIndex.fingerprint(lf))
+
+
+def series_files(facets: FacetIndex) -> list:
+    return [name for name in os.listdir(facets.store.directory) if name.startswith("series_")]
+
+
+def test_invalid_deep_link_writes_no_series(tmp_path):
+    facets = facet_index(tmp_path)
+    assert FilterState.restore(facets, ["Panda", "0-10.000", "2020"]) == {}
+    assert series_files(facets) == []
+
+
+def test_deep_link_persists_the_series_of_its_valid_prefix(tmp_path):
+    facets = facet_index(tmp_path)
+    restored = FilterState.restore(facets, ["Ibiza", "0-10.000", "1999"])
+    assert restored == {"model_selected": "Ibiza", "km_range_selected": "0-10.000"}
+    assert len(series_files(facets)) == 1
+    assert facets.daily_average(["Ibiza", "0-10.000"])["price"].to_list() == [15_000, 20_000]
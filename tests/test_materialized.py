@@ -0,0 +1,56 @@
+from unittest import mock
+
+import pytest
+from google.api_core.exceptions import Forbidden, NotFound
+
+from aux_functions import settings
+from aux_functions.materialized import Materialized
+from aux_functions.queries import Queries
+from benchmarks.fake_bigquery import FakeClient
+
+TABLE = "autotiming-prod.metrics.make_daily_prices"
+
+
+@pytest.fixture(autouse=True)
+def fresh_check():
+    Materialized.is_fresh.clear()
+    yield
+    Materialized.is_fresh.clear()
+
+
+@pytest.mark.parametrize("error", [NotFound("missing"), Forbidden("denied"), ConnectionError("reset"), TimeoutError()])
+def test_unreadable_table_routes_to_raw_tables(error):
+    client = FakeClient(n_rows=1_000, n_makes=2)
+    client.get_table = mock.Mock(side_effect=error)
+
+    with mock.patch.object(settings, "MATERIALIZED_TABLE", TABLE):
+        df = Queries.query_dataset_by_make(client, 1)
+
+    assert df.height > 0
+    assert "ad_tracker_history" in client.queries[-1][0]
+
+
+def test_routing_is_opt_in():
+    client = FakeClient(n_rows=1_000, n_makes=2)
+    client.get_table = mock.Mock()
+
+    with mock.patch.object(settings, "MATERIALIZED_TABLE", ""):
+        assert not Materialized.route(client, "query_dataset_by_make")
+    client.get_table.assert_not_called()
+
+
+def test_stale_table_is_read_when_the_backend_has_no_raw_table():
+    from benchmarks.duckdb_bigquery import raw_tables
+    from aux_functions.local_backend import DuckDBClient
+
+    client = DuckDBClient(raw_tables(2_000, n_makes=2))
+    with mock.patch.multiple(settings, MATERIALIZED_TABLE=TABLE, MATERIALIZED_MAX_AGE=-1):
+        Materialized.refresh(client, incremental=False)
+        assert not Materialized.route(client, "query_dataset_by_make")
+
+        # a local copy synced without the raw table
+        client.connection.execute('DROP TABLE "ad_tracker_history"')
+        del client.modified["ad_tracker_history"]
+        Materialized.is_fresh.clear()
+        assert Materialized.route(client, "query_dataset_by_make")
+        assert Queries.query_dataset_by_make(client, 1).height > 0
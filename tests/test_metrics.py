@@ -0,0 +1,44 @@
+import multiprocessing
+import os
+from unittest import mock
+
+from aux_functions import settings
+from aux_functions.metrics import Metrics
+
+
+def count_and_export(calls: int, exported, done) -> None:
+    metrics = Metrics()
+    metrics.count("autotiming_query_calls_total", calls, method="get_all_makes")
+    metrics.export()
+    exported.release()
+    # the files of processes that are gone are removed by the next export
+    done.wait()
+
+
+def test_every_process_exports_its_own_counters(tmp_path):
+    metrics_file = str(tmp_path / "autotiming.prom")
+    with mock.patch.multiple(settings, METRICS_FILE=metrics_file, METRICS_EXPORT_INTERVAL=0):
+        # left behind by a process that is gone
+        dead = Metrics.process_file(2 ** 22 + 1)
+        open(dead, "w").close()
+
+        context = multiprocessing.get_context("fork")
+        exported, done = context.Semaphore(0), context.Event()
+        processes = {
+            calls: context.Process(target=count_and_export, args=(calls, exported, done), daemon=True) for calls in [3, 5]
+        }
+        for process in processes.values():
+            process.start()
+        for _ in processes:
+            assert exported.acquire(timeout=30)
+
+        for calls, process in processes.items():
+            with open(Metrics.process_file(process.pid)) as f:
+                text = f.read()
+            assert f'autotiming_query_calls_total{{pid="{process.pid}",method="get_all_makes"}} {calls}' in text
+        assert not os.path.exists(dead)
+        done.set()
+        for process in processes.values():
+            process.join()
+            assert process.exitcode == 0
+        assert not os.path.exists(metrics_file)
@@ -0,0 +1,142 @@
+import concurrent.futures
+import os
+import time
+from unittest import mock
+
+import pytest
+import requests
+from google.api_core.exceptions import BadRequest, ServiceUnavailable
+
+from aux_functions import settings
+from aux_functions.disk_cache import DiskCache
+from aux_functions.fetch import Fetch
+from aux_functions.metrics import Metrics
+from aux_functions.queries import Queries
+from aux_functions.registry import DatasetRegistry
+from aux_functions.resilience import Resilience
+from benchmarks.fake_bigquery import FakeClient, FlakyClient
+
+QUERY = "SELECT * FROM `autotiming-prod.metrics.ad_tracker_history` ad WHERE ad.make_id = 1"
+
+
+def counter(name: str, **labels) -> float:
+    return Metrics.get_instance().counters[Metrics._key(name, labels)]
+
+
+@pytest.fixture(autouse=True)
+def fast_retries():
+    with mock.patch.multiple(settings, QUERY_RETRIES=3, RETRY_BASE_DELAY=0.01, RETRY_MAX_DELAY=0.05,
+                             QUERY_TIMEOUT=60, MAX_BYTES_BILLED=50 * 1024 ** 3):
+        yield
+
+
+def test_transient_errors_are_retried():
+    client = FlakyClient(n_rows=1_000, n_makes=2, error_rate=0, stall_rate=0, script=["error", "error"])
+    retries = counter("autotiming_query_retries_total", error="ServiceUnavailable")
+
+    df = Fetch.query_to_polars(client, QUERY)
+
+    assert df.height == client.dataset.num_rows
+    assert len(client.queries) == 3
+    assert counter("autotiming_query_retries_total", error="ServiceUnavailable") == retries + 2
+
+
+def test_retries_are_bounded():
+    client = FlakyClient(n_rows=1_000, n_makes=2, error_rate=1.0, stall_rate=0)
+
+    with pytest.raises(ServiceUnavailable):
+        Fetch.query_to_polars(client, QUERY)
+    assert len(client.queries) == settings.QUERY_RETRIES + 1
+
+
+@pytest.mark.parametrize("error", [requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError])
+def test_dropped_connections_are_retried(error):
+    calls = []
+
+    def dropped_once(timeout=None):
+        calls.append(timeout)
+        if len(calls) == 1:
+            raise error("Connection aborted.")
+        return "rows"
+
+    assert Resilience.call(dropped_once) == "rows"
+    assert len(calls) == 2
+
+
+def test_other_errors_are_not_retried():
+    calls = []
+
+    def over_cost_cap(timeout=None):
+        calls.append(timeout)
+        raise BadRequest("Query exceeded limit for bytes billed")
+
+    with pytest.raises(BadRequest):
+        Resilience.call(over_cost_cap)
+    assert len(calls) == 1
+
+
+def test_stalled_job_is_cancelled_and_not_retried():
+    client = FlakyClient(n_rows=1_000, n_makes=2, error_rate=0, stall_rate=0, stall=5.0, script=["stall"])
+
+    start = time.perf_counter()
+    with pytest.raises(concurrent.futures.TimeoutError):
+        Fetch.query_to_polars(client, QUERY, timeout=0.2)
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < 1.0
+    assert len(client.queries) == 1
+    assert client.cancelled == 1
+
+
+def test_deadline_bounds_retries():
+    # every job fails slowly: without a total deadline four attempts take 1.2 s
+    client = FlakyClient(n_rows=1_000, n_makes=2, latency=0.3, error_rate=1.0, stall_rate=0)
+
+    start = time.perf_counter()
+    with pytest.raises(ServiceUnavailable):
+        Fetch.query_to_polars(client, QUERY, timeout=0.5)
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < 0.75
+    assert len(client.queries) < settings.QUERY_RETRIES + 1
+
+
+def test_interactive_limits_apply_to_every_job():
+    client = FlakyClient(n_rows=1_000, n_makes=2, error_rate=0, stall_rate=0)
+
+    Fetch.query_to_polars(client, QUERY)
+
+    job_config = client.job_configs[0]
+    assert int(job_config.job_timeout_ms) == settings.QUERY_TIMEOUT * 1000
+    assert job_config.maximum_bytes_billed == settings.MAX_BYTES_BILLED
+
+
+def test_batch_jobs_have_their_own_limits():
+    client = FlakyClient(n_rows=1_000, n_makes=2, error_rate=0, stall_rate=0, stall=0.3, script=["stall"])
+
+    with mock.patch.multiple(settings, QUERY_TIMEOUT=0.1, BATCH_QUERY_TIMEOUT=0, BATCH_MAX_BYTES_BILLED=0):
+        df = Queries.query_all_dataset(client, batch=True)
+
+    assert df.height == client.dataset.num_rows
+    assert client.job_configs[0].job_timeout_ms is None
+    assert client.job_configs[0].maximum_bytes_billed is None
+    assert client.cancelled == 0
+
+
+def test_expired_dataset_is_served_while_refresh_fails():
+    disk_cache = DiskCache.get_instance()
+    path = disk_cache.path(DiskCache.dataset_key(1))
+    Queries.load_dataset_by_make(FakeClient(n_rows=1_000, n_makes=2), 1)
+    expired = time.time() - settings.DATASET_TTL - 60
+    os.utime(path, (time.time(), expired))
+
+    client = FlakyClient(n_rows=1_000, n_makes=2, latency=0.5, error_rate=1.0, stall_rate=0)
+    registry = DatasetRegistry(settings.REGISTRY_MAX_BYTES, settings.SESSION_TIMEOUT)
+    start = time.perf_counter()
+    entry = registry.acquire("session", client, 1)
+    assert time.perf_counter() - start < 0.5
+
+    while registry._revalidating:
+        time.sleep(0.01)
+    assert len(client.queries) == settings.QUERY_RETRIES + 1
+    assert registry._entries[1] is entry
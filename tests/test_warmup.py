@@ -0,0 +1,31 @@
+import multiprocessing
+
+from aux_functions.warmup import Warmup
+
+PROCESSES = 4
+FLUSHES = 50
+
+
+def select_and_flush(make_id: int) -> None:
+    warmup = Warmup(client=None)
+    for _ in range(FLUSHES):
+        warmup.record_access(make_id)
+        warmup.record_access(0)
+        warmup._flush_access_stats()
+
+
+def test_concurrent_processes_keep_every_access():
+    before = Warmup(client=None)._flush_access_stats()
+
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=select_and_flush, args=(make_id,)) for make_id in range(1, PROCESSES + 1)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    stats = Warmup(client=None)._flush_access_stats()
+    assert stats[0] - before[0] == PROCESSES * FLUSHES
+    for make_id in range(1, PROCESSES + 1):
+        assert stats[make_id] - before[make_id] == FLUSHES